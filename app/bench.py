@@ -0,0 +1,310 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from .player import NullBackend, benchmark_backend, play_recording
+from .rec_format import RecordingWriter, iter_events, write_json_events
+from .sequence_modes import run_conditionals
+from .simulate import SyntheticFrames, simulate
+from .vision import Frame, grab_frame, match_template, template_store
+
+# Reproducible benchmarks for the hot paths, run entirely on synthetic frames
+# (no display). Every case is timed `repeat` times after one warm-up run and
+# reported in milliseconds; results are written as JSON so runs can be
+# compared over time (see compare()).
+
+RESOLUTIONS = {"1080p": (1920, 1080), "4k": (3840, 2160), "triple": (5760, 1080)}
+TEMPLATE_SIZES = (32, 64, 128)
+PREPROCESS = ("none", "canny", "threshold")
+MULTI_SCALE = (False, True, "pyramid")
+SUITES = ("preprocess", "match", "capture", "conditionals", "playback")
+
+
+def _texture(rng: np.random.Generator, w: int, h: int) -> np.ndarray:
+    # UI-like content: overlapping flat rectangles with hard edges, which all
+    # preprocess modes (blur, Canny, Otsu threshold) keep stable under cropping
+    img = np.empty((h, w, 3), dtype=np.uint8)
+    img[:] = rng.integers(0, 256, 3, dtype=np.uint8)
+    for _ in range(max(8, w * h // 3000)):
+        x, y = int(rng.integers(0, w)), int(rng.integers(0, h))
+        rw, rh = int(rng.integers(4, max(5, w // 6))), int(rng.integers(4, max(5, h // 6)))
+        img[y:y + rh, x:x + rw] = rng.integers(0, 256, 3, dtype=np.uint8)
+    return img
+
+
+def _time(fn: Callable[[], object], repeat: int) -> Dict:
+    fn()  # warm-up: template loads, thread pool start, lazy buffers
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return {
+        "repeat": repeat,
+        "mean_ms": statistics.fmean(samples),
+        "median_ms": statistics.median(samples),
+        "min_ms": min(samples),
+        "max_ms": max(samples),
+        "stdev_ms": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+
+class _Fixtures:
+    # Screens and template files, generated once per run with a fixed seed.
+    # Like ROI-captured templates, each template is a crop of a "panel" that
+    # is pasted into every screen, so all preprocess modes find it.
+    PANEL = 192
+
+    def __init__(self, workdir: str, seed: int = 0):
+        self.workdir = workdir
+        self.rng = np.random.default_rng(seed)
+        self.panel = _texture(self.rng, self.PANEL, self.PANEL)
+        self._screens: Dict[str, np.ndarray] = {}
+        self._templates: Dict[int, str] = {}
+
+    def template(self, size: int) -> str:
+        path = self._templates.get(size)
+        if path is None:
+            path = os.path.join(self.workdir, f"tpl_{size}.png")
+            o = (self.PANEL - size) // 2
+            cv2.imwrite(path, self.panel[o:o + size, o:o + size])
+            self._templates[size] = path
+        return path
+
+    def screen(self, resolution: str) -> np.ndarray:
+        img = self._screens.get(resolution)
+        if img is None:
+            w, h = RESOLUTIONS[resolution]
+            img = _texture(self.rng, w, h)
+            x, y = (w - self.PANEL) * 2 // 3, (h - self.PANEL) // 2
+            img[y:y + self.PANEL, x:x + self.PANEL] = self.panel
+            self._screens[resolution] = img
+        return img
+
+
+def bench_preprocess(fx: _Fixtures, repeat: int, quick: bool) -> List[Dict]:
+    out = []
+    for res in (("1080p",) if quick else RESOLUTIONS):
+        screen = fx.screen(res)
+        for mode in PREPROCESS:
+            # a fresh Frame each time so gray conversion and preprocessing are measured
+            stats = _time(lambda: Frame(screen).preprocessed(mode), repeat)
+            out.append({"suite": "preprocess", "case": {"resolution": res, "preprocess": mode}, **stats})
+    return out
+
+
+def bench_match(fx: _Fixtures, repeat: int, quick: bool) -> List[Dict]:
+    out = []
+    for res in (("1080p",) if quick else RESOLUTIONS):
+        screen = fx.screen(res)
+        for size in ((64,) if quick else TEMPLATE_SIZES):
+            path = fx.template(size)
+            for mode in PREPROCESS:
+                frame = Frame(screen)
+                frame.preprocessed(mode)  # shared by all matches on a frame, timed in bench_preprocess
+                for ms in MULTI_SCALE:
+                    found = []
+
+                    def run():
+                        found[:] = [match_template(frame, path, threshold=0.8, preprocess=mode, multi_scale=ms)]
+
+                    stats = _time(run, repeat)
+                    out.append({
+                        "suite": "match",
+                        "case": {"resolution": res, "template": size, "preprocess": mode, "multi_scale": ms},
+                        "found": bool(found[0]),
+                        "score": round(found[0]["score"], 4) if found[0] else None,
+                        **stats,
+                    })
+    return out
+
+
+def bench_capture(fx: _Fixtures, repeat: int, quick: bool) -> List[Dict]:
+    # Overhead of the capture path (session lookup, region crop, copy, Frame)
+    # on top of whatever the real grab costs; measured against SyntheticFrames.
+    out = []
+    for res in (("1080p",) if quick else RESOLUTIONS):
+        w, h = RESOLUTIONS[res]
+        frames = SyntheticFrames((w, h), [{"image": fx.screen(res), "x": 0, "y": 0}], noise=0)
+        with simulate(frames, NullBackend()):
+            for region in (None, [w // 4, h // 4, w // 2, h // 2]):
+                stats = _time(lambda: grab_frame(region).gray, repeat)
+                out.append({"suite": "capture", "case": {"resolution": res, "region": "full" if region is None else "quarter"}, **stats})
+    return out
+
+
+def bench_conditionals(fx: _Fixtures, repeat: int, quick: bool) -> List[Dict]:
+    out = []
+    w, h = RESOLUTIONS["1080p"]
+    for n in ((5, 20) if quick else (5, 20, 50)):
+        # n distinct 48px templates on a 1080p screen, one of them visible
+        paths = []
+        for i in range(n):
+            p = os.path.join(fx.workdir, f"cond_{n}_{i}.png")
+            cv2.imwrite(p, _texture(fx.rng, 48, 48))
+            paths.append(p)
+        cond = os.path.join(fx.workdir, f"cond_{n}.json")
+        with open(cond, 'w', encoding='utf-8') as f:
+            json.dump({"items": [{"template": p, "action": "click", "priority": i} for i, p in enumerate(paths)]}, f)
+        frames = SyntheticFrames((w, h), [{"image": paths[n // 2], "x": w // 2, "y": h // 2}])
+        for strategy in ("exhaustive", "priority_first"):
+            with simulate(frames, NullBackend()):
+                stats = _time(lambda: run_conditionals(cond, strategy=strategy), repeat)
+            out.append({"suite": "conditionals", "case": {"items": n, "strategy": strategy}, **stats})
+    return out
+
+
+def bench_playback(fx: _Fixtures, repeat: int, quick: bool) -> List[Dict]:
+    # Unthrottled playback into the null backend: pure parse + schedule +
+    # dispatch cost per event, for both recording formats.
+    out = []
+    n = 10000 if quick else 100000
+    events = []
+    for i in range(n):
+        events.append({"type": "move", "x": i % 1920, "y": (i * 7) % 1080, "t": i * 0.004})
+        if i % 100 == 99:
+            events.append({"type": "click", "x": 10, "y": 10, "button": "Button.left", "pressed": False, "t": i * 0.004})
+    js = os.path.join(fx.workdir, "playback.json")
+    rec = os.path.join(fx.workdir, "playback.rec")
+    write_json_events(js, events)
+    with RecordingWriter(rec) as wr:
+        for ev in events:
+            wr.write(ev)
+    for path in (js, rec):
+        fmt = os.path.splitext(path)[1][1:]
+        stats = _time(lambda: sum(1 for _ in iter_events(path)), repeat)
+        out.append({"suite": "playback", "case": {"stage": "parse", "format": fmt, "events": len(events)},
+                    "events_per_sec": len(events) / (stats["median_ms"] / 1000.0), **stats})
+        stats = _time(lambda: play_recording(path, unthrottled=True, min_spacing=0.0, backend=NullBackend()), repeat)
+        out.append({"suite": "playback", "case": {"stage": "play", "format": fmt, "events": len(events)},
+                    "events_per_sec": len(events) / (stats["median_ms"] / 1000.0), **stats})
+    r = benchmark_backend(NullBackend(), n)
+    out.append({"suite": "playback", "case": {"stage": "dispatch", "backend": "null", "events": n},
+                "events_per_sec": r["events_per_sec"]})
+    return out
+
+
+_SUITES = {
+    "preprocess": bench_preprocess,
+    "match": bench_match,
+    "capture": bench_capture,
+    "conditionals": bench_conditionals,
+    "playback": bench_playback,
+}
+
+
+def _environment() -> Dict:
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    try:
+        env["commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        env["commit"] = None
+    return env
+
+
+def run_benchmarks(suites: Optional[Sequence[str]] = None, repeat: int = 5, quick: bool = False,
+                   out_path: Optional[str] = None, seed: int = 0, progress: bool = False) -> Dict:
+    # Runs the selected suites (default: all) and returns
+    # {"environment": ..., "settings": ..., "results": [...]}; also written to out_path.
+    suites = list(suites or SUITES)
+    for s in suites:
+        if s not in _SUITES:
+            raise ValueError(f"Unknown benchmark suite: {s}")
+    results: List[Dict] = []
+    with tempfile.TemporaryDirectory(prefix="pco-bench-") as workdir:
+        fx = _Fixtures(workdir, seed)
+        for s in suites:
+            t0 = time.perf_counter()
+            rows = _SUITES[s](fx, repeat, quick)
+            results.extend(rows)
+            if progress:
+                print(f"{s}: {len(rows)} cases in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+        template_store.invalidate()  # drop the temporary templates
+    report = {
+        "environment": _environment(),
+        "settings": {"suites": suites, "repeat": repeat, "quick": quick, "seed": seed},
+        "results": results,
+    }
+    if out_path:
+        with open(out_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def _case_key(row: Dict) -> str:
+    return row["suite"] + ":" + json.dumps(row["case"], sort_keys=True)
+
+
+def compare(baseline_path: str, current_path: str, tolerance: float = 0.10) -> List[Dict]:
+    # Median-to-median change per case; regressed is True when the current
+    # run is more than `tolerance` (fraction) slower than the baseline.
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        base = {_case_key(r): r for r in json.load(f)["results"] if "median_ms" in r}
+    with open(current_path, 'r', encoding='utf-8') as f:
+        cur = [r for r in json.load(f)["results"] if "median_ms" in r]
+    rows = []
+    for r in cur:
+        b = base.get(_case_key(r))
+        if b is None or b["median_ms"] <= 0:
+            continue
+        change = r["median_ms"] / b["median_ms"] - 1.0
+        rows.append({"suite": r["suite"], "case": r["case"], "baseline_ms": b["median_ms"],
+                     "current_ms": r["median_ms"], "change": change, "regressed": change > tolerance})
+    return rows
+
+
+def _print_table(results: List[Dict]):
+    for r in results:
+        case = " ".join(f"{k}={v}" for k, v in r["case"].items())
+        if "median_ms" in r:
+            extra = f"  {r['events_per_sec']:,.0f} ev/s" if "events_per_sec" in r else ""
+            print(f"{r['suite']:<13}{case:<64}{r['median_ms']:>10.3f} ms{extra}")
+        else:
+            print(f"{r['suite']:<13}{case:<64}{r['events_per_sec']:>13,.0f} ev/s")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m app.bench", description="Benchmark matching, capture and playback on synthetic data")
+    ap.add_argument("--suite", action="append", choices=SUITES, help="suite to run (repeatable; default all)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--quick", action="store_true", help="1080p only, fewer sizes; for smoke runs")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="write JSON results here")
+    ap.add_argument("--compare", metavar="BASELINE", help="compare against a previous --out file")
+    ap.add_argument("--tolerance", type=float, default=0.10)
+    args = ap.parse_args(argv)
+    report = run_benchmarks(args.suite, args.repeat, args.quick, args.out, args.seed, progress=True)
+    _print_table(report["results"])
+    if args.compare:
+        if not args.out:
+            ap.error("--compare needs --out")
+        regressed = [r for r in compare(args.compare, args.out, args.tolerance) if r["regressed"]]
+        for r in regressed:
+            print(f"REGRESSION {r['suite']} {r['case']}: {r['baseline_ms']:.3f} -> {r['current_ms']:.3f} ms ({r['change']:+.0%})")
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import argparse
+import importlib
+import json
+import sys
+import time
+from typing import List, Optional, Sequence
+
+# Headless entry point (python main.py <command> ..., python -m app <command> ...).
+# This module only imports the standard library; every command imports what
+# it needs when it runs, so `play` never loads OpenCV, `run-seq` never loads
+# pynput and nothing loads PyQt5. The time spent importing is reported on
+# stderr (use python -X importtime for a per-module breakdown).
+
+HEAVY = ("numpy", "cv2", "mss", "pyautogui", "pynput", "Xlib", "PyQt5")
+
+
+class _Imports:
+    def __init__(self):
+        self.seconds = 0.0
+        self.modules: List[str] = []
+
+    def load(self, name: str):
+        t0 = time.perf_counter()
+        mod = importlib.import_module(name, __package__)
+        self.seconds += time.perf_counter() - t0
+        self.modules.append(name)
+        return mod
+
+    def report(self) -> str:
+        heavy = [m for m in HEAVY if m in sys.modules]
+        return (f"[cli] imports {self.seconds * 1000:.1f} ms ({', '.join(self.modules)}); "
+                f"loaded: {', '.join(heavy) or 'no heavy modules'}")
+
+
+def _print_json(obj):
+    print(json.dumps(obj, ensure_ascii=False, indent=2, default=str))
+
+
+def _move_filter(imports: _Imports, args):
+    if not (args.min_interval or args.min_distance or args.epsilon):
+        return None
+    mf = imports.load(".move_filter")
+    return mf.MoveCompressor(min_interval=args.min_interval, min_distance=args.min_distance, epsilon=args.epsilon)
+
+
+def cmd_record(args, imports: _Imports) -> int:
+    rec_format = imports.load(".rec_format")
+    recorder = imports.load(".recorder")
+    _report(args, imports)
+    stream = args.out if args.out.lower().endswith(rec_format.REC_EXT) else None
+    rec = recorder.Recorder(stream_to=stream, move_filter=_move_filter(imports, args))
+    rec.start()
+    print(f"recording to {args.out}; Ctrl+C to stop" + (f" (or after {args.duration:g}s)" if args.duration else ""),
+          file=sys.stderr)
+    try:
+        deadline = time.monotonic() + args.duration if args.duration else None
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        rec.stop()
+        rec.save(args.out)
+    _print_json(rec.stats())
+    return 0
+
+
+def cmd_play(args, imports: _Imports) -> int:
+    player = imports.load(".player")
+    _report(args, imports)
+    stats = player.play_recording(
+        args.file, loop=args.loop, interval=args.interval, scheduler=args.scheduler, catch_up=args.catch_up,
+        speed=args.speed, max_gap=args.max_gap, unthrottled=args.unthrottled, backend=args.backend)
+    _print_json(stats)
+    return 0
+
+
+def cmd_run_seq(args, imports: _Imports) -> int:
+    sm = imports.load(".sequence_modes")
+    _report(args, imports)
+    if args.use_async:
+        import asyncio
+        results = asyncio.run(sm.run_sequence_async(args.file, args.threshold, backend=args.backend))
+    else:
+        results = sm.run_sequence(args.file, args.threshold, backend=args.backend)
+    _print_json(results)
+    return 0
+
+
+def cmd_run_cond(args, imports: _Imports) -> int:
+    sm = imports.load(".sequence_modes")
+    _report(args, imports)
+    if not args.watch:
+        _print_json(sm.run_conditionals(args.file, args.threshold, strategy=args.strategy, backend=args.backend))
+        return 0
+    import signal
+    import threading
+    stop = threading.Event()
+    # Ctrl+C ends the loop after the current tick and still prints the statistics
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    _print_json(sm.watch_conditionals(
+        args.file, args.threshold, tick_rate=args.tick_rate, budget=args.budget, cooldown=args.cooldown,
+        max_ticks=args.max_ticks, duration=args.duration, max_actions=args.max_actions, until=args.until,
+        backend=args.backend, stop=stop))
+    return 0
+
+
+def cmd_export(args, imports: _Imports) -> int:
+    io_utils = imports.load(".io_utils")
+    _report(args, imports)
+    io_utils.export_project(args.out, files=args.files, resource_dirs=args.resources)
+    print(args.out)
+    return 0
+
+
+def cmd_import(args, imports: _Imports) -> int:
+    io_utils = imports.load(".io_utils")
+    _report(args, imports)
+    io_utils.import_project(args.zip, args.dest)
+    print(args.dest)
+    return 0
+
+
+def cmd_bench(args, imports: _Imports) -> int:
+    bench = imports.load(".bench")
+    _report(args, imports)
+    return bench.main(args.bench_args)
+
+
+def _report(args, imports: _Imports):
+    if not args.quiet:
+        print(imports.report(), file=sys.stderr)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="python main.py", description="Headless commands (no arguments starts the GUI)")
+    ap.add_argument("-q", "--quiet", action="store_true", help="do not report import time")
+    ap.add_argument("--trace", metavar="JSONL", help="write step traces to this file")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("record", help="record mouse/keyboard input until Ctrl+C")
+    p.add_argument("out", help="output file (.rec streams while recording, anything else is saved as JSON)")
+    p.add_argument("--duration", type=float, default=0.0, help="stop after this many seconds")
+    p.add_argument("--min-interval", type=float, default=0.0, help="move filter: min seconds between moves")
+    p.add_argument("--min-distance", type=float, default=0.0, help="move filter: min pixels between moves")
+    p.add_argument("--epsilon", type=float, default=0.0, help="move filter: path simplification tolerance (px)")
+    p.set_defaults(fn=cmd_record)
+
+    p = sub.add_parser("play", help="play back a recording (.json or .rec)")
+    p.add_argument("file")
+    p.add_argument("--loop", type=int, default=1)
+    p.add_argument("--interval", type=float, default=1.0, help="seconds between loops")
+    p.add_argument("--scheduler", choices=("precise", "legacy"), default="precise")
+    p.add_argument("--catch-up", choices=("replay_all", "drop_moves"), default="replay_all")
+    p.add_argument("--speed", type=float, default=1.0)
+    p.add_argument("--max-gap", type=float, default=None, help="compress idle gaps longer than this (s)")
+    p.add_argument("--unthrottled", action="store_true", help="ignore timestamps, keep only event order")
+    p.add_argument("--backend", default=None, help="input backend: pyautogui, xtest, null, recording")
+    p.set_defaults(fn=cmd_play)
+
+    p = sub.add_parser("run-seq", help="run a sequence (.json or .plan) once")
+    p.add_argument("file")
+    p.add_argument("--threshold", type=float, default=0.85)
+    p.add_argument("--backend", default=None)
+    p.add_argument("--async", dest="use_async", action="store_true",
+                   help="pre-match the next step while the current action runs")
+    p.set_defaults(fn=cmd_run_seq)
+
+    p = sub.add_parser("run-cond", help="run one conditionals decision, or keep watching with --watch")
+    p.add_argument("file")
+    p.add_argument("--threshold", type=float, default=0.85)
+    p.add_argument("--strategy", choices=("exhaustive", "priority_first"), default="exhaustive")
+    p.add_argument("--backend", default=None)
+    p.add_argument("--watch", action="store_true", help="decide every tick until a stop condition (Ctrl+C)")
+    p.add_argument("--tick-rate", type=float, default=5.0, help="target ticks per second (0 = as fast as possible)")
+    p.add_argument("--budget", type=float, default=None, help="seconds of capture+matching per tick "
+                   "before lower priorities are skipped (default 80%% of the tick period)")
+    p.add_argument("--cooldown", type=float, default=1.0, help="seconds an item rests after firing")
+    p.add_argument("--max-ticks", type=int, default=None)
+    p.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    p.add_argument("--max-actions", type=int, default=None)
+    p.add_argument("--until", metavar="TEMPLATE", help="stop once this template is on screen")
+    p.set_defaults(fn=cmd_run_cond)
+
+    p = sub.add_parser("export", help="zip recordings, sequences, conditionals and templates")
+    p.add_argument("out", help="output .zip")
+    p.add_argument("--files", nargs="*", default=["operations.json", "sequences.json", "conditionals.json"])
+    p.add_argument("--resources", nargs="*", default=["resources"])
+    p.set_defaults(fn=cmd_export)
+
+    p = sub.add_parser("import", help="unpack an exported zip")
+    p.add_argument("zip")
+    p.add_argument("dest")
+    p.set_defaults(fn=cmd_import)
+
+    # everything after "bench" goes to app.bench's own parser (see main)
+    p = sub.add_parser("bench", help="run app.bench (arguments are passed through)", add_help=False)
+    p.set_defaults(fn=cmd_bench)
+    return ap
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command == "bench":
+        args.bench_args = extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    imports = _Imports()
+    try:
+        if args.trace:
+            from . import trace
+            with trace.tracing(trace.JsonlSink(args.trace)):
+                return args.fn(args, imports)
+        return args.fn(args, imports)
+    except Exception as e:
+        if not isinstance(e, _expected_errors()):
+            raise
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+
+def _expected_errors() -> tuple:
+    # Reported as "error: ..." with exit code 1. mss is imported only by the
+    # commands that capture, so its error type is looked up once it is loaded.
+    errors = (OSError, ValueError, RuntimeError)
+    mss_errors = sys.modules.get("mss.exception")
+    return errors + (mss_errors.ScreenShotError,) if mss_errors is not None else errors
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,12 +3,18 @@ import json
 import traceback
 import threading
 import os
+import time
 from PyQt5 import QtWidgets, QtCore, QtGui
-from .vision import select_roi_and_save
-from .sequence_modes import add_sequence_step, run_sequence, add_conditional_item, run_conditionals, save_sequence
+from .vision import select_roi_and_save, get_capture_session, template_store
+from .sequence_modes import (add_sequence_step, run_sequence_async, run_until_stopped, add_conditional_item,
+                             run_conditionals, save_sequence, watch_conditionals)
 from .player import play_recording
 from .recorder import Recorder
 from .io_utils import export_project, import_project
+from .plan import PLAN_EXT, compile_plan, is_plan, open_plan
+from .rec_format import REC_EXT
+from .move_filter import MoveCompressor, compress_recording
+from . import trace
 from pynput import keyboard
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -86,6 +92,19 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.tabs = QtWidgets.QTabWidget()
         vbox.addWidget(self.tabs)
+
+        # Step tracing (off by default: no overhead)
+        hb_trace = QtWidgets.QHBoxLayout()
+        self.trace_enable = QtWidgets.QCheckBox('步骤追踪')
+        self.trace_enable.setToolTip('每步打印截图/预处理/匹配/动作耗时，任务完成后列出最慢的步骤')
+        self.trace_out = QtWidgets.QLineEdit()
+        self.trace_out.setPlaceholderText('可选: 追踪输出 JSONL 文件')
+        hb_trace.addWidget(self.trace_enable)
+        hb_trace.addWidget(self.trace_out, 1)
+        vbox.addLayout(hb_trace)
+        self._trace_sinks = []
+        self._trace_ring = None
+        self.trace_enable.toggled.connect(self._toggle_trace)
         self.console = QtWidgets.QTextEdit()
         self.console.setReadOnly(True)
         self.console.setStyleSheet("font-family: Consolas, Monaco, monospace; font-size: 12px;")
@@ -149,8 +168,61 @@ class MainWindow(QtWidgets.QMainWindow):
         self.play_interval.setValue(1.0)
         grid.addWidget(self.play_interval, 4, 1)
 
+        grid.addWidget(QtWidgets.QLabel('回放调度:'), 5, 0)
+        self.play_scheduler = QtWidgets.QComboBox()
+        self.play_scheduler.addItem('高精度 (perf_counter + 自旋)', 'precise')
+        self.play_scheduler.addItem('旧版 (time.sleep)', 'legacy')
+        grid.addWidget(self.play_scheduler, 5, 1)
+        self.play_catch_up = QtWidgets.QComboBox()
+        self.play_catch_up.addItem('落后时全部回放', 'replay_all')
+        self.play_catch_up.addItem('落后时丢弃过期移动', 'drop_moves')
+        grid.addWidget(self.play_catch_up, 5, 2)
+
+        grid.addWidget(QtWidgets.QLabel('回放倍速:'), 10, 0)
+        self.play_speed = QtWidgets.QDoubleSpinBox()
+        self.play_speed.setRange(0.1, 100.0)
+        self.play_speed.setSingleStep(0.5)
+        self.play_speed.setValue(1.0)
+        grid.addWidget(self.play_speed, 10, 1)
+        self.play_unthrottled = QtWidgets.QCheckBox('不限速(仅保持顺序)')
+        self.play_unthrottled.setToolTip('忽略时间戳，移动连续发送；点击/按键前后保留最小间隔')
+        grid.addWidget(self.play_unthrottled, 10, 2)
+        grid.addWidget(QtWidgets.QLabel('空闲间隔上限(s):'), 11, 0)
+        self.play_max_gap = QtWidgets.QDoubleSpinBox()
+        self.play_max_gap.setRange(0.0, 600.0)
+        self.play_max_gap.setSingleStep(0.5)
+        self.play_max_gap.setValue(0.0)
+        self.play_max_gap.setToolTip('录制中超过该时长的空闲被压缩到该值，0 = 不压缩')
+        grid.addWidget(self.play_max_gap, 11, 1)
+        self.play_backend = QtWidgets.QComboBox()
+        self.play_backend.addItem('输入: PyAutoGUI', 'pyautogui')
+        self.play_backend.addItem('输入: XTest 批量 (Linux/X11)', 'xtest')
+        self.play_backend.addItem('输入: 空 (仅计时)', 'null')
+        grid.addWidget(self.play_backend, 11, 2)
+
         btn_play = QtWidgets.QPushButton('开始回放')
-        grid.addWidget(btn_play, 5, 1)
+        grid.addWidget(btn_play, 12, 1)
+
+        # Mouse-move compression (record time and offline)
+        grid.addWidget(QtWidgets.QLabel('移动最小间隔(ms):'), 6, 0)
+        self.rec_move_interval = QtWidgets.QSpinBox()
+        self.rec_move_interval.setRange(0, 1000)
+        self.rec_move_interval.setValue(0)
+        grid.addWidget(self.rec_move_interval, 6, 1)
+        grid.addWidget(QtWidgets.QLabel('移动最小距离(px):'), 7, 0)
+        self.rec_move_distance = QtWidgets.QSpinBox()
+        self.rec_move_distance.setRange(0, 200)
+        self.rec_move_distance.setValue(0)
+        grid.addWidget(self.rec_move_distance, 7, 1)
+        grid.addWidget(QtWidgets.QLabel('轨迹简化容差(px):'), 8, 0)
+        self.rec_move_epsilon = QtWidgets.QDoubleSpinBox()
+        self.rec_move_epsilon.setRange(0.0, 50.0)
+        self.rec_move_epsilon.setSingleStep(0.5)
+        self.rec_move_epsilon.setValue(0.0)
+        self.rec_move_epsilon.setToolTip('Ramer–Douglas–Peucker 容差，0 = 不简化；以上三项录制时生效，也可用于离线压缩')
+        grid.addWidget(self.rec_move_epsilon, 8, 1)
+        btn_compress = QtWidgets.QPushButton('离线压缩回放文件')
+        grid.addWidget(btn_compress, 9, 1)
 
         self.tabs.addTab(w, '录制 / 回放')
 
@@ -160,6 +232,7 @@ class MainWindow(QtWidgets.QMainWindow):
         btn_rec_stop.clicked.connect(self._rec_stop)
         btn_play_browse.clicked.connect(self._play_browse)
         btn_play.clicked.connect(self._play_start)
+        btn_compress.clicked.connect(self._compress_recording)
 
     def _build_sequence_tab(self):
         w = QtWidgets.QWidget()
@@ -176,14 +249,36 @@ class MainWindow(QtWidgets.QMainWindow):
         self.seq_params.setPlaceholderText('{"duration":0.3, "to_x":900, "to_y":600}')
         self.seq_preprocess = QtWidgets.QComboBox()
         self.seq_preprocess.addItems(['none', 'canny', 'threshold'])
-        self.seq_multi = QtWidgets.QCheckBox('多尺度匹配')
+        self.seq_multi = QtWidgets.QComboBox()
+        self.seq_multi.addItem('单尺度', False)
+        self.seq_multi.addItem('多尺度匹配', True)
+        self.seq_multi.addItem('金字塔多尺度(快)', 'pyramid')
+        self.seq_region = QtWidgets.QLineEdit()
+        self.seq_region.setPlaceholderText('留空=全屏；显示器序号如 1；或 x,y,w,h')
         self.seq_threshold = QtWidgets.QDoubleSpinBox()
         self.seq_threshold.setRange(0.0, 1.0)
         self.seq_threshold.setSingleStep(0.01)
         self.seq_threshold.setValue(0.85)
+        self.seq_wait = QtWidgets.QDoubleSpinBox()
+        self.seq_wait.setRange(0.0, 600.0)
+        self.seq_wait.setSingleStep(0.5)
+        self.seq_wait.setValue(0.0)
+        self.seq_wait.setToolTip('0 = 只检查一次；>0 = 轮询等待模板出现（先快后慢）直到超时')
+        self.seq_nth = QtWidgets.QComboBox()
+        self.seq_nth.addItem('最佳匹配', None)
+        self.seq_nth.addItem('全部匹配（依次执行）', 'all')
+        for n in range(10):
+            self.seq_nth.addItem(f'第 {n + 1} 个（按阅读顺序）', n)
+        self.seq_nth.addItem('最后一个', -1)
 
         btn_add = QtWidgets.QPushButton('添加到顺序')
         btn_run = QtWidgets.QPushButton('执行顺序匹配')
+        self.btn_seq_stop = QtWidgets.QPushButton('停止执行')
+        self.btn_seq_stop.setEnabled(False)
+        run_hb = QtWidgets.QHBoxLayout()
+        run_hb.addWidget(btn_run)
+        run_hb.addWidget(self.btn_seq_stop)
+        btn_compile = QtWidgets.QPushButton('编译为计划文件 (.plan)')
 
         # Guided recording controls
         guide_hb = QtWidgets.QHBoxLayout()
@@ -200,10 +295,14 @@ class MainWindow(QtWidgets.QMainWindow):
         form.addRow('动作:', self.seq_action)
         form.addRow('参数(JSON):', self.seq_params)
         form.addRow('预处理:', self.seq_preprocess)
-        form.addRow('', self.seq_multi)
+        form.addRow('尺度:', self.seq_multi)
+        form.addRow('搜索区域:', self.seq_region)
         form.addRow('阈值:', self.seq_threshold)
+        form.addRow('等待超时(s):', self.seq_wait)
+        form.addRow('目标:', self.seq_nth)
         form.addRow('', btn_add)
-        form.addRow('', btn_run)
+        form.addRow('', run_hb)
+        form.addRow('', btn_compile)
         form.addRow('引导式录制:', guide_hb)
 
         self.tabs.addTab(w, '顺序模式')
@@ -211,10 +310,14 @@ class MainWindow(QtWidgets.QMainWindow):
         btn_tpl_browse.clicked.connect(lambda: self._browse_into(self.seq_template))
         btn_add.clicked.connect(self._seq_add)
         btn_run.clicked.connect(self._seq_run)
+        self.btn_seq_stop.clicked.connect(self._seq_stop)
+        btn_compile.clicked.connect(lambda: self._compile_plan(DEFAULT_SEQ))
         self.btn_seq_guide_start.clicked.connect(self._guide_seq_start)
         self.btn_seq_guide_next.clicked.connect(self._guide_seq_next)
         self.btn_seq_guide_finish.clicked.connect(self._guide_seq_finish)
 
+        self._seq_stop_event = None
+
         # Internal state for guided recording
         self._guide_seq_active = False
         self._guide_seq_steps = []
@@ -237,7 +340,15 @@ class MainWindow(QtWidgets.QMainWindow):
         self.cond_priority.setValue(1)
         self.cond_preprocess = QtWidgets.QComboBox()
         self.cond_preprocess.addItems(['none', 'canny', 'threshold'])
-        self.cond_multi = QtWidgets.QCheckBox('多尺度匹配')
+        self.cond_multi = QtWidgets.QComboBox()
+        self.cond_multi.addItem('单尺度', False)
+        self.cond_multi.addItem('多尺度匹配', True)
+        self.cond_multi.addItem('金字塔多尺度(快)', 'pyramid')
+        self.cond_region = QtWidgets.QLineEdit()
+        self.cond_region.setPlaceholderText('留空=全屏；显示器序号如 1；或 x,y,w,h')
+        self.cond_strategy = QtWidgets.QComboBox()
+        self.cond_strategy.addItem('全部匹配后选优先级最高', 'exhaustive')
+        self.cond_strategy.addItem('按优先级依次匹配，命中即停', 'priority_first')
         self.cond_threshold = QtWidgets.QDoubleSpinBox()
         self.cond_threshold.setRange(0.0, 1.0)
         self.cond_threshold.setSingleStep(0.01)
@@ -245,22 +356,60 @@ class MainWindow(QtWidgets.QMainWindow):
 
         btn_add = QtWidgets.QPushButton('添加判断项')
         btn_run = QtWidgets.QPushButton('执行一次判断')
+        btn_compile = QtWidgets.QPushButton('编译为计划文件 (.plan)')
+
+        # Continuous watch
+        self.cond_tick_rate = QtWidgets.QDoubleSpinBox()
+        self.cond_tick_rate.setRange(0.1, 60.0)
+        self.cond_tick_rate.setSingleStep(1.0)
+        self.cond_tick_rate.setValue(5.0)
+        self.cond_budget = QtWidgets.QSpinBox()
+        self.cond_budget.setRange(0, 10000)
+        self.cond_budget.setSuffix(' ms')
+        self.cond_budget.setSpecialValueText('自动 (周期的 80%)')
+        self.cond_budget.setToolTip('每次判断截图+匹配的时间预算，超出后跳过较低优先级的判断项')
+        self.cond_cooldown = QtWidgets.QDoubleSpinBox()
+        self.cond_cooldown.setRange(0.0, 3600.0)
+        self.cond_cooldown.setSingleStep(0.5)
+        self.cond_cooldown.setValue(1.0)
+        self.cond_cooldown.setToolTip('判断项执行后在此时间内不再匹配（判断项可用 "cooldown" 字段单独设置）')
+        self.cond_duration = QtWidgets.QDoubleSpinBox()
+        self.cond_duration.setRange(0.0, 86400.0)
+        self.cond_duration.setSpecialValueText('不限')
+        btn_watch = QtWidgets.QPushButton('持续监视')
+        self.btn_cond_stop = QtWidgets.QPushButton('停止监视')
+        self.btn_cond_stop.setEnabled(False)
+        watch_hb = QtWidgets.QHBoxLayout()
+        watch_hb.addWidget(btn_watch)
+        watch_hb.addWidget(self.btn_cond_stop)
 
         form.addRow('模板:', hb_tpl)
         form.addRow('动作:', self.cond_action)
         form.addRow('参数(JSON):', self.cond_params)
         form.addRow('优先级:', self.cond_priority)
         form.addRow('预处理:', self.cond_preprocess)
-        form.addRow('', self.cond_multi)
+        form.addRow('尺度:', self.cond_multi)
+        form.addRow('搜索区域:', self.cond_region)
+        form.addRow('判断策略:', self.cond_strategy)
         form.addRow('阈值:', self.cond_threshold)
         form.addRow('', btn_add)
         form.addRow('', btn_run)
+        form.addRow('', btn_compile)
+        form.addRow('监视频率(次/秒):', self.cond_tick_rate)
+        form.addRow('每次预算:', self.cond_budget)
+        form.addRow('冷却(s):', self.cond_cooldown)
+        form.addRow('监视时长(s):', self.cond_duration)
+        form.addRow('', watch_hb)
 
         self.tabs.addTab(w, '判断模式')
+        self._cond_stop_event = None
 
         btn_tpl_browse.clicked.connect(lambda: self._browse_into(self.cond_template))
         btn_add.clicked.connect(self._cond_add)
         btn_run.clicked.connect(self._cond_run)
+        btn_watch.clicked.connect(self._cond_watch)
+        self.btn_cond_stop.clicked.connect(self._cond_stop)
+        btn_compile.clicked.connect(lambda: self._compile_plan(DEFAULT_COND))
 
     def _build_template_tab(self):
         w = QtWidgets.QWidget()
@@ -302,7 +451,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
     # Handlers
     def _rec_browse(self):
-        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, '保存录制到', DEFAULT_REC, 'JSON (*.json)')
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, '保存录制到', DEFAULT_REC, 'JSON (*.json);;Binary recording (*.rec)')
         if path:
             self.rec_out.setText(path)
 
@@ -310,7 +459,9 @@ class MainWindow(QtWidgets.QMainWindow):
         if self.recorder is not None:
             print('录制已在进行中')
             return
-        self.recorder = Recorder()
+        out = self.rec_out.text().strip() or DEFAULT_REC
+        # .rec output is streamed to disk while recording instead of held in memory
+        self.recorder = Recorder(stream_to=out if out.lower().endswith(REC_EXT) else None, move_filter=self._move_filter())
         self.recorder.start()
         print('开始录制（在终端无法停止，使用本窗口“停止录制”按钮）')
 
@@ -322,12 +473,38 @@ class MainWindow(QtWidgets.QMainWindow):
             self.recorder.stop()
             out = self.rec_out.text().strip() or DEFAULT_REC
             self.recorder.save(out)
+            st = self.recorder.stats()
             print(f'录制已保存: {out}')
+            print(f"录制队列: 事件 {st['queued']}，写入 {st['written']}，丢弃 {st['dropped']}，最大积压 {st['max_depth']}")
         finally:
             self.recorder = None
 
+    def _move_filter(self):
+        interval = self.rec_move_interval.value() / 1000.0
+        distance = float(self.rec_move_distance.value())
+        epsilon = float(self.rec_move_epsilon.value())
+        if not (interval or distance or epsilon):
+            return None
+        return MoveCompressor(min_interval=interval, min_distance=distance, epsilon=epsilon)
+
+    def _compress_recording(self):
+        src = self.play_in.text().strip() or DEFAULT_REC
+        comp = self._move_filter()
+        if comp is None:
+            print('请先设置移动压缩参数')
+            return
+        root, ext = os.path.splitext(src)
+        out = f'{root}_compressed{ext}'
+        try:
+            r = compress_recording(src, out, comp.min_interval, comp.min_distance, comp.epsilon)
+        except Exception as e:
+            print('[ERR] 压缩失败:\n' + str(e))
+            return
+        print(f"已压缩: {out}\n  事件 {r['events_before']} -> {r['events_after']}（移动 {r['moves_before']} -> {r['moves_after']}），"
+              f"文件 {r['bytes_before']} -> {r['bytes_after']} 字节，最大位置误差 {r['max_error_px']} px")
+
     def _play_browse(self):
-        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, '选择回放文件', DEFAULT_REC, 'JSON (*.json)')
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, '选择回放文件', DEFAULT_REC, 'Recordings (*.json *.rec)')
         if path:
             self.play_in.setText(path)
 
@@ -335,8 +512,25 @@ class MainWindow(QtWidgets.QMainWindow):
         path = self.play_in.text().strip() or DEFAULT_REC
         loop = int(self.play_loop.value())
         interval = float(self.play_interval.value())
-        print(f'开始回放: {path}, loop={loop}, interval={interval}')
-        self._run_in_worker(play_recording, path, loop, interval)
+        scheduler = self.play_scheduler.currentData()
+        catch_up = self.play_catch_up.currentData()
+        speed = float(self.play_speed.value())
+        max_gap = float(self.play_max_gap.value()) or None
+        unthrottled = self.play_unthrottled.isChecked()
+        backend = self.play_backend.currentData()
+        print(f'开始回放: {path}, loop={loop}, interval={interval}, scheduler={scheduler}, catch_up={catch_up}, '
+              f'speed={speed}, max_gap={max_gap}, unthrottled={unthrottled}, backend={backend}')
+
+        def job():
+            t0 = time.perf_counter()
+            r = play_recording(path, loop, interval, scheduler=scheduler, catch_up=catch_up,
+                               speed=speed, max_gap=max_gap, unthrottled=unthrottled, backend=backend)
+            print(f'回放耗时: {time.perf_counter() - t0:.2f}s')
+            if r['events']:
+                print(f"回放延迟(ms): 事件 {r['events']}，丢弃 {r['dropped']}，mean={r['mean_ms']:.2f} p50={r['p50_ms']:.2f} p99={r['p99_ms']:.2f} max={r['max_ms']:.2f}")
+                print('延迟分布: ' + ', '.join(f'{k}:{v}' for k, v in r['histogram'].items() if v))
+
+        self._run_in_worker(job)
 
     def _start_hotkeys(self):
         # Alt+1 start record, Alt+2 stop record, Alt+3 start playback
@@ -374,13 +568,45 @@ class MainWindow(QtWidgets.QMainWindow):
             QtWidgets.QMessageBox.warning(self, '错误', '请选择模板')
             return
         params = self._read_json(self.seq_params.text())
-        add_sequence_step(DEFAULT_SEQ, tpl, self.seq_action.currentText(), params=params, preprocess=self.seq_preprocess.currentText(), multi_scale=self.seq_multi.isChecked())
+        ok, region = self._read_region(self.seq_region.text())
+        if not ok:
+            return
+        add_sequence_step(DEFAULT_SEQ, tpl, self.seq_action.currentText(), params=params, preprocess=self.seq_preprocess.currentText(), multi_scale=self.seq_multi.currentData(), search_region=region, wait=float(self.seq_wait.value()), nth=self.seq_nth.currentData())
         print('已添加到 sequences.json')
 
     def _seq_run(self):
+        if self._seq_stop_event is not None:
+            print('顺序匹配正在执行中')
+            return
         thr = float(self.seq_threshold.value())
         print(f'执行顺序匹配，threshold={thr}')
-        self._run_in_worker(run_sequence, DEFAULT_SEQ, thr)
+        target = self._plan_or_json(DEFAULT_SEQ)
+        stop = self._seq_stop_event = threading.Event()
+        self.btn_seq_stop.setEnabled(True)
+
+        def report(r):
+            if r['found']:
+                extra = f"，共 {r['matches']} 处，执行 {r['acted']} 处" if 'matches' in r else ''
+                print(f"步骤 {r['index'] + 1}: 命中，出现用时 {r['time_to_appear']:.2f}s（轮询 {r['polls']} 次）{extra}")
+            else:
+                print(f"步骤 {r['index'] + 1}: 未找到，已跳过（等待 {r['waited']:.2f}s）")
+
+        def job():
+            # results are printed per step, so a stopped run still shows what it did
+            try:
+                if run_until_stopped(run_sequence_async(target, thr, stop=stop, on_step=report), stop) is None:
+                    print('顺序匹配已停止')
+            finally:
+                self._seq_stop_event = None
+
+        worker = self._run_in_worker(job)
+        worker.finished.connect(lambda: self.btn_seq_stop.setEnabled(False))
+
+    def _seq_stop(self):
+        # ends the run at the next step, poll interval or await; an action in progress completes
+        if self._seq_stop_event is not None:
+            self._seq_stop_event.set()
+            print('正在停止顺序匹配…')
 
     # Guided sequence workflow
     def _guide_seq_start(self):
@@ -399,7 +625,12 @@ class MainWindow(QtWidgets.QMainWindow):
         action = self.seq_action.currentText()
         params = self._read_json(self.seq_params.text())
         preprocess = self.seq_preprocess.currentText()
-        multi = self.seq_multi.isChecked()
+        multi = self.seq_multi.currentData()
+        wait = float(self.seq_wait.value())
+        nth = self.seq_nth.currentData()
+        ok, region = self._read_region(self.seq_region.text())
+        if not ok:
+            return
 
         # ROI select and auto-save template
         os.makedirs(RES_DIR, exist_ok=True)
@@ -414,7 +645,13 @@ class MainWindow(QtWidgets.QMainWindow):
             if preprocess and preprocess != 'none':
                 step["preprocess"] = preprocess
             if multi:
-                step["multi_scale"] = True
+                step["multi_scale"] = multi
+            if region is not None:
+                step["search_region"] = region
+            if wait:
+                step["wait"] = wait
+            if nth is not None:
+                step["nth"] = nth
             self._guide_seq_steps.append(step)
             print(f'已添加步骤 #{self._guide_seq_counter}')
         except Exception as e:
@@ -438,13 +675,72 @@ class MainWindow(QtWidgets.QMainWindow):
             QtWidgets.QMessageBox.warning(self, '错误', '请选择模板')
             return
         params = self._read_json(self.cond_params.text())
-        add_conditional_item(DEFAULT_COND, tpl, self.cond_action.currentText(), priority=int(self.cond_priority.value()), params=params, preprocess=self.cond_preprocess.currentText(), multi_scale=self.cond_multi.isChecked())
+        ok, region = self._read_region(self.cond_region.text())
+        if not ok:
+            return
+        add_conditional_item(DEFAULT_COND, tpl, self.cond_action.currentText(), priority=int(self.cond_priority.value()), params=params, preprocess=self.cond_preprocess.currentText(), multi_scale=self.cond_multi.currentData(), search_region=region)
         print('已添加到 conditionals.json')
 
     def _cond_run(self):
         thr = float(self.cond_threshold.value())
-        print(f'执行一次判断，threshold={thr}')
-        self._run_in_worker(run_conditionals, DEFAULT_COND, thr)
+        strategy = self.cond_strategy.currentData()
+        print(f'执行一次判断，threshold={thr}, strategy={strategy}')
+
+        def job():
+            st = run_conditionals(self._plan_or_json(DEFAULT_COND), thr, strategy=strategy)
+            print(f"判断统计: 共 {st['items']} 项，实际匹配 {st['evaluated']} 项，命中 {st['matched']} 项，执行: {st['selected'] or '无'}")
+
+        self._run_in_worker(job)
+
+    def _cond_watch(self):
+        if self._cond_stop_event is not None:
+            print('持续监视正在运行中')
+            return
+        thr = float(self.cond_threshold.value())
+        rate = float(self.cond_tick_rate.value())
+        budget = self.cond_budget.value() / 1000.0 or None
+        cooldown = float(self.cond_cooldown.value())
+        duration = float(self.cond_duration.value()) or None
+        target = self._plan_or_json(DEFAULT_COND)
+        stop = self._cond_stop_event = threading.Event()
+        self.btn_cond_stop.setEnabled(True)
+        print(f'开始持续监视：{rate:g} 次/秒，threshold={thr}，冷却 {cooldown:g}s')
+
+        def report(tick):
+            if tick['selected']:
+                print(f"第 {tick['tick'] + 1} 次判断: 执行 {tick['selected']}（耗时 {tick['work_ms']:.1f}ms）")
+
+        def job():
+            try:
+                st = watch_conditionals(target, thr, tick_rate=rate, budget=budget, cooldown=cooldown,
+                                        duration=duration, stop=stop, on_tick=report)
+            finally:
+                self._cond_stop_event = None
+            used = f"，预算占用 平均 {st['budget_used_mean']:.0%} / 最大 {st['budget_used_max']:.0%}" if st['budget'] else ''
+            print(f"监视结束（{st['stop_reason']}）：共 {st['ticks']} 次，实际 {st['ticks_per_s']:.1f} 次/秒{used}，"
+                  f"跳过低优先级 {st['skipped']} 项，执行 {st['actions']} 次")
+
+        worker = self._run_in_worker(job)
+        worker.finished.connect(lambda: self.btn_cond_stop.setEnabled(False))
+
+    def _cond_stop(self):
+        if self._cond_stop_event is not None:
+            self._cond_stop_event.set()
+
+    def _compile_plan(self, json_path: str):
+        try:
+            out = compile_plan(json_path)
+            print(f'计划已编译: {out}')
+        except Exception as e:
+            print('[ERR] 编译计划失败:\n' + str(e))
+
+    def _plan_or_json(self, json_path: str) -> str:
+        # prefer an up-to-date compiled plan next to the JSON
+        plan_path = os.path.splitext(json_path)[0] + PLAN_EXT
+        if is_plan(plan_path) and not open_plan(plan_path).is_stale():
+            print(f'使用已编译计划: {plan_path}')
+            return plan_path
+        return json_path
 
     def _save_to(self, line_edit: QtWidgets.QLineEdit):
         path, _ = QtWidgets.QFileDialog.getSaveFileName(self, '保存模板到', line_edit.text() or os.path.join(RES_DIR, 'template.png'), 'PNG (*.png)')
@@ -485,15 +781,71 @@ class MainWindow(QtWidgets.QMainWindow):
             QtWidgets.QMessageBox.warning(self, '错误', f'Params 不是合法 JSON\n{e}')
             return None
 
+    def _toggle_trace(self, on: bool):
+        for sink in self._trace_sinks:
+            trace.remove_sink(sink)
+            sink.close()
+        self._trace_sinks, self._trace_ring = [], None
+        if not on:
+            print('步骤追踪已关闭')
+            return
+        self._trace_ring = trace.RingBufferSink(capacity=2000)
+        sinks = [self._trace_ring, trace.ConsoleSink(kinds=['sequence_step', 'conditionals', 'playback_pass'])]
+        out = self.trace_out.text().strip()
+        if out:
+            try:
+                sinks.append(trace.JsonlSink(out, append=True))
+            except OSError as e:
+                QtWidgets.QMessageBox.warning(self, '错误', f'无法写入追踪文件\n{e}')
+        for sink in sinks:
+            trace.add_sink(sink)
+        self._trace_sinks = sinks
+        print('步骤追踪已开启' + (f'，输出到 {out}' if out else ''))
+
+    def _report_done(self):
+        print('任务完成')
+        if self._trace_ring is not None:
+            steps = [e for e in self._trace_ring.events() if e['kind'] in ('sequence_step', 'conditionals', 'playback_pass')]
+            slow = sorted(steps, key=lambda e: e['total_ms'], reverse=True)[:3]
+            for e in slow:
+                label = e.get('template') or e.get('path') or ''
+                print(f"最慢步骤: {e['kind']} #{e.get('index', '-')} {label} 总计 {e['total_ms']:.1f}ms "
+                      f"(截图 {e.get('capture_ms', 0):.1f} / 预处理 {e.get('preprocess_ms', 0):.1f} / "
+                      f"匹配 {e.get('match_ms', 0):.1f} / 动作 {e.get('action_ms', 0):.1f})")
+            self._trace_ring.clear()
+        st = get_capture_session().latency_stats()
+        if st.get('count'):
+            print(f"截图耗时(ms): n={st['count']} p50={st['p50_ms']:.1f} p90={st['p90_ms']:.1f} p99={st['p99_ms']:.1f} max={st['max_ms']:.1f}")
+        ts = template_store.stats()
+        if ts['hits'] or ts['misses']:
+            print(f"模板缓存: hits={ts['hits']} misses={ts['misses']} reloads={ts['reloads']} entries={ts['entries']}")
+
+    def _read_region(self, text: str):
+        # '' -> full screen, '2' -> monitor index, 'x,y,w,h' -> rectangle
+        text = (text or '').strip()
+        if not text:
+            return True, None
+        try:
+            parts = [int(p) for p in text.replace('，', ',').split(',')]
+            if len(parts) == 1:
+                return True, parts[0]
+            if len(parts) == 4 and parts[2] > 0 and parts[3] > 0:
+                return True, parts
+        except ValueError:
+            pass
+        QtWidgets.QMessageBox.warning(self, '错误', f'搜索区域格式错误: {text}\n应为显示器序号或 x,y,w,h')
+        return False, None
+
     def _run_in_worker(self, fn, *args, **kwargs):
         worker = Worker(fn, *args, **kwargs)
-        worker.finished_ok.connect(lambda: print('任务完成'))
+        worker.finished_ok.connect(self._report_done)
         worker.finished_err.connect(lambda err: print('[ERR] 任务失败\n' + err))
         worker.start()
         # Keep reference to avoid GC
         if not hasattr(self, '_workers'):
             self._workers = []
         self._workers.append(worker)
+        return worker
 
 
 def run_gui():
@@ -0,0 +1,174 @@
+import os
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from .rec_format import REC_EXT, RecordingWriter, iter_events, write_json_events
+
+
+def rdp_mask(points: np.ndarray, epsilon: float) -> np.ndarray:
+    # Ramer-Douglas-Peucker on an (N, 2) polyline; returns a boolean keep mask.
+    # Iterative with a stack, distances for each span computed in one NumPy op.
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    if n < 3 or epsilon <= 0:
+        keep[:] = True
+        return keep
+    keep[0] = keep[-1] = True
+    pts = points.astype(np.float64)
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        d = _distances(pts[i + 1:j], pts[i], pts[j])
+        k = int(np.argmax(d))
+        if d[k] > epsilon:
+            k += i + 1
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return keep
+
+
+def _distances(p: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # distance of each point in p to the segment a-b
+    ab = b - a
+    denom = float(ab @ ab)
+    if denom == 0.0:
+        return np.hypot(*(p - a).T)
+    t = np.clip(((p - a) @ ab) / denom, 0.0, 1.0)
+    proj = a + t[:, None] * ab
+    return np.hypot(*(p - proj).T)
+
+
+class MoveCompressor:
+    """Thins mouse-move events, online (at record time) or offline.
+
+    A move is kept only if at least min_interval seconds and min_distance
+    pixels separate it from the last kept move; runs of moves between two
+    non-move events are then simplified with RDP (epsilon pixels). The last
+    move before a click/key/scroll and every non-move event are always kept
+    with their original timestamps. max_error is the largest distance of a
+    dropped move from the simplified path.
+    """
+
+    def __init__(self, min_interval: float = 0.0, min_distance: float = 0.0, epsilon: float = 0.0):
+        self.min_interval = float(min_interval)
+        self.min_distance = float(min_distance)
+        self.epsilon = float(epsilon)
+        self._run: List[Dict] = []      # kept-by-decimation moves of the current run
+        self._dropped: List[Dict] = []  # decimated moves of the current run (for error)
+        self._pending: Optional[Dict] = None  # latest decimated move, restored at run end
+        self.moves_in = 0
+        self.moves_out = 0
+        self.max_error = 0.0
+
+    def _decimate(self, ev: Dict) -> bool:
+        if not self._run:
+            return True
+        last = self._run[-1]
+        if ev.get("t", 0.0) - last.get("t", 0.0) < self.min_interval:
+            return False
+        return np.hypot(ev["x"] - last["x"], ev["y"] - last["y"]) >= self.min_distance
+
+    def feed(self, ev: Dict) -> List[Dict]:
+        # Returns the events that are final and can be written out now
+        if ev.get("type") == "move":
+            self.moves_in += 1
+            if self._decimate(ev):
+                if self._pending is not None:
+                    self._dropped.append(self._pending)
+                    self._pending = None
+                self._run.append(ev)
+            else:
+                if self._pending is not None:
+                    self._dropped.append(self._pending)
+                self._pending = ev
+            if self.epsilon <= 0 and len(self._run) > 1:
+                # without RDP every kept move but the run's tail is final
+                out = self._run[:-1]
+                self._measure(self._run[-2:])
+                self._run = self._run[-1:]
+                self.moves_out += len(out)
+                return out
+            return []
+        return self.flush() + [ev]
+
+    def flush(self) -> List[Dict]:
+        run = self._run
+        if self._pending is not None:
+            run = run + [self._pending]
+        self._run, self._pending = [], None
+        if self.epsilon > 0 and len(run) > 2:
+            pts = np.array([(e["x"], e["y"]) for e in run], dtype=np.float64)
+            mask = rdp_mask(pts, self.epsilon)
+            self._dropped.extend(e for e, k in zip(run, mask) if not k)
+            run = [e for e, k in zip(run, mask) if k]
+        self._measure(run)
+        self._dropped = []
+        self.moves_out += len(run)
+        return run
+
+    def _measure(self, kept: List[Dict]):
+        # error of dropped moves against the kept polyline, segment by time order
+        if not self._dropped or not kept:
+            return
+        kt = np.array([e.get("t", 0.0) for e in kept])
+        kp = np.array([(e["x"], e["y"]) for e in kept], dtype=np.float64)
+        still = []
+        for d in self._dropped:
+            i = int(np.searchsorted(kt, d.get("t", 0.0)))
+            if i >= len(kept):
+                still.append(d)  # the kept point after it is not known yet
+                continue
+            a = kp[max(i - 1, 0)]
+            b = kp[min(i, len(kept) - 1)]
+            err = float(_distances(np.array([[d["x"], d["y"]]], dtype=np.float64), a, b)[0])
+            self.max_error = max(self.max_error, err)
+        self._dropped = still
+
+    def filter(self, events: Iterable[Dict]) -> Iterator[Dict]:
+        for ev in events:
+            yield from self.feed(ev)
+        yield from self.flush()
+
+
+def compress_recording(
+    in_path: str,
+    out_path: str,
+    min_interval: float = 0.0,
+    min_distance: float = 0.0,
+    epsilon: float = 0.0,
+) -> Dict:
+    # Offline pass over a .json or .rec recording; the output format follows
+    # out_path's extension. Returns a size/error report.
+    comp = MoveCompressor(min_interval, min_distance, epsilon)
+    events_in = 0
+    events_out = 0
+
+    def counted(events):
+        nonlocal events_in
+        for ev in events:
+            events_in += 1
+            yield ev
+
+    filtered = comp.filter(counted(iter_events(in_path)))
+    if out_path.lower().endswith(REC_EXT):
+        with RecordingWriter(out_path) as w:
+            for ev in filtered:
+                w.write(ev)
+                events_out += 1
+    else:
+        events_out = write_json_events(out_path, filtered)
+    return {
+        "events_before": events_in,
+        "events_after": events_out,
+        "moves_before": comp.moves_in,
+        "moves_after": comp.moves_out,
+        "bytes_before": os.path.getsize(in_path),
+        "bytes_after": os.path.getsize(out_path),
+        "max_error_px": round(comp.max_error, 3),
+    }
@@ -0,0 +1,245 @@
+import json
+import os
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .vision import _preprocess, template_store
+
+# Single-file compiled plan:
+#   MAGIC (8 bytes) | header length (uint64 LE) | header JSON | zero pad | template blob
+# The blob starts on a 64-byte boundary and holds every pre-decoded,
+# pre-preprocessed template back to back (uint8, C order), so a runner can
+# np.memmap it and slice templates out without decoding or copying.
+MAGIC = b"PCOPLAN1"
+PLAN_EXT = ".plan"
+_ALIGN = 64
+
+
+def resolve_template_path(path: str, base_dir: str) -> str:
+    # Templates are stored with the absolute path of the machine that recorded
+    # them; a workspace unpacked by io_utils.import_project keeps them under
+    # <workspace>/resources/, so fall back to that layout when the path is gone.
+    if os.path.isfile(path):
+        return os.path.abspath(path)
+    norm = path.replace("\\", "/")
+    name = os.path.basename(norm)
+    candidates = [os.path.join(base_dir, norm)] if not os.path.isabs(norm) else []
+    parent = os.path.basename(os.path.dirname(norm))
+    if parent:
+        candidates.append(os.path.join(base_dir, parent, name))
+    candidates += [os.path.join(base_dir, "resources", name), os.path.join(base_dir, name)]
+    for c in candidates:
+        if os.path.isfile(c):
+            return os.path.abspath(c)
+    raise FileNotFoundError(f"Template not found: {path}")
+
+
+def compile_plan(source_json: str, out_path: Optional[str] = None) -> str:
+    with open(source_json, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if "steps" in data:
+        kind, entries = "sequence", data.get("steps", [])
+    else:
+        kind, entries = "conditionals", data.get("items", [])
+    base_dir = os.path.dirname(os.path.abspath(source_json))
+    out_path = out_path or os.path.splitext(source_json)[0] + PLAN_EXT
+
+    templates: List[Dict] = []
+    arrays: List[np.ndarray] = []
+    index: Dict[Tuple[str, str], int] = {}
+    compiled = []
+    offset = 0
+    for entry in entries:
+        src = resolve_template_path(entry["template"], base_dir)
+        preprocess = (entry.get("preprocess") or "none").lower()
+        key = (src, preprocess)
+        if key not in index:
+            gray = cv2.imread(src, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                raise FileNotFoundError(f"Template not found: {src}")
+            arr = np.ascontiguousarray(_preprocess(gray, preprocess), dtype=np.uint8)
+            index[key] = len(templates)
+            templates.append({
+                "source": src,
+                "preprocess": preprocess,
+                "shape": list(arr.shape),
+                "offset": offset,
+                "mtime_ns": os.stat(src).st_mtime_ns,
+            })
+            arrays.append(arr)
+            offset += arr.nbytes
+        compiled.append({**entry, "template_index": index[key]})
+
+    header = {
+        "version": 1,
+        "kind": kind,
+        "source": os.path.abspath(source_json),
+        "source_mtime_ns": os.stat(source_json).st_mtime_ns,
+        "entries": compiled,
+        "templates": templates,
+    }
+    head = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    blob_offset = -(-(len(MAGIC) + 8 + len(head)) // _ALIGN) * _ALIGN
+    tmp = out_path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(head)))
+        f.write(head)
+        f.write(b"\0" * (blob_offset - len(MAGIC) - 8 - len(head)))
+        for arr in arrays:
+            f.write(arr.tobytes())
+    # an open plan maps the old file, which Windows would refuse to replace
+    close_plan(out_path)
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def is_plan(path: str) -> bool:
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class Plan:
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a compiled plan: {path}")
+            (head_len,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(head_len).decode('utf-8'))
+        if header.get("version") != 1:
+            raise ValueError(f"Unsupported plan version: {header.get('version')}")
+        self.kind: str = header["kind"]
+        self.source: str = header["source"]
+        self.source_mtime_ns: int = header["source_mtime_ns"]
+        self.templates: List[Dict] = header["templates"]
+        self._entries: List[Dict] = header["entries"]
+        blob_offset = -(-(len(MAGIC) + 8 + head_len) // _ALIGN) * _ALIGN
+        size = sum(int(np.prod(t["shape"])) for t in self.templates)
+        self._blob = np.memmap(self.path, dtype=np.uint8, mode='r', offset=blob_offset, shape=(size,)) if size else None
+        self._pinned = False
+        self._closed = False
+
+    def _check_open(self):
+        if self._closed:
+            raise ValueError(f"Plan is closed: {self.path}")
+
+    def template_array(self, i: int) -> np.ndarray:
+        self._check_open()
+        t = self.templates[i]
+        n = int(np.prod(t["shape"]))
+        return self._blob[t["offset"]:t["offset"] + n].reshape(t["shape"])
+
+    def template_key(self, i: int) -> str:
+        return f"{self.path}#{i}"
+
+    def is_stale(self) -> bool:
+        # True when the source JSON or any template changed after compilation
+        try:
+            if os.stat(self.source).st_mtime_ns != self.source_mtime_ns:
+                return True
+            return any(os.stat(t["source"]).st_mtime_ns != t["mtime_ns"] for t in self.templates)
+        except OSError:
+            return False  # sources gone (e.g. plan shipped alone): the plan is authoritative
+
+    def entries(self) -> List[Dict]:
+        # Steps/items with "template" pointing at pinned template_store entries
+        # backed by the memory-mapped blob (pinned once per Plan, until close()).
+        self._check_open()
+        if not self._pinned:
+            for i, t in enumerate(self.templates):
+                template_store.preload(self.template_key(i), t["preprocess"], self.template_array(i))
+            self._pinned = True
+        out = []
+        for e in self._entries:
+            key = self.template_key(e["template_index"])
+            item = {k: v for k, v in e.items() if k != "template_index"}
+            item["template"] = key
+            out.append(item)
+        return out
+
+    def close(self):
+        # Unpin this plan's templates and drop the mapping
+        template_store.unpin(self.path + "#")
+        self._pinned = False
+        self._closed = True
+        self._blob = None
+
+
+# Plans opened by load_entries stay mapped and pinned while their file is
+# unchanged, so repeated runs reuse them; a changed file (recompiled) or
+# close_plan() releases the old mapping.
+_open_plans: Dict[str, Tuple[Tuple[int, int], Plan]] = {}
+_open_lock = threading.Lock()
+
+
+def open_plan(path: str) -> Plan:
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _open_lock:
+        cached = _open_plans.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        if cached is not None:
+            cached[1].close()
+        plan = Plan(path)
+        _open_plans[path] = (stamp, plan)
+        return plan
+
+
+def close_plan(path: str):
+    path = os.path.abspath(path)
+    with _open_lock:
+        cached = _open_plans.pop(path, None)
+    if cached is not None:
+        cached[1].close()
+    else:
+        template_store.unpin(path + "#")
+
+
+def detect_kind(path: str) -> str:
+    # "sequence", "conditionals" or "recording", from the file's content
+    if is_plan(path):
+        return open_plan(path).kind
+    from .rec_format import _JsonStream, is_binary_recording
+    if is_binary_recording(path):
+        return "recording"
+    with open(path, 'r', encoding='utf-8') as f:
+        js = _JsonStream(f, 1 << 12)
+        try:
+            js.expect("{")
+            while js.peek() == '"':
+                key = js.value()
+                if key == "events":
+                    return "recording"
+                if key == "steps":
+                    return "sequence"
+                if key == "items":
+                    return "conditionals"
+                js.expect(":")
+                js.value()
+                if js.peek() != ",":
+                    break
+                js.expect(",")
+        except ValueError:  # empty or malformed JSON (JSONDecodeError is a ValueError)
+            pass
+    raise ValueError(f"Cannot tell what {path} contains")
+
+
+def load_entries(path: str, kind: str = "sequence") -> List[Dict]:
+    # Steps of a sequences.json / items of a conditionals.json, or the entries of a compiled plan
+    if is_plan(path):
+        plan = open_plan(path)
+        if plan.kind != kind:
+            raise ValueError(f"{path} is a {plan.kind} plan, expected {kind}")
+        return plan.entries()
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("steps" if kind == "sequence" else "items", [])
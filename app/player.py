@@ -1,16 +1,327 @@
-import json
 import time
-import pyautogui
-from typing import Dict, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from . import trace
+from .rec_format import iter_passes
 
-pyautogui.FAILSAFE = True
-pyautogui.PAUSE = 0.0
-try:
-    # Reduce internal throttling in PyAutoGUI
-    pyautogui.MINIMUM_DURATION = 0.0
-    pyautogui.MINIMUM_SLEEP = 0.0
-except Exception:
-    pass
+
+class InputBackend:
+    """Injects mouse/keyboard input. Coordinates are absolute screen pixels,
+    buttons are "left"/"right"/"middle", keys use the recorder's names
+    ("a", "enter", "ctrl", ...).
+
+    Backends may buffer: callers invoke flush() whenever they are about to
+    idle so that queued input reaches the system before the wait.
+    """
+
+    name = "base"
+
+    def configure(self, pause: float = 0.0):
+        pass
+
+    def move(self, x: int, y: int, duration: float = 0.0):
+        raise NotImplementedError
+
+    def move_batch(self, points: Sequence[Tuple[int, int]]):
+        for x, y in points:
+            self.move(x, y)
+
+    def click(self, x: int, y: int, button: str = "left", clicks: int = 1, interval: float = 0.0):
+        raise NotImplementedError
+
+    def mouse_down(self, x: int, y: int, button: str = "left"):
+        raise NotImplementedError
+
+    def mouse_up(self, x: int, y: int, button: str = "left"):
+        raise NotImplementedError
+
+    def drag(self, x: int, y: int, to_x: int, to_y: int, duration: float = 0.2, button: str = "left"):
+        self.move(x, y)
+        self.mouse_down(x, y, button)
+        self.move(to_x, to_y, duration)
+        self.mouse_up(to_x, to_y, button)
+
+    def scroll(self, dy: int, x: int, y: int):
+        raise NotImplementedError
+
+    def key_down(self, key: str):
+        raise NotImplementedError
+
+    def key_up(self, key: str):
+        raise NotImplementedError
+
+    def hotkey(self, *keys: str):
+        for k in keys:
+            self.key_down(k)
+        for k in reversed(keys):
+            self.key_up(k)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class PyAutoGUIBackend(InputBackend):
+    # Default backend; pyautogui is imported on first use so modules that only
+    # need matching or headless runs don't pay for (or require) it.
+    name = "pyautogui"
+
+    def __init__(self):
+        self._pg = None
+
+    @property
+    def pg(self):
+        if self._pg is None:
+            import pyautogui
+            pyautogui.FAILSAFE = True
+            pyautogui.PAUSE = 0.0
+            try:
+                # Reduce internal throttling in PyAutoGUI
+                pyautogui.MINIMUM_DURATION = 0.0
+                pyautogui.MINIMUM_SLEEP = 0.0
+            except Exception:
+                pass
+            self._pg = pyautogui
+        return self._pg
+
+    def configure(self, pause: float = 0.0):
+        # Ensure no extra implicit delay is added between actions
+        try:
+            self.pg.PAUSE = float(pause)
+        except Exception:
+            self.pg.PAUSE = 0.0
+
+    def move(self, x, y, duration=0.0):
+        self.pg.moveTo(x, y, duration=duration)
+
+    def click(self, x, y, button="left", clicks=1, interval=0.0):
+        self.pg.click(x=x, y=y, button=button, clicks=clicks, interval=interval)
+
+    def mouse_down(self, x, y, button="left"):
+        self.pg.mouseDown(x=x, y=y, button=button)
+
+    def mouse_up(self, x, y, button="left"):
+        self.pg.mouseUp(x=x, y=y, button=button)
+
+    def drag(self, x, y, to_x, to_y, duration=0.2, button="left"):
+        self.pg.moveTo(x, y)
+        self.pg.dragTo(to_x, to_y, duration=duration, button=button)
+
+    def scroll(self, dy, x, y):
+        self.pg.scroll(dy, x=x, y=y)
+
+    def key_down(self, key):
+        self.pg.keyDown(key)
+
+    def key_up(self, key):
+        self.pg.keyUp(key)
+
+    def hotkey(self, *keys):
+        self.pg.hotkey(*[('winleft' if k == 'win' else k) for k in keys])
+
+
+class XTestBackend(InputBackend):
+    """Linux/X11 injector using the XTEST extension (python-xlib).
+
+    Requests are only written into the X connection's output buffer; nothing
+    is sent until flush(), so a run of moves becomes one batched write instead
+    of one round trip per event.
+    """
+
+    name = "xtest"
+    _BUTTONS = {"left": 1, "middle": 2, "right": 3}
+    _KEYSYMS = {
+        "ctrl": "Control_L", "alt": "Alt_L", "shift": "Shift_L", "win": "Super_L",
+        "enter": "Return", "tab": "Tab", "esc": "Escape", "backspace": "BackSpace",
+        "delete": "Delete", "up": "Up", "down": "Down", "left": "Left", "right": "Right",
+        "space": "space", "home": "Home", "end": "End", "page_up": "Prior",
+        "page_down": "Next", "insert": "Insert", "caps_lock": "Caps_Lock",
+    }
+
+    def __init__(self, display_name: Optional[str] = None):
+        from Xlib import X, XK, display
+        from Xlib.ext import xtest
+        self._X, self._XK, self._xtest = X, XK, xtest
+        self._d = display.Display(display_name)
+        if not self._d.has_extension("XTEST"):
+            raise RuntimeError("X server has no XTEST extension")
+        self._keycodes: Dict[str, int] = {}
+
+    def _fake(self, event_type, detail=0, **kw):
+        self._xtest.fake_input(self._d, event_type, detail, **kw)
+
+    def move(self, x, y, duration=0.0):
+        if duration > 0:
+            # tween like pyautogui, flushing each step so the motion is visible
+            root = self._d.screen().root.query_pointer()
+            sx, sy = root.root_x, root.root_y
+            steps = max(1, int(duration / 0.01))
+            for i in range(1, steps + 1):
+                self._fake(self._X.MotionNotify, x=sx + (x - sx) * i // steps, y=sy + (y - sy) * i // steps)
+                self.flush()
+                time.sleep(duration / steps)
+            return
+        self._fake(self._X.MotionNotify, x=int(x), y=int(y))
+
+    def move_batch(self, points):
+        for x, y in points:
+            self._fake(self._X.MotionNotify, x=int(x), y=int(y))
+
+    def _button(self, button: str, press: bool):
+        self._fake(self._X.ButtonPress if press else self._X.ButtonRelease, self._BUTTONS.get(button, 1))
+
+    def click(self, x, y, button="left", clicks=1, interval=0.0):
+        self.move(x, y)
+        for i in range(clicks):
+            if i and interval > 0:
+                self.flush()
+                time.sleep(interval)
+            self._button(button, True)
+            self._button(button, False)
+
+    def mouse_down(self, x, y, button="left"):
+        self.move(x, y)
+        self._button(button, True)
+
+    def mouse_up(self, x, y, button="left"):
+        self.move(x, y)
+        self._button(button, False)
+
+    def scroll(self, dy, x, y):
+        # buttons 4/5 are wheel up/down, one press per notch
+        self.move(x, y)
+        detail = 4 if dy > 0 else 5
+        for _ in range(abs(int(dy))):
+            self._fake(self._X.ButtonPress, detail)
+            self._fake(self._X.ButtonRelease, detail)
+
+    def _keycode(self, key: str) -> int:
+        code = self._keycodes.get(key)
+        if code is None:
+            name = self._KEYSYMS.get(key.lower(), key)
+            sym = self._XK.string_to_keysym(name)
+            if not sym and len(key) == 1:
+                sym = ord(key)  # Latin-1 keysyms equal their code point
+            if not sym and name[:1] in "fF" and name[1:].isdigit():
+                sym = self._XK.string_to_keysym(name.upper())
+            code = self._d.keysym_to_keycode(sym) if sym else 0
+            if not code:
+                raise ValueError(f"No keycode for key: {key}")
+            self._keycodes[key] = code
+        return code
+
+    def key_down(self, key):
+        self._fake(self._X.KeyPress, self._keycode(key))
+
+    def key_up(self, key):
+        self._fake(self._X.KeyRelease, self._keycode(key))
+
+    def flush(self):
+        self._d.flush()
+
+    def close(self):
+        self.flush()
+        self._d.close()
+
+
+class NullBackend(InputBackend):
+    # Accepts everything and does nothing; measures pure playback overhead.
+    name = "null"
+
+    def move(self, x, y, duration=0.0):
+        pass
+
+    def click(self, x, y, button="left", clicks=1, interval=0.0):
+        pass
+
+    def mouse_down(self, x, y, button="left"):
+        pass
+
+    def mouse_up(self, x, y, button="left"):
+        pass
+
+    def scroll(self, dy, x, y):
+        pass
+
+    def key_down(self, key):
+        pass
+
+    def key_up(self, key):
+        pass
+
+
+class RecordingBackend(NullBackend):
+    # Keeps every call as a tuple, e.g. ("click", x, y, "left", 1), for tests
+    # and dry runs.
+    name = "recording"
+
+    def __init__(self):
+        self.calls: List[Tuple] = []
+        self.flushes = 0
+
+    def _record(self, call: Tuple):
+        self.calls.append(call)
+
+    def move(self, x, y, duration=0.0):
+        self._record(("move", x, y))
+
+    def click(self, x, y, button="left", clicks=1, interval=0.0):
+        self._record(("click", x, y, button, clicks))
+
+    def mouse_down(self, x, y, button="left"):
+        self._record(("mouse_down", x, y, button))
+
+    def mouse_up(self, x, y, button="left"):
+        self._record(("mouse_up", x, y, button))
+
+    def scroll(self, dy, x, y):
+        self._record(("scroll", dy, x, y))
+
+    def key_down(self, key):
+        self._record(("key_down", key))
+
+    def key_up(self, key):
+        self._record(("key_up", key))
+
+    def hotkey(self, *keys):
+        self._record(("hotkey",) + tuple(keys))
+
+    def flush(self):
+        self.flushes += 1
+
+
+BACKENDS: Dict[str, Callable[[], InputBackend]] = {
+    "pyautogui": PyAutoGUIBackend,
+    "xtest": XTestBackend,
+    "null": NullBackend,
+    "recording": RecordingBackend,
+}
+_default_backend: Optional[InputBackend] = None
+
+
+def get_backend(backend: Union[str, InputBackend, None] = None) -> InputBackend:
+    # None -> the process default (pyautogui unless set_backend was called);
+    # a name creates a new backend; an instance is returned as is.
+    global _default_backend
+    if isinstance(backend, InputBackend):
+        return backend
+    if backend is None:
+        if _default_backend is None:
+            _default_backend = PyAutoGUIBackend()
+        return _default_backend
+    try:
+        return BACKENDS[backend]()
+    except KeyError:
+        raise ValueError(f"Unknown input backend: {backend}") from None
+
+
+def set_backend(backend: Union[str, InputBackend, None]) -> Optional[InputBackend]:
+    # Returns the previous default so callers can restore it
+    global _default_backend
+    prev = _default_backend
+    _default_backend = None if backend is None else get_backend(backend)
+    return prev
 
 
 def _sleep_until(next_t: float, start_time: float):
@@ -20,88 +331,288 @@ def _sleep_until(next_t: float, start_time: float):
         time.sleep(target_abs - now)
 
 
-def play_recording(json_path: str, loop: int = 1, interval: float = 1.0, pause: float = 0.0):
-    # Ensure no extra implicit delay is added between actions
-    try:
-        pyautogui.PAUSE = float(pause)
-    except Exception:
-        pyautogui.PAUSE = 0.0
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data: Dict = json.load(f)
-    events = data.get("events", [])
-
-    for i in range(loop):
-        start_run = time.time()
-        base_t = events[0]["t"] if events else 0.0
-        for ev in events:
-            t = max(0.0, ev.get("t", 0.0) - base_t)
-            _sleep_until(t, start_run)
-            et = ev.get("type")
-            if et == "move":
-                pyautogui.moveTo(ev["x"], ev["y"], duration=0.0)
-            elif et == "click":
-                if ev.get("pressed"):
-                    # skip press event; act on release to avoid double action
-                    continue
-                btn = ev.get("button", "Button.left")
-                button = "left" if "left" in btn else ("right" if "right" in btn else "middle")
-                pyautogui.click(ev["x"], ev["y"], button=button)
-            elif et == "scroll":
-                pyautogui.scroll(ev.get("dy", 0), x=ev["x"], y=ev["y"]) 
-            elif et == "key":
-                key = ev.get("key")
-                action = ev.get("action")
-                if action == "press":
-                    try:
-                        pyautogui.keyDown(key)
-                    except Exception:
-                        pass
-                elif action == "release":
-                    try:
-                        pyautogui.keyUp(key)
-                    except Exception:
-                        pass
-            elif et == "hotkey":
-                keys = ev.get("keys", [])
-                if keys:
-                    try:
-                        norm = [
-                            ('winleft' if k == 'win' else k)
-                            for k in keys
-                        ]
-                        pyautogui.hotkey(*norm)
-                    except Exception:
-                        pass
-        if i < loop - 1:
-            time.sleep(interval)
-
-def simple_action(action: str, x: int, y: int, params: Optional[Dict] = None):
+class LatenessStats:
+    # Histogram of how late each event was issued relative to its schedule.
+    # Memory is constant: percentiles come from 0.01 ms bins up to 100 ms.
+    BOUNDS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100)
+    _FINE_MS = 0.01
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self._fine = [0] * (int(self.BOUNDS_MS[-1] / self._FINE_MS) + 1)
+        self.n = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.dropped = 0
+
+    def add(self, lateness: float):
+        ms = max(0.0, lateness) * 1000.0
+        self.n += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self._fine[min(int(ms / self._FINE_MS), len(self._fine) - 1)] += 1
+        for i, b in enumerate(self.BOUNDS_MS):
+            if ms < b:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def _percentile(self, q: float) -> float:
+        rank = q * self.n
+        seen = 0
+        for i, c in enumerate(self._fine):
+            seen += c
+            if seen >= rank:
+                return min((i + 1) * self._FINE_MS, self.max_ms)
+        return self.max_ms
+
+    def report(self) -> Dict:
+        labels = [f"<{b}ms" for b in self.BOUNDS_MS] + [f">={self.BOUNDS_MS[-1]}ms"]
+        out = {"events": self.n, "dropped": self.dropped, "histogram": dict(zip(labels, self.counts))}
+        if self.n:
+            out.update({
+                "mean_ms": self.total_ms / self.n,
+                "p50_ms": self._percentile(0.5),
+                "p99_ms": self._percentile(0.99),
+                "max_ms": self.max_ms,
+            })
+        return out
+
+
+class PlaybackScheduler:
+    """Issues events at start + t using time.perf_counter.
+
+    precise: sleep until `spin` seconds before the target, then busy-wait, which
+             avoids both OS sleep granularity and wall-clock jumps;
+    legacy:  the original single time.sleep against time.time().
+    catch_up: "replay_all" plays every event even when behind; "drop_moves"
+              skips mouse moves that are more than stale_after seconds late
+              (clicks, keys and scrolls are never dropped).
+    """
+
+    def __init__(self, mode: str = "precise", catch_up: str = "replay_all", spin: float = 0.001, stale_after: float = 0.02):
+        if mode not in ("precise", "legacy"):
+            raise ValueError(f"Unknown scheduler mode: {mode}")
+        if catch_up not in ("replay_all", "drop_moves"):
+            raise ValueError(f"Unknown catch-up policy: {catch_up}")
+        self.mode = mode
+        self.catch_up = catch_up
+        self.spin = float(spin)
+        self.stale_after = float(stale_after)
+        self.stats = LatenessStats()
+        self._start = 0.0
+
+    def start(self):
+        self._start = time.perf_counter() if self.mode == "precise" else time.time()
+
+    def wait(self, t: float, idle: Optional[Callable[[], None]] = None) -> float:
+        # Block until offset t; returns the lateness in seconds (0 when on time).
+        # idle is called once before actually waiting (used to flush batched input).
+        if idle is not None and self._now() < self._start + t:
+            idle()
+        if self.mode == "legacy":
+            _sleep_until(t, self._start)
+            return max(0.0, time.time() - (self._start + t))
+        target = self._start + t
+        remaining = target - time.perf_counter()
+        if remaining > self.spin:
+            time.sleep(remaining - self.spin)
+        while time.perf_counter() < target:
+            pass
+        return time.perf_counter() - target
+
+    def _now(self) -> float:
+        return time.perf_counter() if self.mode == "precise" else time.time()
+
+    def admit(self, ev: Dict, lateness: float) -> bool:
+        if self.catch_up == "drop_moves" and ev.get("type") == "move" and lateness > self.stale_after:
+            self.stats.dropped += 1
+            return False
+        self.stats.add(lateness)
+        return True
+
+
+def _timeline(events: Iterable[Dict], speed: float = 1.0, max_gap: Optional[float] = None,
+              unthrottled: bool = False, min_spacing: float = 0.01) -> Iterator[Tuple[float, Dict]]:
+    # Maps recorded timestamps to playback offsets (seconds from pass start).
+    # Gaps between consecutive events are clamped to max_gap, then divided by
+    # speed. Unthrottled keeps only the order: moves go out back to back and
+    # clicks/scrolls/keys get min_spacing before and after them so the target
+    # application still sees distinct input.
+    prev_t = None
+    offset = 0.0
+    prev_discrete = False
+    for ev in events:
+        t = ev.get("t", 0.0)
+        discrete = ev.get("type") != "move"
+        if prev_t is not None:
+            if unthrottled:
+                gap = min_spacing if (discrete or prev_discrete) else 0.0
+            else:
+                gap = max(0.0, t - prev_t)
+                if max_gap is not None and gap > max_gap:
+                    gap = max_gap
+                gap /= speed
+            offset += gap
+        prev_t = t
+        prev_discrete = discrete
+        yield offset, ev
+
+
+def play_recording(json_path: str, loop: int = 1, interval: float = 1.0, pause: float = 0.0,
+                   scheduler: str = "precise", catch_up: str = "replay_all",
+                   speed: float = 1.0, max_gap: Optional[float] = None,
+                   unthrottled: bool = False, min_spacing: float = 0.01,
+                   backend: Union[str, InputBackend, None] = None) -> Dict:
+    # speed: 2.0 replays twice as fast; max_gap: idle gaps longer than this
+    # many (recorded) seconds are collapsed to it; unthrottled: ignore
+    # timestamps entirely, see _timeline.
+    if speed <= 0:
+        raise ValueError(f"speed must be positive, got {speed}")
+    if max_gap is not None and max_gap <= 0:
+        max_gap = None
+    out = get_backend(backend)
+    out.configure(pause)
+    sched = PlaybackScheduler(scheduler, catch_up)
+    # json_path may be an operations JSON or a binary .rec recording. Events are
+    # parsed lazily (playback starts with the first event) and JSON is parsed
+    # only once across loops, so memory stays constant for long recordings.
+    with trace.step("playback", path=json_path, loops=loop, backend=out.name):
+        for i, events in enumerate(iter_passes(json_path, loop)):
+            with trace.step("playback_pass", index=i) as st:
+                sched.start()
+                n = 0
+                for t, ev in _timeline(events, speed, max_gap, unthrottled, min_spacing):
+                    if _is_click_press(ev):
+                        continue  # sends nothing, so it is neither waited for nor counted as late
+                    if sched.admit(ev, sched.wait(t, out.flush)):
+                        if trace.enabled:
+                            t0 = time.perf_counter()
+                            _dispatch(ev, out)
+                            st.add_time("action_ms", time.perf_counter() - t0)
+                        else:
+                            _dispatch(ev, out)
+                        n += 1
+                out.flush()
+                if trace.enabled:
+                    rep = sched.stats.report()
+                    st.set(events=n, dropped=rep["dropped"], lateness_p99_ms=rep.get("p99_ms"))
+            if i < loop - 1:
+                time.sleep(interval)
+    return sched.stats.report()
+
+
+def _is_click_press(ev: Dict) -> bool:
+    # the press half of a recorded click; playback clicks on the release only
+    return ev.get("type") == "click" and bool(ev.get("pressed"))
+
+
+def _dispatch(ev: Dict, out: InputBackend):
+    et = ev.get("type")
+    if et == "move":
+        out.move(ev["x"], ev["y"])
+    elif et == "click":
+        if _is_click_press(ev):
+            # skip press event; act on release to avoid double action
+            return
+        btn = ev.get("button", "Button.left")
+        button = "left" if "left" in btn else ("right" if "right" in btn else "middle")
+        out.click(ev["x"], ev["y"], button=button)
+    elif et == "scroll":
+        out.scroll(ev.get("dy", 0), ev["x"], ev["y"])
+    elif et == "key":
+        key = ev.get("key")
+        action = ev.get("action")
+        if action == "press":
+            try:
+                out.key_down(key)
+            except Exception:
+                pass
+        elif action == "release":
+            try:
+                out.key_up(key)
+            except Exception:
+                pass
+    elif et == "hotkey":
+        keys = ev.get("keys", [])
+        if keys:
+            try:
+                out.hotkey(*keys)
+            except Exception:
+                pass
+
+
+def benchmark_backend(backend: Union[str, InputBackend], n: int = 2000) -> Dict:
+    # Injection throughput: n unthrottled moves on a small square around
+    # (100, 100), flushed once at the end like a batched playback run.
+    out = get_backend(backend)
+    points = [(100 + (i % 20), 100 + (i // 20) % 20) for i in range(n)]
+    t0 = time.perf_counter()
+    for x, y in points:
+        _dispatch({"type": "move", "x": x, "y": y}, out)
+    out.flush()
+    per_event = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    out.move_batch(points)
+    out.flush()
+    batched = time.perf_counter() - t0
+    return {
+        "backend": out.name,
+        "events": n,
+        "events_per_sec": n / per_event if per_event > 0 else float("inf"),
+        "batched_events_per_sec": n / batched if batched > 0 else float("inf"),
+    }
+
+
+def benchmark_backends(names: Iterable[str] = ("null", "pyautogui", "xtest"), n: int = 2000) -> List[Dict]:
+    # Backends that can't start here (module missing, no display) are
+    # reported with their error instead of aborting the comparison.
+    results = []
+    for name in names:
+        try:
+            out = get_backend(name)
+        except Exception as e:
+            results.append({"backend": name, "error": f"{type(e).__name__}: {e}"})
+            continue
+        try:
+            results.append(benchmark_backend(out, n))
+        except Exception as e:
+            results.append({"backend": name, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            out.close()
+    return results
+
+
+def simple_action(action: str, x: int, y: int, params: Optional[Dict] = None,
+                  backend: Union[str, InputBackend, None] = None):
     params = params or {}
+    out = get_backend(backend)
     if action == "click":
         button = params.get("button", "left")
         clicks = int(params.get("clicks", 1))
         interval = float(params.get("interval", 0.0))
-        pyautogui.click(x=x, y=y, button=button, clicks=clicks, interval=interval)
+        out.click(x, y, button=button, clicks=clicks, interval=interval)
     elif action == "double":
-        pyautogui.doubleClick(x, y)
+        out.click(x, y, clicks=2)
     elif action == "right_click":
-        pyautogui.click(x, y, button='right')
+        out.click(x, y, button='right')
     elif action == "move_duration":
         duration = float(params.get("duration", 0.3))
-        pyautogui.moveTo(x, y, duration=duration)
+        out.move(x, y, duration=duration)
     elif action == "long_press":
         button = params.get("button", "left")
         duration = float(params.get("duration", 0.5))
-        pyautogui.mouseDown(x=x, y=y, button=button)
+        out.mouse_down(x, y, button=button)
+        out.flush()
         time.sleep(duration)
-        pyautogui.mouseUp(x=x, y=y, button=button)
+        out.mouse_up(x, y, button=button)
     elif action == "drag":
         to_x = int(params.get("to_x", x))
         to_y = int(params.get("to_y", y))
         duration = float(params.get("duration", 0.2))
         button = params.get("button", "left")
-        pyautogui.moveTo(x, y)
-        pyautogui.dragTo(to_x, to_y, duration=duration, button=button)
+        out.drag(x, y, to_x, to_y, duration=duration, button=button)
     else:
         duration = float(params.get("duration", 0.1))
-        pyautogui.moveTo(x, y, duration=duration)
+        out.move(x, y, duration=duration)
+    out.flush()
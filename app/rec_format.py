@@ -0,0 +1,327 @@
+import json
+import os
+import re
+import struct
+import tempfile
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Compact binary recording (.rec):
+#   MAGIC (8 bytes) followed by fixed-size little-endian records
+#   code:u8 flag:u8 t:f64 x:i32 y:i32 a:i32 b:i32   (26 bytes)
+# Strings (button names, key names, hotkey key lists) are interned: the first
+# use emits a PAYLOAD record (a = byte length, followed by the UTF-8 bytes) and
+# later records refer to it by index in a. Records are self-contained in file
+# order, so a file can be read while it is still being written.
+MAGIC = b"PCOREC01"
+REC_EXT = ".rec"
+_RECORD = struct.Struct("<BBdiiii")
+
+PAYLOAD, MOVE, CLICK, SCROLL, KEY, HOTKEY = range(6)
+EVENT_TYPES = {"move", "click", "scroll", "key", "hotkey"}
+_KEY_ACTIONS = ("press", "release")
+
+
+def is_binary_recording(path: str) -> bool:
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class RecordingWriter:
+    def __init__(self, path: str, flush_every: int = 256):
+        self.path = path
+        self.flush_every = int(flush_every)
+        self._f = open(path, 'wb')
+        self._f.write(MAGIC)
+        self._buf = bytearray()
+        self._pending = 0
+        self._strings: Dict[str, int] = {}
+        self._lock = threading.Lock()  # mouse and keyboard listeners write concurrently
+        self.count = 0
+
+    def _intern(self, s: str) -> int:
+        idx = self._strings.get(s)
+        if idx is None:
+            raw = s.encode('utf-8')
+            idx = len(self._strings)
+            self._strings[s] = idx
+            self._buf += _RECORD.pack(PAYLOAD, 0, 0.0, 0, 0, len(raw), 0)
+            self._buf += raw
+        return idx
+
+    def write(self, ev: Dict):
+        with self._lock:
+            self._write(ev)
+
+    def _write(self, ev: Dict):
+        et = ev.get("type")
+        t = float(ev.get("t", 0.0))
+        x, y = int(round(ev.get("x", 0) or 0)), int(round(ev.get("y", 0) or 0))
+        if et == "move":
+            rec = _RECORD.pack(MOVE, 0, t, x, y, 0, 0)
+        elif et == "click":
+            rec = _RECORD.pack(CLICK, 1 if ev.get("pressed") else 0, t, x, y, self._intern(str(ev.get("button", "Button.left"))), 0)
+        elif et == "scroll":
+            rec = _RECORD.pack(SCROLL, 0, t, x, y, int(ev.get("dx", 0)), int(ev.get("dy", 0)))
+        elif et == "key":
+            flag = _KEY_ACTIONS.index(ev.get("action", "press"))
+            rec = _RECORD.pack(KEY, flag, t, 0, 0, self._intern(str(ev.get("key"))), 0)
+        elif et == "hotkey":
+            rec = _RECORD.pack(HOTKEY, 0, t, 0, 0, self._intern(json.dumps(ev.get("keys", []), ensure_ascii=False)), 0)
+        else:
+            raise ValueError(f"Unknown event type: {et}")
+        self._buf += rec
+        self.count += 1
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self._flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._f.closed:
+                self._flush()
+
+    def _flush(self):
+        if self._buf:
+            self._f.write(self._buf)
+            self._buf = bytearray()
+        self._f.flush()
+        self._pending = 0
+
+    def close(self):
+        with self._lock:
+            if self._f.closed:
+                return
+            self._flush()
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_binary_events(path: str, chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    strings: List[str] = []
+    size = _RECORD.size
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a binary recording: {path}")
+        buf = b""
+        pos = 0
+        while True:
+            if len(buf) - pos < size:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            code, flag, t, x, y, a, b = _RECORD.unpack_from(buf, pos)
+            pos += size
+            if code == PAYLOAD:
+                while len(buf) - pos < a:
+                    chunk = f.read(max(chunk_size, a))
+                    if not chunk:
+                        raise ValueError(f"Truncated recording: {path}")
+                    buf = buf[pos:] + chunk
+                    pos = 0
+                strings.append(buf[pos:pos + a].decode('utf-8'))
+                pos += a
+            elif code == MOVE:
+                yield {"type": "move", "x": x, "y": y, "t": t}
+            elif code == CLICK:
+                yield {"type": "click", "x": x, "y": y, "button": strings[a], "pressed": bool(flag), "t": t}
+            elif code == SCROLL:
+                yield {"type": "scroll", "x": x, "y": y, "dx": a, "dy": b, "t": t}
+            elif code == KEY:
+                yield {"type": "key", "action": _KEY_ACTIONS[flag], "key": strings[a], "t": t}
+            elif code == HOTKEY:
+                yield {"type": "hotkey", "keys": json.loads(strings[a]), "t": t}
+            else:
+                raise ValueError(f"Corrupt record (code {code}) in {path}")
+
+
+_WS = re.compile(r"[ \t\r\n]*")
+
+
+class _JsonStream:
+    # Minimal pull parser over a text file: raw_decode on a growing buffer
+    def __init__(self, f, chunk_size: int):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._f.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        # next non-whitespace character ('' at EOF)
+        while True:
+            self._pos = _WS.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str):
+        if self.peek() != ch:
+            raise ValueError(f"Malformed recording JSON: expected {ch!r} at offset {self._pos}")
+        self._pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(self._buf) or self._eof or not isinstance(obj, (int, float)):
+                    self._pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            if not self._fill():
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+                self._pos = end
+                return obj
+
+
+def iter_json_events(path: str, chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    # Yields the "events" of an operations JSON one by one without loading the
+    # whole document; other top-level keys are parsed and skipped.
+    with open(path, 'r', encoding='utf-8') as f:
+        js = _JsonStream(f, chunk_size)
+        js.expect("{")
+        if js.peek() == "}":
+            return
+        while True:
+            key = js.value()
+            js.expect(":")
+            if key == "events":
+                js.expect("[")
+                if js.peek() == "]":
+                    js.expect("]")
+                else:
+                    while True:
+                        yield js.value()
+                        if js.peek() == ",":
+                            js.expect(",")
+                            continue
+                        js.expect("]")
+                        break
+            else:
+                js.value()
+            if js.peek() == ",":
+                js.expect(",")
+                continue
+            js.expect("}")
+            return
+
+
+def iter_events(path: str) -> Iterator[Dict]:
+    # Events of a recording in either format (binary .rec or operations JSON),
+    # parsed lazily so playback can start before the file is fully read.
+    if is_binary_recording(path):
+        return iter_binary_events(path)
+    return iter_json_events(path)
+
+
+def iter_passes(path: str, passes: int) -> Iterator[Iterator[Dict]]:
+    # One event iterator per playback pass. Binary files are simply re-read.
+    # A JSON file is parsed once: the first pass tees its events into a
+    # temporary .rec spool and later passes stream the spool, so loops never
+    # re-parse JSON and memory stays constant.
+    if passes <= 1 or is_binary_recording(path):
+        for _ in range(passes):
+            yield iter_events(path)
+        return
+    fd, spool = tempfile.mkstemp(suffix=REC_EXT)
+    os.close(fd)
+    complete = False
+
+    def first_pass():
+        # The spool stores integer coordinates/scroll steps and the standard
+        # fields only; if any event would not survive that unchanged, later
+        # passes re-read the JSON instead so every loop replays the same events.
+        nonlocal complete
+        exact = True
+        with RecordingWriter(spool) as w:
+            for ev in iter_json_events(path):
+                if exact:
+                    exact = _stored_form(ev) == ev
+                    if exact:
+                        w.write(ev)
+                yield ev
+        complete = exact
+
+    try:
+        yield first_pass()
+        for _ in range(passes - 1):
+            yield iter_binary_events(spool) if complete else iter_json_events(path)
+    finally:
+        try:
+            os.remove(spool)
+        except OSError:
+            pass
+
+
+def _stored_form(ev: Dict) -> Optional[Dict]:
+    # The event as iter_binary_events would return it after a RecordingWriter round trip
+    et = ev.get("type")
+    t = float(ev.get("t", 0.0))
+    x, y = int(round(ev.get("x", 0) or 0)), int(round(ev.get("y", 0) or 0))
+    if et == "move":
+        return {"type": "move", "x": x, "y": y, "t": t}
+    if et == "click":
+        return {"type": "click", "x": x, "y": y, "button": str(ev.get("button", "Button.left")),
+                "pressed": bool(ev.get("pressed")), "t": t}
+    if et == "scroll":
+        return {"type": "scroll", "x": x, "y": y, "dx": int(ev.get("dx", 0)), "dy": int(ev.get("dy", 0)), "t": t}
+    if et == "key" and ev.get("action", "press") in _KEY_ACTIONS:
+        return {"type": "key", "action": ev.get("action", "press"), "key": str(ev.get("key")), "t": t}
+    if et == "hotkey":
+        return {"type": "hotkey", "keys": json.loads(json.dumps(ev.get("keys", []), ensure_ascii=False)), "t": t}
+    return None
+
+
+def json_to_binary(json_path: str, out_path: Optional[str] = None) -> str:
+    out_path = out_path or os.path.splitext(json_path)[0] + REC_EXT
+    with RecordingWriter(out_path) as w:
+        for ev in iter_events(json_path):
+            w.write(ev)
+    return out_path
+
+
+def write_json_events(out_path: str, events: Iterable[Dict]) -> int:
+    # Streams events out in the same layout as json.dump({"events": ...}, indent=2)
+    count = 0
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write('{\n  "events": [')
+        for ev in events:
+            body = json.dumps(ev, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+            f.write(("\n    " if count == 0 else ",\n    ") + body)
+            count += 1
+        f.write('\n  ]\n}' if count else ']\n}')
+    return count
+
+
+def binary_to_json(rec_path: str, out_path: Optional[str] = None) -> str:
+    out_path = out_path or os.path.splitext(rec_path)[0] + ".json"
+    write_json_events(out_path, iter_binary_events(rec_path))
+    return out_path
@@ -1,35 +1,129 @@
-import json
+import os
+import shutil
+import tempfile
+import threading
 import time
-from typing import List, Dict
+from collections import deque
+from time import perf_counter_ns
+from typing import List, Dict, Optional
 from pynput import mouse, keyboard
+from .move_filter import MoveCompressor
+from .rec_format import REC_EXT, RecordingWriter, binary_to_json, iter_binary_events
+
+
+# Raw callback records: (code, perf_counter_ns, ...) tuples
+_MOVE, _CLICK, _SCROLL, _PRESS, _RELEASE = range(5)
+_MODIFIERS = {'ctrl', 'alt', 'shift', 'win'}
 
 
 class Recorder:
-    def __init__(self):
-        self.events: List[Dict] = []
-        self._start_time = None
+    """Records mouse/keyboard input via pynput.
+
+    The listener callbacks run inside the OS input hook, so they only append
+    a raw tuple with a perf_counter_ns timestamp to a bounded deque (a
+    GIL-atomic append, no lock, no allocation beyond the tuple). A writer
+    thread drains it and does key-name normalization, hotkey folding, move
+    filtering and persistence. When the queue is full new input is dropped
+    and counted instead of blocking the hook; see stats().
+    """
+
+    def __init__(self, stream_to: Optional[str] = None, move_filter: Optional[MoveCompressor] = None,
+                 queue_size: int = 65536):
+        # stream_to: path of a binary .rec file written incrementally; without
+        # it events go to a temporary .rec spool, converted by save().
+        # move_filter: thins mouse moves as they are recorded.
+        self._stream_to = stream_to
+        self._spool: Optional[str] = None
+        self._writer: Optional[RecordingWriter] = None
+        self.move_filter = move_filter
+        self.queue_size = int(queue_size)
+        self._queue = deque()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._start_ns = 0
         self._mouse_listener = None
         self._kb_listener = None
-        self._mods = set()  # current modifiers: {'ctrl','alt','shift','win'}
+        self._mods = set()  # current modifiers: {'ctrl','alt','shift','win'}; writer thread only
+        self.dropped = 0
+        self.queued = 0
+        self.written = 0
+        self.max_depth = 0
 
-    def _ts(self):
-        return time.time() - self._start_time
+    # Listener callbacks (OS hook threads): push and return
+
+    def _push(self, rec: tuple):
+        q = self._queue
+        if len(q) >= self.queue_size:
+            self.dropped += 1
+            return
+        q.append(rec)
+        self.queued += 1
 
     def on_move(self, x, y):
-        self.events.append({"type": "move", "x": x, "y": y, "t": self._ts()})
+        self._push((_MOVE, perf_counter_ns(), x, y))
 
     def on_click(self, x, y, button, pressed):
-        self.events.append({
-            "type": "click",
-            "x": x,
-            "y": y,
-            "button": str(button),
-            "pressed": pressed,
-            "t": self._ts()
-        })
+        self._push((_CLICK, perf_counter_ns(), x, y, button, pressed))
 
     def on_scroll(self, x, y, dx, dy):
-        self.events.append({"type": "scroll", "x": x, "y": y, "dx": dx, "dy": dy, "t": self._ts()})
+        self._push((_SCROLL, perf_counter_ns(), x, y, dx, dy))
+
+    def on_press(self, key):
+        self._push((_PRESS, perf_counter_ns(), key))
+
+    def on_release(self, key):
+        self._push((_RELEASE, perf_counter_ns(), key))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "written": self.written,
+        }
+
+    # Writer thread
+
+    def _run(self):
+        q = self._queue
+        while True:
+            running = self._running
+            depth = len(q)
+            if depth > self.max_depth:
+                self.max_depth = depth
+            if depth:
+                for _ in range(depth):
+                    self._handle(q.popleft())
+            elif not running:
+                return
+            else:
+                time.sleep(0.005)
+
+    def _handle(self, rec: tuple):
+        code, ns = rec[0], rec[1]
+        t = (ns - self._start_ns) / 1e9
+        if code == _MOVE:
+            self._emit({"type": "move", "x": rec[2], "y": rec[3], "t": t})
+        elif code == _CLICK:
+            self._emit({"type": "click", "x": rec[2], "y": rec[3], "button": str(rec[4]), "pressed": rec[5], "t": t})
+        elif code == _SCROLL:
+            self._emit({"type": "scroll", "x": rec[2], "y": rec[3], "dx": rec[4], "dy": rec[5], "t": t})
+        elif code == _PRESS:
+            self._key_press(self._key_name(rec[2]), t)
+        else:
+            self._key_release(self._key_name(rec[2]), t)
+
+    def _emit(self, ev: Dict):
+        if self.move_filter is None:
+            self._store(ev)
+            return
+        for out in self.move_filter.feed(ev):
+            self._store(out)
+
+    def _store(self, ev: Dict):
+        self._writer.write(ev)
+        self.written += 1
 
     @staticmethod
     def _key_name(key) -> str:
@@ -56,9 +150,8 @@ class Recorder:
         # Ignore Alt+1/Alt+2/Alt+3 in recording
         return (self._mods == {'alt'} and main_key in {'1', '2', '3'})
 
-    def on_press(self, key):
-        name = self._key_name(key)
-        if name in {'ctrl', 'alt', 'shift', 'win'}:
+    def _key_press(self, name: str, t: float):
+        if name in _MODIFIERS:
             self._mods.add(name)
             # 不记录单独的修饰键按下，避免与 hotkey 事件重复
             return
@@ -68,23 +161,31 @@ class Recorder:
                 # Do not record the control hotkeys
                 return
             keys = sorted(list(self._mods)) + [name]
-            self.events.append({"type": "hotkey", "keys": keys, "t": self._ts()})
+            self._emit({"type": "hotkey", "keys": keys, "t": t})
         else:
-            self.events.append({"type": "key", "action": "press", "key": name, "t": self._ts()})
+            self._emit({"type": "key", "action": "press", "key": name, "t": t})
 
-    def on_release(self, key):
-        name = self._key_name(key)
-        if name in {'ctrl', 'alt', 'shift', 'win'}:
+    def _key_release(self, name: str, t: float):
+        if name in _MODIFIERS:
             if name in self._mods:
                 self._mods.remove(name)
             return
         # For non-modifier release, we can skip explicit release if we already recorded hotkey
         # Still record release for non-modifier singles
         if not self._mods:
-            self.events.append({"type": "key", "action": "release", "key": name, "t": self._ts()})
+            self._emit({"type": "key", "action": "release", "key": name, "t": t})
 
     def start(self):
-        self._start_time = time.time()
+        path = self._stream_to
+        if not path:
+            fd, path = tempfile.mkstemp(suffix=REC_EXT)
+            os.close(fd)
+            self._spool = path
+        self._writer = RecordingWriter(path)
+        self._start_ns = perf_counter_ns()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="recorder-writer", daemon=True)
+        self._thread.start()
         self._mouse_listener = mouse.Listener(
             on_move=self.on_move,
             on_click=self.on_click,
@@ -102,7 +203,41 @@ class Recorder:
             self._mouse_listener.stop()
         if self._kb_listener:
             self._kb_listener.stop()
+        if self._thread is not None:
+            # the writer drains whatever is queued before exiting
+            self._running = False
+            self._thread.join()
+            self._thread = None
+        if self._writer is not None:
+            if self.move_filter is not None:
+                for out in self.move_filter.flush():
+                    self._store(out)
+            self._writer.close()
+
+    @property
+    def events(self) -> List[Dict]:
+        # Everything recorded so far (read back from disk)
+        path = self._stream_to or self._spool
+        if not path or self._writer is None:
+            return []
+        self._writer.flush()
+        return list(iter_binary_events(path))
 
     def save(self, out_path: str):
-        with open(out_path, 'w', encoding='utf-8') as f:
-            json.dump({"events": self.events}, f, ensure_ascii=False, indent=2)
+        # .rec -> binary format, anything else -> operations JSON
+        src = self._stream_to or self._spool
+        if src is None:
+            raise RuntimeError("Nothing recorded")
+        if os.path.abspath(out_path) == os.path.abspath(src):
+            return
+        if out_path.lower().endswith(REC_EXT):
+            shutil.copyfile(src, out_path)
+        else:
+            binary_to_json(src, out_path)
+
+    def __del__(self):
+        if self._spool is not None:
+            try:
+                os.remove(self._spool)
+            except OSError:
+                pass
@@ -1,25 +1,245 @@
+import asyncio
+import functools
 import json
-from typing import List, Dict
-from .vision import locate_template_on_screen
+import threading
+import time
+from typing import Callable, List, Dict, Optional
+from . import trace
+from .vision import (FrameCache, IncrementalMatcher, grab_frame, locate_all_on_screen, locate_many,
+                     locate_template_on_screen, wait_for_matches, wait_for_template)
 from .player import simple_action
+from .plan import load_entries
 
 
-def run_sequence(sequence_json: str, threshold: float = 0.85):
-    with open(sequence_json, 'r', encoding='utf-8') as f:
-        steps: List[Dict] = json.load(f).get("steps", [])
-    for step in steps:
-        template = step["template"]
-        action = step.get("action", "click")
-        params = step.get("params", {})
-        preprocess = step.get("preprocess", "none")
-        multi_scale = bool(step.get("multi_scale", False))
-        found = locate_template_on_screen(template, threshold=threshold, preprocess=preprocess, multi_scale=multi_scale)
-        if found:
-            x, y = found["center"]
-            simple_action(action, x, y, params=params)
+def _multi_scale_mode(value):
+    # JSON stores true/false for the brute-force sweep or "pyramid" for coarse-to-fine
+    if isinstance(value, str):
+        return "pyramid" if value.lower() == "pyramid" else value.lower() in ("1", "true", "yes")
+    return bool(value)
 
 
-def add_sequence_step(sequence_json: str, template: str, action: str = "click", params: Dict = None, preprocess: str = "none", multi_scale: bool = False):
+def run_sequence(sequence_json: str, threshold: float = 0.85, backend=None) -> List[Dict]:
+    # sequence_json may also be a plan compiled by plan.compile_plan.
+    # A step with "wait": <seconds> polls until its template appears (see
+    # vision.wait_for_template); without it the step is checked once and
+    # skipped if not on screen. Returns one result per step. backend selects
+    # the player input backend (default: the process default).
+    steps: List[Dict] = load_entries(sequence_json, "sequence")
+    results: List[Dict] = []
+    with trace.step("sequence", path=sequence_json, steps=len(steps)):
+        for i, step in enumerate(steps):
+            with trace.step("sequence_step", index=i, template=step["template"]) as st:
+                results.append(_run_step(i, step, threshold, backend, st))
+    return results
+
+
+def _run_step(i: int, step: Dict, threshold: float, backend, st) -> Dict:
+    t0 = time.monotonic()
+    found, targets, count = _find_step(step, threshold)
+    result = _step_result(i, step, found, count, len(targets), t0, st)
+    if found:
+        _act_step(step, targets, backend, st)
+    return result
+
+
+def _find_step(step: Dict, threshold: float, matcher: Optional[IncrementalMatcher] = None,
+               stop: Optional[threading.Event] = None):
+    # Returns (first target or None, targets to act on, occurrences found).
+    # With a matcher, single-target steps re-match only what changed since the
+    # matcher last saw the step's search area.
+    template = step["template"]
+    preprocess = step.get("preprocess", "none")
+    multi_scale = _multi_scale_mode(step.get("multi_scale", False))
+    search_region = step.get("search_region")
+    wait = float(step.get("wait", 0) or 0)
+    nth = _nth_mode(step.get("nth"))
+    if nth is not None:
+        return _find_targets(step, template, nth, threshold, preprocess, multi_scale, search_region, wait, stop)
+    if wait > 0:
+        found = wait_for_template(
+            template, wait, threshold=threshold, preprocess=preprocess, multi_scale=multi_scale,
+            search_region=search_region,
+            poll=float(step.get("poll", 0.05)),
+            max_poll=float(step.get("max_poll", 1.0)),
+            backoff=float(step.get("backoff", 1.5)),
+            retries=_retries(step.get("retries")),
+            matcher=matcher,
+            stop=stop,
+        )
+    elif matcher is not None:
+        found = matcher.match(grab_frame(search_region), template, threshold=threshold, preprocess=preprocess,
+                              multi_scale=multi_scale, search_region=search_region)
+    else:
+        found = locate_template_on_screen(template, threshold=threshold, preprocess=preprocess, multi_scale=multi_scale, search_region=search_region)
+    return found, ([found] if found else []), (1 if found else 0)
+
+
+def _step_result(i: int, step: Dict, found, count: int, acted: int, t0: float, st) -> Dict:
+    result = {
+        "index": i,
+        "template": step["template"],
+        "found": bool(found),
+        "time_to_appear": found.get("time_to_appear", 0.0) if found else None,
+        "polls": found.get("polls", 1) if found else None,
+        "waited": time.monotonic() - t0,
+    }
+    if _nth_mode(step.get("nth")) is not None:
+        result["matches"] = count
+        result["acted"] = acted
+    st.set(action=step.get("action", "click"), found=result["found"], polls=result["polls"], matches=count)
+    if found:
+        st.set(score=found["score"], location=found["center"], scale=found["scale"])
+    return result
+
+
+def _act_step(step: Dict, targets: List[Dict], backend, st):
+    action = step.get("action", "click")
+    params = step.get("params", {})
+    t1 = time.perf_counter()
+    for target in targets:
+        x, y = target["center"]
+        simple_action(action, x, y, params=params, backend=backend)
+    st.add_time("action_ms", time.perf_counter() - t1)
+
+
+async def run_sequence_async(sequence_json: str, threshold: float = 0.85, backend=None, prefetch: bool = True,
+                             stop: Optional[threading.Event] = None,
+                             on_step: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    # Same steps and results as run_sequence, with the blocking work (capture,
+    # matching, waits, input) in the event loop's default executor. While the
+    # action of step N executes, step N+1's area is already captured and
+    # matched into a shared IncrementalMatcher; the real check after the action
+    # then only re-matches what the action changed (nothing if it did not touch
+    # that area), so results are the same as the serial runner's. "nth" steps
+    # are not prefetched (match_all has no incremental path).
+    #
+    # Cancelling the task, or setting stop, ends the run: a wait in progress
+    # returns at its next poll interval, an action in progress completes.
+    # on_step is called with each result as soon as its step is done.
+    steps: List[Dict] = load_entries(sequence_json, "sequence")
+    loop = asyncio.get_running_loop()
+    halt = stop if stop is not None else threading.Event()
+    matcher = IncrementalMatcher()
+    results: List[Dict] = []
+    ahead = None
+    try:
+        with trace.step("sequence", path=sequence_json, steps=len(steps), runner="async"):
+            for i, step in enumerate(steps):
+                if halt.is_set():
+                    raise asyncio.CancelledError()
+                with trace.step("sequence_step", index=i, template=step["template"]) as st:
+                    if ahead is not None:
+                        # the prefetch must land before the check that builds on it
+                        await ahead
+                        ahead = None
+                    t0 = time.monotonic()
+                    found, targets, count = await _offload(loop, _find_step, step, threshold, matcher, halt)
+                    if halt.is_set():
+                        # a wait cut short by stop is not a "not found"
+                        raise asyncio.CancelledError()
+                    result = _step_result(i, step, found, count, len(targets), t0, st)
+                    act = _offload(loop, _act_step, step, targets, backend, st) if found else None
+                    if prefetch and i + 1 < len(steps) and _nth_mode(steps[i + 1].get("nth")) is None:
+                        ahead = loop.run_in_executor(None, _prefetch_step, steps[i + 1], threshold, matcher)
+                    if act is not None:
+                        await act
+                results.append(result)
+                if on_step is not None:
+                    on_step(result)
+    except asyncio.CancelledError:
+        halt.set()
+        raise
+    finally:
+        if ahead is not None:
+            ahead.cancel()
+    return results
+
+
+def _offload(loop, fn, *args):
+    # run fn in the default executor as part of the current trace step
+    return loop.run_in_executor(None, functools.partial(trace.bind(fn), *args))
+
+
+def _prefetch_step(step: Dict, threshold: float, matcher: IncrementalMatcher):
+    # Speculative single check; errors (e.g. a missing template) surface again
+    # when the step itself runs.
+    with trace.step("prefetch", template=step["template"]):
+        try:
+            _find_step({**step, "wait": 0}, threshold, matcher)
+        except Exception:
+            pass
+
+
+def run_until_stopped(coro, stop: threading.Event):
+    # Blocking helper for worker threads: runs coro in a fresh event loop and
+    # cancels it once stop is set. Returns coro's result, or None if stopped.
+    async def main():
+        task = asyncio.ensure_future(coro)
+        while not task.done():
+            await asyncio.wait({task}, timeout=0.05)
+            if stop.is_set() and not task.done():
+                task.cancel()
+        try:
+            return task.result()
+        except asyncio.CancelledError:
+            return None
+
+    return asyncio.run(main())
+
+
+def _retries(value) -> Optional[int]:
+    # step "retries": max polls of a wait (JSON may hold it as a string)
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def _nth_mode(value):
+    # step "nth": an occurrence index in reading order (0 = first, -1 = last) or "all"
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        if value.lower() == "all":
+            return "all"
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"Invalid nth: {value!r}")
+    return value
+
+
+def _find_targets(step, template, nth, threshold, preprocess, multi_scale, search_region, wait, stop=None):
+    # One match_all pass (or a wait until enough occurrences are visible);
+    # returns (first target or None, targets to act on, occurrences found).
+    max_results = int(step.get("max_results", 100))
+    overlap = float(step.get("overlap", 0.3))
+    if wait > 0:
+        need = 1 if nth == "all" else (nth + 1 if nth >= 0 else -nth)
+        matches = wait_for_matches(
+            template, wait, min_count=need, threshold=threshold, preprocess=preprocess, multi_scale=multi_scale,
+            search_region=search_region,
+            poll=float(step.get("poll", 0.05)),
+            max_poll=float(step.get("max_poll", 1.0)),
+            backoff=float(step.get("backoff", 1.5)),
+            retries=_retries(step.get("retries")),
+            max_results=max_results, overlap=overlap, stop=stop,
+        )
+    else:
+        matches = locate_all_on_screen(template, threshold=threshold, preprocess=preprocess, multi_scale=multi_scale,
+                                       search_region=search_region, max_results=max_results, overlap=overlap)
+    targets = _pick(matches, nth)
+    return (targets[0] if targets else None), targets, len(matches)
+
+
+def _pick(matches: List[Dict], nth) -> List[Dict]:
+    # the occurrences a step's "nth" selects from matches in reading order
+    if nth == "all":
+        return matches
+    if -len(matches) <= nth < len(matches):
+        return [matches[nth]]
+    return []
+
+
+def add_sequence_step(sequence_json: str, template: str, action: str = "click", params: Dict = None, preprocess: str = "none", multi_scale: bool = False, search_region=None, wait: float = 0.0, nth=None):
     try:
         with open(sequence_json, 'r', encoding='utf-8') as f:
             data = json.load(f)
@@ -31,36 +251,264 @@ def add_sequence_step(sequence_json: str, template: str, action: str = "click",
     if preprocess and preprocess != "none":
         item["preprocess"] = preprocess
     if multi_scale:
-        item["multi_scale"] = True
+        item["multi_scale"] = _multi_scale_mode(multi_scale)
+    if search_region is not None:
+        item["search_region"] = search_region
+    if wait:
+        item["wait"] = float(wait)
+    if nth is not None:
+        item["nth"] = _nth_mode(nth)
     data.setdefault("steps", []).append(item)
     with open(sequence_json, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
-def run_conditionals(conditionals_json: str, threshold: float = 0.85):
-    with open(conditionals_json, 'r', encoding='utf-8') as f:
-        items: List[Dict] = json.load(f).get("items", [])
-    # choose highest priority among matched templates
-    matched: List[Dict] = []
-    for it in items:
-        template = it["template"]
-        preprocess = it.get("preprocess", "none")
-        multi_scale = bool(it.get("multi_scale", False))
-        res = locate_template_on_screen(template, threshold=threshold, preprocess=preprocess, multi_scale=multi_scale)
-        if res:
-            it = {**it, **res}
-            matched.append(it)
-    if not matched:
-        return
-    matched.sort(key=lambda x: x.get("priority", 1), reverse=True)
-    top = matched[0]
+def run_conditionals(conditionals_json: str, threshold: float = 0.85, cache: Optional[FrameCache] = None, max_age: float = 0.5, strategy: str = "exhaustive", matcher: Optional[IncrementalMatcher] = None, backend=None) -> Dict:
+    # strategy:
+    #   exhaustive     - match every item in one batch, then pick the highest priority hit
+    #   priority_first - match items in descending priority and stop at the first hit
+    # Polling callers can pass the same IncrementalMatcher every pass so that
+    # unchanged screen areas are not re-matched.
+    items: List[Dict] = load_entries(conditionals_json, "conditionals")
+    with trace.step("conditionals", path=conditionals_json, strategy=strategy, items=len(items)) as st:
+        stats = _decide(items, threshold, cache, max_age, strategy, matcher, backend, st)
+        st.set(evaluated=stats["evaluated"], matched=stats["matched"], selected=stats["selected"])
+    return stats
+
+
+def _decide(items, threshold, cache, max_age, strategy, matcher, backend, st) -> Dict:
+    # one screenshot (and its gray/preprocessed variants) serves the whole decision pass
+    if cache is None:
+        cache = FrameCache(max_age=max_age)
+    top, stats = _choose(items, threshold, cache.get(), strategy, matcher)
+    if top is not None:
+        _act_top(top, backend, st)
+    return stats
+
+
+def _choose(items, threshold, frame, strategy, matcher, parallel=True):
+    specs = [{**it, "multi_scale": _multi_scale_mode(it.get("multi_scale", False))} for it in items]
+    if strategy == "priority_first":
+        top, evaluated, matched = None, 0, 0
+        # stable sort keeps file order among equal priorities, same as exhaustive
+        for i in sorted(range(len(items)), key=lambda i: items[i].get("priority", 1), reverse=True):
+            evaluated += 1
+            res = locate_many([specs[i]], frame=frame, threshold=threshold, matcher=matcher, parallel=parallel)[0]
+            if res:
+                matched = 1
+                top = {**items[i], **res}
+                break
+    elif strategy == "exhaustive":
+        results = locate_many(specs, frame=frame, threshold=threshold, matcher=matcher, parallel=parallel)
+        top = _select_top(items, results)
+        evaluated, matched = len(items), sum(1 for r in results if r)
+    else:
+        raise ValueError(f"Unknown strategy: {strategy}")
+    stats = {
+        "strategy": strategy,
+        "items": len(items),
+        "evaluated": evaluated,
+        "matched": matched,
+        "selected": top["template"] if top else None,
+    }
+    return top, stats
+
+
+def _act_top(top: Dict, backend, st):
     x, y = top["center"]
     action = top.get("action", "click")
     params = top.get("params", {})
-    simple_action(action, x, y, params=params)
+    st.set(score=top["score"], location=top["center"], action=action)
+    t1 = time.perf_counter()
+    simple_action(action, x, y, params=params, backend=backend)
+    st.add_time("action_ms", time.perf_counter() - t1)
+
+
+async def run_conditionals_async(conditionals_json: str, threshold: float = 0.85, strategy: str = "exhaustive",
+                                 passes: int = 1, interval: float = 0.0, prefetch: bool = True, backend=None,
+                                 stop: Optional[threading.Event] = None,
+                                 on_pass: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    # `passes` decision passes (see run_conditionals), `interval` seconds
+    # apart, with capture, matching and input in the default executor and one
+    # IncrementalMatcher shared by all passes. While a pass's action executes,
+    # the next pass's capture and matching already run, so the next decision
+    # only re-matches what changed since. Cancellation works as in
+    # run_sequence_async. Returns the stats of every completed pass.
+    items: List[Dict] = load_entries(conditionals_json, "conditionals")
+    if strategy not in ("exhaustive", "priority_first"):
+        raise ValueError(f"Unknown strategy: {strategy}")
+    loop = asyncio.get_running_loop()
+    halt = stop if stop is not None else threading.Event()
+    matcher = IncrementalMatcher()
+    results: List[Dict] = []
+    ahead = None
+    try:
+        for n in range(max(1, int(passes))):
+            if halt.is_set():
+                raise asyncio.CancelledError()
+            if n and interval > 0:
+                await asyncio.sleep(interval)
+            with trace.step("conditionals", path=conditionals_json, strategy=strategy, items=len(items), runner="async") as st:
+                if ahead is not None:
+                    await ahead
+                    ahead = None
+                top, stats = await _offload(loop, _choose_now, items, threshold, strategy, matcher)
+                st.set(evaluated=stats["evaluated"], matched=stats["matched"], selected=stats["selected"])
+                act = _offload(loop, _act_top, top, backend, st) if top is not None else None
+                if prefetch and n + 1 < passes:
+                    ahead = loop.run_in_executor(None, _choose_now, items, threshold, strategy, matcher)
+                if act is not None:
+                    await act
+            results.append(stats)
+            if on_pass is not None:
+                on_pass(stats)
+    except asyncio.CancelledError:
+        halt.set()
+        raise
+    finally:
+        if ahead is not None:
+            ahead.cancel()
+    return results
+
+
+def _choose_now(items, threshold, strategy, matcher):
+    return _choose(items, threshold, grab_frame(), strategy, matcher)
+
+
+def watch_conditionals(conditionals_json: str, threshold: float = 0.85, tick_rate: float = 5.0,
+                       budget: Optional[float] = None, cooldown: float = 1.0, max_ticks: Optional[int] = None,
+                       duration: Optional[float] = None, max_actions: Optional[int] = None,
+                       until: Optional[str] = None, backend=None, stop: Optional[threading.Event] = None,
+                       on_tick: Optional[Callable[[Dict], None]] = None) -> Dict:
+    # Daemon mode of run_conditionals: one decision per tick, at most
+    # tick_rate ticks per second. Each tick captures one frame and matches
+    # priority levels from high to low (the items of a level as one
+    # locate_many batch); the first level with a hit fires its best item, so
+    # the choice is the same as run_conditionals'. Once a tick has spent its
+    # budget (seconds of capture + matching, default 80% of the tick period)
+    # the remaining lower levels are skipped for that tick; the top level is
+    # always matched. An item that fired is left out for its cooldown (its
+    # "cooldown" field, else the default). Capture buffers, the template store
+    # and one IncrementalMatcher carry over between ticks, so a tick on an
+    # unchanged screen costs a capture and a tile diff.
+    # Ends when stop is set, after max_ticks / duration seconds / max_actions,
+    # or when the `until` template is on screen. Returns tick statistics.
+    items: List[Dict] = load_entries(conditionals_json, "conditionals")
+    specs = [{**it, "multi_scale": _multi_scale_mode(it.get("multi_scale", False))} for it in items]
+    levels: List[List[int]] = []
+    for i in sorted(range(len(items)), key=lambda i: items[i].get("priority", 1), reverse=True):
+        if levels and items[levels[-1][0]].get("priority", 1) == items[i].get("priority", 1):
+            levels[-1].append(i)
+        else:
+            levels.append([i])
+    period = 1.0 / tick_rate if tick_rate and tick_rate > 0 else 0.0
+    if budget is None and period:
+        budget = 0.8 * period
+    stop = stop or threading.Event()
+    matcher = IncrementalMatcher()
+    ready_at = [0.0] * len(items)
+    fired: Dict[str, int] = {}
+    ticks = actions = over_budget = overruns = skipped = cooling = evaluated_total = 0
+    work_total = cpu_total = used_max = 0.0
+    reason = "stopped"
+    t_start = time.monotonic()
+    next_tick = t_start
+    while True:
+        if stop.is_set():
+            break
+        if max_ticks is not None and ticks >= max_ticks:
+            reason = "max_ticks"
+            break
+        if duration is not None and time.monotonic() - t_start >= duration:
+            reason = "duration"
+            break
+        if max_actions is not None and actions >= max_actions:
+            reason = "max_actions"
+            break
+        with trace.step("conditionals_tick", tick=ticks) as st:
+            t0 = time.perf_counter()
+            c0 = time.process_time()
+            frame = grab_frame(reuse_buffer=True)
+            if until and matcher.match(frame, until, threshold=threshold):
+                reason = "until"
+                break
+            now = time.monotonic()
+            top, top_i, evaluated, tick_skipped = None, None, 0, 0
+            for n, level in enumerate(levels):
+                if budget is not None and evaluated and time.perf_counter() - t0 >= budget:
+                    tick_skipped = sum(len(lv) for lv in levels[n:])
+                    break
+                live = [i for i in level if ready_at[i] <= now]
+                cooling += len(level) - len(live)
+                if not live:
+                    continue
+                results = locate_many([specs[i] for i in live], frame=frame, threshold=threshold, matcher=matcher)
+                evaluated += len(live)
+                hit = next(((i, r) for i, r in zip(live, results) if r), None)
+                if hit is not None:
+                    top_i, top = hit[0], {**items[hit[0]], **hit[1]}
+                    break
+            work = time.perf_counter() - t0
+            cpu = time.process_time() - c0
+            st.set(evaluated=evaluated, skipped=tick_skipped, selected=top["template"] if top else None)
+            if top is not None:
+                _act_top(top, backend, st)
+                ready_at[top_i] = time.monotonic() + float(items[top_i].get("cooldown", cooldown))
+                fired[top["template"]] = fired.get(top["template"], 0) + 1
+                actions += 1
+        ticks += 1
+        evaluated_total += evaluated
+        skipped += tick_skipped
+        work_total += work
+        cpu_total += cpu
+        if budget:
+            used_max = max(used_max, work / budget)
+            over_budget += work > budget
+        if on_tick is not None:
+            on_tick({"tick": ticks - 1, "selected": top["template"] if top else None, "evaluated": evaluated,
+                     "skipped": tick_skipped, "work_ms": work * 1000.0})
+        if period:
+            next_tick += period
+            remaining = next_tick - time.monotonic()
+            if remaining > 0:
+                stop.wait(remaining)
+            else:
+                # late: start the next tick now instead of bursting to catch up
+                overruns += 1
+                next_tick = time.monotonic()
+    elapsed = time.monotonic() - t_start
+    return {
+        "ticks": ticks,
+        "elapsed": elapsed,
+        "tick_rate": tick_rate,
+        "ticks_per_s": ticks / elapsed if elapsed > 0 else 0.0,
+        "overruns": overruns,
+        "budget": budget,
+        "budget_used_mean": work_total / ticks / budget if ticks and budget else None,
+        "budget_used_max": used_max if budget else None,
+        "over_budget": over_budget,
+        "work_ms_mean": work_total / ticks * 1000.0 if ticks else 0.0,
+        "cpu_ms_mean": cpu_total / ticks * 1000.0 if ticks else 0.0,
+        "evaluated": evaluated_total,
+        "skipped": skipped,
+        "cooling": cooling,
+        "actions": actions,
+        "fired": fired,
+        "matcher": dict(matcher.counts),
+        "stop_reason": reason,
+    }
+
+
+def _select_top(items: List[Dict], results: List[Optional[Dict]]) -> Optional[Dict]:
+    # highest priority wins; ties keep file order
+    top = None
+    for it, res in zip(items, results):
+        if res and (top is None or it.get("priority", 1) > top.get("priority", 1)):
+            top = {**it, **res}
+    return top
 
 
-def add_conditional_item(conditionals_json: str, template: str, action: str = "click", priority: int = 1, params: Dict = None, preprocess: str = "none", multi_scale: bool = False):
+def add_conditional_item(conditionals_json: str, template: str, action: str = "click", priority: int = 1, params: Dict = None, preprocess: str = "none", multi_scale: bool = False, search_region=None):
     try:
         with open(conditionals_json, 'r', encoding='utf-8') as f:
             data = json.load(f)
@@ -72,7 +520,9 @@ def add_conditional_item(conditionals_json: str, template: str, action: str = "c
     if preprocess and preprocess != "none":
         item["preprocess"] = preprocess
     if multi_scale:
-        item["multi_scale"] = True
+        item["multi_scale"] = _multi_scale_mode(multi_scale)
+    if search_region is not None:
+        item["search_region"] = search_region
     data.setdefault("items", []).append(item)
     with open(conditionals_json, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,327 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .player import InputBackend, RecordingBackend, play_recording, set_backend
+from .plan import detect_kind, is_plan
+from .vision import GrabLatency, set_capture_session
+
+# Headless simulation: a FrameSource stands in for the mss CaptureSession
+# (vision.set_capture_session) and an ActionLog stands in for the input
+# backend (player.set_backend), so sequences, conditionals and recordings run
+# unchanged on machines without a display.
+
+
+class FrameSource(GrabLatency):
+    """Base class for simulated screens; same surface as vision.CaptureSession.
+
+    Frames are full virtual-screen BGR images with the origin at (0, 0).
+    With fps=None every grab advances one frame; with fps the frame is chosen
+    by the time elapsed since the first grab, so waits and polling behave as
+    they would against a live screen.
+    """
+
+    def __init__(self, fps: Optional[float] = None, loop: bool = False, history: int = 1024):
+        self.fps = fps
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._init_latency(history)
+        self._t0: Optional[float] = None
+        self._index = 0
+        self.grabs = 0
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def frame_at(self, index: int) -> np.ndarray:
+        raise NotImplementedError
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        h, w = self.frame_at(0).shape[:2]
+        return w, h
+
+    @property
+    def monitors(self) -> List[Dict]:
+        w, h = self.size
+        m = {"left": 0, "top": 0, "width": w, "height": h}
+        return [m, dict(m)]
+
+    def _next_index(self) -> int:
+        n = len(self)
+        if self.fps:
+            now = time.perf_counter()
+            if self._t0 is None:
+                self._t0 = now
+            i = int((now - self._t0) * self.fps)
+        else:
+            i = self._index
+            self._index += 1
+        return i % n if self.loop else min(i, n - 1)
+
+    def grab(self, monitor: Optional[Dict] = None, reuse_buffer: bool = False) -> np.ndarray:
+        t0 = time.perf_counter()
+        with self._lock:
+            img = self.frame_at(self._next_index())
+            self.grabs += 1
+        if monitor is not None:
+            h, w = img.shape[:2]
+            x0, y0 = max(0, monitor["left"]), max(0, monitor["top"])
+            x1, y1 = min(w, monitor["left"] + monitor["width"]), min(h, monitor["top"] + monitor["height"])
+            img = img[y0:y1, x0:x1]
+        # callers may keep or modify the frame, so never hand out our own array
+        frame = np.ascontiguousarray(img).copy()
+        self._record_latency(time.perf_counter() - t0)
+        return frame
+
+    def rewind(self):
+        with self._lock:
+            self._index = 0
+            self._t0 = None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ImageFrames(FrameSource):
+    # PNG/JPG screenshots played in order: a directory, a glob or a list of paths
+    def __init__(self, images: Union[str, Sequence[str]], fps: Optional[float] = None, loop: bool = False):
+        super().__init__(fps, loop)
+        if isinstance(images, str):
+            if os.path.isdir(images):
+                images = sorted(p for ext in ("png", "jpg", "jpeg", "bmp")
+                                for p in glob.glob(os.path.join(images, f"*.{ext}")))
+            else:
+                images = sorted(glob.glob(images)) or [images]
+        self._frames: List[np.ndarray] = []
+        for p in images:
+            img = cv2.imread(p, cv2.IMREAD_COLOR)
+            if img is None:
+                raise FileNotFoundError(f"Frame image not found: {p}")
+            self._frames.append(img)
+        if not self._frames:
+            raise ValueError("No frame images given")
+
+    def __len__(self):
+        return len(self._frames)
+
+    def frame_at(self, index):
+        return self._frames[index]
+
+
+class VideoFrames(FrameSource):
+    # Frames decoded from a video file up front (max_frames caps memory), so
+    # grabs cost a copy, not a decode. native_fps is the file's frame rate;
+    # pass fps=src.native_fps to replay in real time.
+    def __init__(self, path: str, fps: Optional[float] = None, loop: bool = False, max_frames: int = 10000):
+        super().__init__(fps, loop)
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise FileNotFoundError(f"Cannot open video: {path}")
+        self.native_fps = cap.get(cv2.CAP_PROP_FPS) or None
+        self._frames: List[np.ndarray] = []
+        try:
+            while len(self._frames) < max_frames:
+                ok, img = cap.read()
+                if not ok:
+                    break
+                self._frames.append(img)
+        finally:
+            cap.release()
+        if not self._frames:
+            raise ValueError(f"No frames decoded from {path}")
+
+    def __len__(self):
+        return len(self._frames)
+
+    def frame_at(self, index):
+        return self._frames[index]
+
+
+class SyntheticFrames(FrameSource):
+    """A generated screen: a background with template images pasted on it.
+
+    Each sprite is {"image": path or BGR array, "x", "y", "appear", "vanish"};
+    appear/vanish are frame indices (grabs, or seconds * fps), so a sprite can
+    show up late to exercise waits. Composited frames are cached per set of
+    visible sprites.
+    """
+
+    def __init__(self, size: Tuple[int, int] = (1280, 720), sprites: Sequence[Dict] = (),
+                 fps: Optional[float] = None, background: Tuple[int, int, int] = (40, 40, 40), noise: int = 8):
+        super().__init__(fps, loop=False)
+        w, h = size
+        rng = np.random.default_rng(0)
+        self._background = np.clip(
+            np.array(background, dtype=np.int16) + rng.integers(-noise, noise + 1, (h, w, 1), dtype=np.int16) if noise
+            else np.broadcast_to(np.array(background, dtype=np.int16), (h, w, 3)),
+            0, 255).astype(np.uint8)
+        self._sprites: List[Dict] = []
+        for sp in sprites:
+            img = sp["image"]
+            if isinstance(img, str):
+                path = img
+                img = cv2.imread(path, cv2.IMREAD_COLOR)
+                if img is None:
+                    raise FileNotFoundError(f"Sprite image not found: {path}")
+            self._sprites.append({**sp, "image": img, "appear": int(sp.get("appear", 0)), "vanish": sp.get("vanish")})
+        self._cache: Dict[Tuple[int, ...], np.ndarray] = {}
+
+    def __len__(self):
+        # the screen stops changing after the last appear/vanish
+        marks = [sp["appear"] for sp in self._sprites] + [int(sp["vanish"]) for sp in self._sprites if sp["vanish"] is not None]
+        return max(marks, default=0) + 1
+
+    @property
+    def size(self):
+        h, w = self._background.shape[:2]
+        return w, h
+
+    def frame_at(self, index):
+        visible = tuple(i for i, sp in enumerate(self._sprites)
+                        if sp["appear"] <= index and (sp["vanish"] is None or index < int(sp["vanish"])))
+        img = self._cache.get(visible)
+        if img is None:
+            img = self._background.copy()
+            H, W = img.shape[:2]
+            for i in visible:
+                sp = self._sprites[i]
+                x, y = int(sp["x"]), int(sp["y"])
+                h, w = sp["image"].shape[:2]
+                h, w = min(h, H - y), min(w, W - x)
+                if h > 0 and w > 0:
+                    img[y:y + h, x:x + w] = sp["image"][:h, :w]
+            self._cache[visible] = img
+        return img
+
+    @classmethod
+    def for_entries(cls, path: str, size: Tuple[int, int] = (1280, 720), stagger: int = 0,
+                    fps: Optional[float] = None, margin: int = 16) -> "SyntheticFrames":
+        # A screen on which every template of a sequence/conditionals file (or
+        # the source of a compiled plan) is visible, laid out left to right in
+        # rows. With stagger, entry i appears at frame i * stagger.
+        from .plan import Plan, resolve_template_path
+        if is_plan(path):
+            path = Plan(path).source
+        base_dir = os.path.dirname(os.path.abspath(path))
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        entries = data.get("steps", data.get("items", []))
+        sprites, x, y, row_h = [], margin, margin, 0
+        seen: Dict[str, Dict] = {}
+        for i, e in enumerate(entries):
+            src = resolve_template_path(e["template"], base_dir)
+            if src in seen:
+                continue
+            img = cv2.imread(src, cv2.IMREAD_COLOR)
+            if img is None:
+                raise FileNotFoundError(f"Template not found: {src}")
+            h, w = img.shape[:2]
+            if x + w + margin > size[0]:
+                x, y, row_h = margin, y + row_h + margin, 0
+            if y + h + margin > size[1]:
+                raise ValueError(f"Templates of {path} do not fit on a {size[0]}x{size[1]} screen")
+            seen[src] = {"image": img, "x": x, "y": y, "appear": i * stagger}
+            sprites.append(seen[src])
+            x += w + margin
+            row_h = max(row_h, h)
+        return cls(size, sprites, fps=fps)
+
+
+class ActionLog(RecordingBackend):
+    # Input sink for simulations: records each call with its time since the
+    # log was created (seconds) and optionally echoes it.
+    name = "log"
+
+    def __init__(self, echo: bool = False, on_action: Optional[Callable[[float, Tuple], None]] = None):
+        super().__init__()
+        self.echo = echo
+        self.on_action = on_action
+        self.times: List[float] = []
+        self._t0 = time.perf_counter()
+
+    def _record(self, call):
+        t = time.perf_counter() - self._t0
+        self.calls.append(call)
+        self.times.append(t)
+        if self.echo:
+            print(f"[sim {t:8.3f}s] {call}")
+        if self.on_action is not None:
+            self.on_action(t, call)
+
+    def actions(self, kind: Optional[str] = None) -> List[Tuple]:
+        return [c for c in self.calls if kind is None or c[0] == kind]
+
+    def write_jsonl(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            for t, c in zip(self.times, self.calls):
+                f.write(json.dumps({"t": round(t, 6), "action": c[0], "args": list(c[1:])}, ensure_ascii=False) + "\n")
+
+
+@contextmanager
+def simulate(frames: Optional[FrameSource] = None, sink: Optional[InputBackend] = None) -> Iterator[InputBackend]:
+    # Within the block every capture comes from frames (when given) and every
+    # action goes to sink (an ActionLog by default), process-wide: run_sequence,
+    # run_conditionals, play_recording and the GUI workers all pick them up.
+    sink = sink if sink is not None else ActionLog()
+    prev_session = set_capture_session(frames) if frames is not None else None
+    prev_backend = set_backend(sink)
+    try:
+        yield sink
+    finally:
+        set_backend(prev_backend)
+        if frames is not None:
+            set_capture_session(prev_session)
+
+
+def dry_run(path: str, frames: Optional[FrameSource] = None, kind: str = "auto", loops: int = 1,
+            sink: Optional[ActionLog] = None, **kwargs) -> Dict:
+    # Runs a sequence, a conditionals pass or a recording headlessly `loops`
+    # times and reports timings. Sequences/conditionals without frames get a
+    # SyntheticFrames.for_entries screen (every template visible). kwargs go
+    # to run_sequence / run_conditionals / play_recording.
+    from .sequence_modes import run_conditionals, run_sequence
+    kind = detect_kind(path) if kind == "auto" else kind
+    if kind != "recording" and frames is None:
+        frames = SyntheticFrames.for_entries(path)
+    sink = sink if sink is not None else ActionLog()
+    durations, result = [], None
+    with simulate(frames, sink):
+        for _ in range(max(1, int(loops))):
+            if frames is not None:
+                frames.rewind()
+            t0 = time.perf_counter()
+            if kind == "sequence":
+                result = run_sequence(path, **kwargs)
+            elif kind == "conditionals":
+                result = run_conditionals(path, **kwargs)
+            elif kind == "recording":
+                result = play_recording(path, **kwargs)
+            else:
+                raise ValueError(f"Unknown kind: {kind}")
+            durations.append(time.perf_counter() - t0)
+    return {
+        "kind": kind,
+        "loops": len(durations),
+        "total_s": sum(durations),
+        "mean_s": sum(durations) / len(durations),
+        "min_s": min(durations),
+        "max_s": max(durations),
+        "actions": len(sink.calls),
+        "grabs": frames.grabs if frames is not None else 0,
+        "capture": frames.latency_stats() if frames is not None else {},
+        "last_result": result,
+    }
@@ -0,0 +1,248 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Structured run traces. Instrumented code opens a step:
+#
+#     with trace.step("sequence_step", index=i) as st:
+#         ...
+#         st.set(score=0.97)
+#
+# and lower layers (capture, preprocess, matching) add their timings to the
+# innermost open step of the current thread via trace.add_time / add_scale.
+# When a step closes, one flat event dict is handed to every sink.
+#
+# With no sink installed `enabled` is False, step() returns a shared no-op
+# object and the helpers return immediately, so the hot paths only pay for a
+# module attribute check.
+
+enabled = False
+_sinks: List["Sink"] = []
+_sinks_lock = threading.Lock()
+_local = threading.local()
+_ids = iter(range(1, 1 << 62))
+_ids_lock = threading.Lock()
+
+
+class Sink:
+    def emit(self, event: Dict):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonlSink(Sink):
+    # One JSON object per line; flushed per event so a crashed run keeps its trace
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self._f = open(path, 'a' if append else 'w', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            self._f.write(line + "\n")
+            self._f.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._f.closed:
+                self._f.close()
+
+
+class RingBufferSink(Sink):
+    # Keeps the last `capacity` events in memory
+    def __init__(self, capacity: int = 10000):
+        self._events = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        with self._lock:
+            self._events.append(event)
+
+    def events(self, kind: Optional[str] = None) -> List[Dict]:
+        with self._lock:
+            return [e for e in self._events if kind is None or e["kind"] == kind]
+
+    def slowest(self, n: int = 5, kind: Optional[str] = None) -> List[Dict]:
+        return sorted(self.events(kind), key=lambda e: e.get("total_ms", 0.0), reverse=True)[:n]
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+
+class ConsoleSink(Sink):
+    # One line per event on stdout (the GUI console when running in the GUI)
+    def __init__(self, kinds: Optional[List[str]] = None, write: Callable[[str], None] = print):
+        self.kinds = set(kinds) if kinds else None
+        self._write = write
+
+    def emit(self, event):
+        if self.kinds is not None and event["kind"] not in self.kinds:
+            return
+        skip = {"kind", "id", "parent", "ts", "scales"}
+        parts = []
+        for k, v in event.items():
+            if k in skip:
+                continue
+            parts.append(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}")
+        self._write(f"[trace] {event['kind']} " + " ".join(parts))
+
+
+def add_sink(sink: Sink) -> Sink:
+    global enabled
+    with _sinks_lock:
+        _sinks.append(sink)
+        enabled = True
+    return sink
+
+
+def remove_sink(sink: Sink):
+    global enabled
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+        enabled = bool(_sinks)
+
+
+@contextmanager
+def tracing(*sinks: Sink) -> Iterator[None]:
+    # Install sinks for the duration of a block; they are closed afterwards
+    for s in sinks:
+        add_sink(s)
+    try:
+        yield
+    finally:
+        for s in sinks:
+            remove_sink(s)
+            s.close()
+
+
+def _emit(event: Dict):
+    with _sinks_lock:
+        sinks = list(_sinks)
+    for s in sinks:
+        try:
+            s.emit(event)
+        except Exception as e:
+            print(f"trace sink {type(s).__name__} failed: {e}")
+
+
+class Step:
+    __slots__ = ("kind", "fields", "id", "parent", "_t0", "_lock", "_prev")
+
+    def __init__(self, kind: str, fields: Dict):
+        self.kind = kind
+        self.fields = fields
+        with _ids_lock:
+            self.id = next(_ids)
+        self.parent: Optional[Step] = None
+        self._lock = threading.Lock()
+        self._t0 = 0.0
+        self._prev = None
+
+    def set(self, **fields):
+        with self._lock:
+            self.fields.update(fields)
+
+    def add_time(self, key: str, seconds: float):
+        ms = seconds * 1000.0
+        with self._lock:
+            self.fields[key] = self.fields.get(key, 0.0) + ms
+
+    def add_scale(self, scale, seconds: float, score: Optional[float]):
+        entry = {"scale": scale, "ms": seconds * 1000.0, "score": score}
+        with self._lock:
+            self.fields.setdefault("scales", []).append(entry)
+            self.fields["match_ms"] = self.fields.get("match_ms", 0.0) + entry["ms"]
+
+    def __enter__(self):
+        self._prev = getattr(_local, "step", None)
+        self.parent = self._prev
+        _local.step = self
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        total = time.perf_counter() - self._t0
+        _local.step = self._prev
+        event = {
+            "kind": self.kind,
+            "id": self.id,
+            "parent": self.parent.id if self.parent is not None else None,
+            "ts": time.time(),
+        }
+        with self._lock:
+            event.update(self.fields)
+        event["total_ms"] = total * 1000.0
+        if exc_type is not None:
+            event["error"] = f"{exc_type.__name__}: {exc}"
+        _emit(event)
+        return False
+
+
+class _NullStep:
+    __slots__ = ()
+
+    def set(self, **fields):
+        pass
+
+    def add_time(self, key, seconds):
+        pass
+
+    def add_scale(self, scale, seconds, score):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STEP = _NullStep()
+
+
+def step(kind: str, **fields):
+    if not enabled:
+        return NULL_STEP
+    return Step(kind, fields)
+
+
+def current():
+    # innermost open step of this thread (NULL_STEP when none or disabled)
+    if not enabled:
+        return NULL_STEP
+    return getattr(_local, "step", None) or NULL_STEP
+
+
+def add_time(key: str, seconds: float):
+    if enabled:
+        st = getattr(_local, "step", None)
+        if st is not None:
+            st.add_time(key, seconds)
+
+
+def bind(fn: Callable) -> Callable:
+    # Run fn in another thread (e.g. a pool worker) as part of the caller's
+    # current step, so timings measured there are attributed to it.
+    if not enabled:
+        return fn
+    st = getattr(_local, "step", None)
+    if st is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        prev = getattr(_local, "step", None)
+        _local.step = st
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.step = prev
+
+    return bound
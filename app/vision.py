@@ -1,23 +1,426 @@
 import os
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
-from typing import Optional, Tuple, Dict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 import mss
 
+from . import trace
+
 
 def pil_to_cv(img_pil):
     return cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
 
 
-def take_screenshot_cv() -> np.ndarray:
-    # Use mss to capture the full virtual screen to avoid Pillow/pyscreeze issues
-    with mss.mss() as sct:
-        monitor = sct.monitors[0]  # full virtual screen
+class GrabLatency:
+    """Rolling window of grab latencies with percentile reporting.
+
+    Shared by CaptureSession and the simulated frame sources; subclasses call
+    _init_latency() in __init__ and _record_latency() after each grab.
+    """
+
+    def _init_latency(self, history: int):
+        self._latencies = deque(maxlen=history)
+        self._latency_lock = threading.Lock()
+
+    def _record_latency(self, seconds: float):
+        with self._latency_lock:
+            self._latencies.append(seconds)
+
+    def latency_stats(self) -> Dict[str, float]:
+        with self._latency_lock:
+            samples = np.array(self._latencies, dtype=np.float64) * 1000.0
+        if samples.size == 0:
+            return {"count": 0}
+        p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+        return {
+            "count": int(samples.size),
+            "mean_ms": float(samples.mean()),
+            "p50_ms": float(p50),
+            "p90_ms": float(p90),
+            "p99_ms": float(p99),
+            "max_ms": float(samples.max()),
+        }
+
+    def reset_stats(self):
+        with self._latency_lock:
+            self._latencies.clear()
+
+
+class CaptureSession(GrabLatency):
+    """Long-lived mss capture shared by all threads (GUI Worker QThreads included).
+
+    mss handles are bound to the thread that created them (X11 display / GDI DCs),
+    so each thread lazily gets its own handle and BGR output buffer, both reused
+    across grabs. Grab latencies are kept for percentile reporting.
+    """
+
+    def __init__(self, history: int = 1024):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._handles = weakref.WeakSet()
+        self._init_latency(history)
+        self._closed = False
+
+    def _thread(self) -> "_ThreadCapture":
+        # The holder lives only in this thread's local storage, so when the
+        # thread exits (GUI workers, executor threads) it is collected and its
+        # finalizer closes the mss handle; no handle outlives its thread.
+        tc = getattr(self._local, "tc", None)
+        if tc is None:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("CaptureSession is closed")
+                tc = _ThreadCapture(mss.mss())
+                self._handles.add(tc)
+            self._local.tc = tc
+        return tc
+
+    def _sct(self):
+        return self._thread().sct
+
+    @property
+    def monitors(self):
+        return self._sct().monitors
+
+    def grab(self, monitor: Optional[Dict] = None, reuse_buffer: bool = False) -> np.ndarray:
+        # reuse_buffer=True converts into a per-thread buffer that the next grab
+        # of the same size overwrites; only use it when the frame is not kept.
+        t0 = time.perf_counter()
+        tc = self._thread()
+        sct = tc.sct
+        if monitor is None:
+            monitor = sct.monitors[0]  # full virtual screen
         shot = sct.grab(monitor)
-        frame = np.array(shot)  # BGRA
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        if reuse_buffer:
+            key = (shot.height, shot.width)
+            buf = tc.buffers.get(key)
+            if buf is None:
+                buf = np.empty((shot.height, shot.width, 3), dtype=np.uint8)
+                tc.buffers[key] = buf
+            frame = cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=buf)
+        else:
+            frame = cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR)
+        self._record_latency(time.perf_counter() - t0)
         return frame
 
+    def close(self):
+        # Handles owned by other threads are closed here too; callers should stop
+        # capturing before closing the session.
+        with self._lock:
+            self._closed = True
+            handles = list(self._handles)
+            self._handles = weakref.WeakSet()
+        for tc in handles:
+            tc.release()
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _ThreadCapture:
+    """One thread's mss handle and output buffers; closes the handle when collected."""
+
+    __slots__ = ("sct", "buffers", "release", "__weakref__")
+
+    def __init__(self, sct):
+        self.sct = sct
+        self.buffers: Dict[Tuple[int, int], np.ndarray] = {}
+        # finalize runs at most once: on release() or when the holder is collected
+        self.release = weakref.finalize(self, _close_quietly, sct)
+
+
+def _close_quietly(sct):
+    try:
+        sct.close()
+    except Exception:
+        pass
+
+
+_session: Optional[CaptureSession] = None
+_session_lock = threading.Lock()
+
+
+def get_capture_session() -> CaptureSession:
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = CaptureSession()
+        return _session
+
+
+def set_capture_session(session) -> Optional[CaptureSession]:
+    # Swap the process-wide capture source (e.g. a simulate.FrameSource for
+    # headless runs; anything with monitors/grab/latency_stats works).
+    # Returns the previous one so callers can restore it; None resets to mss.
+    global _session
+    with _session_lock:
+        prev, _session = _session, session
+        return prev
+
+
+def take_screenshot_cv() -> np.ndarray:
+    # Use mss to capture the full virtual screen to avoid Pillow/pyscreeze issues
+    return get_capture_session().grab()
+
+
+Region = Union[int, Dict, Sequence[int]]
+
+
+def resolve_region(region: Optional[Region], monitors: Optional[List[Dict]] = None) -> Optional[Dict]:
+    # Normalize a search_region into an mss-style monitor dict in global coordinates.
+    # Accepted forms: monitor index (0 = full virtual screen), [x, y, w, h],
+    # {"x","y","w","h"} or {"left","top","width","height"}.
+    if region is None:
+        return None
+    if isinstance(region, bool):
+        raise ValueError(f"Invalid search_region: {region!r}")
+    if isinstance(region, int):
+        if monitors is None:
+            monitors = get_capture_session().monitors
+        if not 0 <= region < len(monitors):
+            raise ValueError(f"Monitor index out of range: {region}")
+        m = monitors[region]
+        return {"left": int(m["left"]), "top": int(m["top"]), "width": int(m["width"]), "height": int(m["height"])}
+    if isinstance(region, dict):
+        if "left" in region:
+            x, y, w, h = region["left"], region["top"], region["width"], region["height"]
+        else:
+            x, y, w, h = region["x"], region["y"], region["w"], region["h"]
+    else:
+        x, y, w, h = region
+    if int(w) <= 0 or int(h) <= 0:
+        raise ValueError(f"Empty search_region: {region!r}")
+    return {"left": int(x), "top": int(y), "width": int(w), "height": int(h)}
+
+
+def grab_frame(region: Optional[Region] = None, reuse_buffer: bool = False) -> "Frame":
+    t0 = time.perf_counter() if trace.enabled else 0.0
+    session = get_capture_session()
+    monitor = resolve_region(region, session.monitors) if region is not None else session.monitors[0]
+    frame = Frame(session.grab(monitor, reuse_buffer=reuse_buffer), origin=(monitor["left"], monitor["top"]))
+    if trace.enabled:
+        trace.add_time("capture_ms", time.perf_counter() - t0)
+    return frame
+
+
+def _preprocess(img_gray: np.ndarray, method: str) -> np.ndarray:
+    method = (method or "none").lower()
+    if method == "canny":
+        return cv2.Canny(img_gray, 50, 150)
+    if method == "threshold":
+        _, th = cv2.threshold(img_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return th
+    # default: gentle blur + gray
+    return cv2.GaussianBlur(img_gray, (3, 3), 0)
+
+
+class Frame:
+    """One captured screen plus lazily derived grayscale/preprocessed variants."""
+
+    def __init__(self, bgr: np.ndarray, origin: Tuple[int, int] = (0, 0)):
+        self.bgr = bgr
+        self.origin = (int(origin[0]), int(origin[1]))  # global coords of pixel (0, 0)
+        self.captured_at = time.monotonic()
+        self._gray = None
+        self._prep: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        # one lock per variant: each is computed once, different variants in parallel
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    @property
+    def gray(self) -> np.ndarray:
+        gray = self._gray
+        if gray is None:
+            with self._key_lock("#gray"):
+                gray = self._gray
+                if gray is None:
+                    gray = self._gray = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+        return gray
+
+    def preprocessed(self, method: str) -> np.ndarray:
+        key = (method or "none").lower()
+        img = self._prep.get(key)
+        if img is None:
+            t0 = time.perf_counter() if trace.enabled else 0.0
+            gray = self.gray
+            with self._key_lock(key):
+                img = self._prep.get(key)
+                if img is None:
+                    img = _preprocess(gray, key)
+                    self._prep[key] = img
+            if trace.enabled:
+                trace.add_time("preprocess_ms", time.perf_counter() - t0)
+        return img
+
+    def window(self, method: str, region: Optional[Region] = None) -> Tuple[np.ndarray, Tuple[int, int]]:
+        # Preprocessed image restricted to region (a view, no copy) and its global origin.
+        img = self.preprocessed(method)
+        ox, oy = self.origin
+        if region is None:
+            return img, (ox, oy)
+        r = resolve_region(region)
+        x0 = min(max(r["left"] - ox, 0), img.shape[1])
+        y0 = min(max(r["top"] - oy, 0), img.shape[0])
+        x1 = min(max(r["left"] + r["width"] - ox, 0), img.shape[1])
+        y1 = min(max(r["top"] + r["height"] - oy, 0), img.shape[0])
+        return img[y0:y1, x0:x1], (ox + x0, oy + y0)
+
+
+class FrameCache:
+    """Serve the same Frame to every caller until it is older than max_age or invalidated."""
+
+    def __init__(self, max_age: float = 0.5, grab: Optional[Callable[[], Frame]] = None):
+        self.max_age = float(max_age)
+        self._grab = grab or grab_frame
+        self._frame: Optional[Frame] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Frame:
+        with self._lock:
+            frame = self._frame
+            if frame is None or time.monotonic() - frame.captured_at > self.max_age:
+                frame = self._grab()
+                self._frame = frame
+            return frame
+
+    def invalidate(self):
+        with self._lock:
+            self._frame = None
+
+
+class TemplateStore:
+    """Process-wide cache of decoded, preprocessed (and resized) templates.
+
+    Entries are keyed by (path, preprocess, scale) and loaded lazily. A file's
+    mtime/size is re-checked at most every check_interval seconds; when it
+    changes (e.g. a step re-recorded from the GUI) every entry of that path is
+    dropped and rebuilt on the next request. Preloaded templates (compiled
+    plans) are pinned: never evicted and never checked against the disk.
+    """
+
+    def __init__(self, max_entries: int = 512, check_interval: float = 0.5):
+        self.max_entries = int(max_entries)
+        self.check_interval = float(check_interval)
+        self._entries: "OrderedDict[Tuple[str, str, float], Optional[np.ndarray]]" = OrderedDict()
+        self._stamps: Dict[str, Tuple[int, int, float]] = {}  # path -> (mtime_ns, size, checked_at)
+        self._pinned: Dict[Tuple[str, str], np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    @staticmethod
+    def _key(path: str, preprocess: str, scale: float) -> Tuple[str, str, float]:
+        return os.path.abspath(path), (preprocess or "none").lower(), round(float(scale), 4)
+
+    def _check_stamp(self, path: str):
+        if self._pinned and any(k[0] == path for k in self._pinned):
+            return
+        now = time.monotonic()
+        stamp = self._stamps.get(path)
+        if stamp is not None and now - stamp[2] < self.check_interval:
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            raise FileNotFoundError(f"Template not found: {path}")
+        if stamp is not None and (stamp[0], stamp[1]) != (st.st_mtime_ns, st.st_size):
+            self._drop(path)
+            self.reloads += 1
+        self._stamps[path] = (st.st_mtime_ns, st.st_size, now)
+
+    def _drop(self, path: str):
+        for key in [k for k in self._entries if k[0] == path]:
+            del self._entries[key]
+
+    def get(self, path: str, preprocess: str = "none", scale: float = 1.0) -> Optional[np.ndarray]:
+        # Returns None when the scaled template would be smaller than 5px.
+        key = self._key(path, preprocess, scale)
+        with self._lock:
+            self._check_stamp(key[0])
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            pinned = self._pinned.get(key[:2])
+            if key[2] == 1.0 and pinned is not None:
+                img = pinned
+            elif key[2] == 1.0:
+                gray = cv2.imread(key[0], cv2.IMREAD_GRAYSCALE)
+                if gray is None:
+                    raise FileNotFoundError(f"Template not found: {path}")
+                img = _preprocess(gray, key[1])
+            else:
+                base = pinned if pinned is not None else self._entries.get(key[:2] + (1.0,))
+                if base is None:
+                    gray = cv2.imread(key[0], cv2.IMREAD_GRAYSCALE)
+                    if gray is None:
+                        raise FileNotFoundError(f"Template not found: {path}")
+                    base = _preprocess(gray, key[1])
+                    self._put(key[:2] + (1.0,), base)
+                img = _resize_template(base, key[2])
+            self._put(key, img)
+            return img
+
+    def _put(self, key, img):
+        self._entries[key] = img
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def preload(self, path: str, preprocess: str, template: np.ndarray):
+        # Pin an already preprocessed template (e.g. a memory-mapped plan array) under path
+        key = self._key(path, preprocess, 1.0)
+        with self._lock:
+            self._drop(key[0])
+            self._pinned[key[:2]] = template
+
+    def unpin(self, prefix: str):
+        # Drop pinned templates whose key starts with prefix (e.g. "<plan>#"),
+        # with everything derived from them, so their backing memory is released
+        with self._lock:
+            for key in [k for k in self._pinned if k[0].startswith(prefix)]:
+                del self._pinned[key]
+                self._drop(key[0])
+
+    def invalidate(self, path: Optional[str] = None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._stamps.clear()
+                self._pinned.clear()
+            else:
+                path = os.path.abspath(path)
+                self._drop(path)
+                self._stamps.pop(path, None)
+                for key in [k for k in self._pinned if k[0] == path]:
+                    del self._pinned[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "reloads": self.reloads, "entries": len(self._entries)}
+
+
+template_store = TemplateStore()
+
 
 def select_roi_and_save(out_path: str) -> Tuple[int, int, int, int]:
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
@@ -29,58 +432,606 @@ def select_roi_and_save(out_path: str) -> Tuple[int, int, int, int]:
         raise ValueError("No ROI selected")
     crop = frame[y:y+h, x:x+w]
     cv2.imwrite(out_path, crop)
+    template_store.invalidate(out_path)
     return x, y, w, h
 
 
-def _preprocess(img_gray: np.ndarray, method: str) -> np.ndarray:
-    method = (method or "none").lower()
-    if method == "canny":
-        return cv2.Canny(img_gray, 50, 150)
-    if method == "threshold":
-        _, th = cv2.threshold(img_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        return th
-    # default: gentle blur + gray
-    return cv2.GaussianBlur(img_gray, (3, 3), 0)
+def locate_template_on_screen(
+    template_path: str,
+    threshold: float = 0.85,
+    preprocess: str = "none",
+    multi_scale: Union[bool, str] = False,
+    cache: Optional[FrameCache] = None,
+    frame: Optional[Frame] = None,
+    search_region: Optional[Region] = None,
+) -> Optional[Dict]:
+    if frame is None:
+        # without a shared frame only the search region itself is grabbed
+        frame = cache.get() if cache is not None else grab_frame(search_region)
+    return match_template(frame, template_path, threshold=threshold, preprocess=preprocess,
+                          multi_scale=multi_scale, search_region=search_region)
 
 
-def locate_template_on_screen(
+def match_template(
+    frame: Frame,
     template_path: str,
     threshold: float = 0.85,
     preprocess: str = "none",
-    multi_scale: bool = False,
+    multi_scale: Union[bool, str] = False,
+    search_region: Optional[Region] = None,
 ) -> Optional[Dict]:
-    screen = take_screenshot_cv()
-    screen_gray = cv2.cvtColor(screen, cv2.COLOR_BGR2GRAY)
-    screen_prep = _preprocess(screen_gray, preprocess)
+    screen_prep, (ox, oy) = frame.window(preprocess, search_region)
 
-    template_gray = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
-    if template_gray is None:
-        raise FileNotFoundError(f"Template not found: {template_path}")
-    template_prep = _preprocess(template_gray, preprocess)
+    template_prep = template_store.get(template_path, preprocess)
+
+    def tpl_at(scale: float) -> Optional[np.ndarray]:
+        return template_store.get(template_path, preprocess, scale)
 
     best = None
-    def try_match(tpl: np.ndarray):
+    st = trace.current()
+    def try_match(tpl: np.ndarray, scale: float = 1.0):
         nonlocal best
         if tpl.shape[0] < 5 or tpl.shape[1] < 5:
             return
+        if tpl.shape[0] > screen_prep.shape[0] or tpl.shape[1] > screen_prep.shape[1]:
+            return
+        t0 = time.perf_counter() if trace.enabled else 0.0
         res = cv2.matchTemplate(screen_prep, tpl, cv2.TM_CCOEFF_NORMED)
         min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
+        if trace.enabled:
+            st.add_scale(scale, time.perf_counter() - t0, float(max_val))
         if best is None or max_val > best[0]:
-            best = (max_val, max_loc, tpl.shape[::-1])  # (score, (x,y), (w,h))
+            best = (max_val, max_loc, tpl.shape[::-1], scale)  # (score, (x,y), (w,h), scale)
 
-    if multi_scale:
+    if multi_scale == "pyramid":
+        t0 = time.perf_counter() if trace.enabled else 0.0
+        best = _pyramid_match(screen_prep, template_prep, tpl_at)
+        if trace.enabled:
+            st.add_scale("pyramid", time.perf_counter() - t0, float(best[0]) if best else None)
+    elif multi_scale:
         for scale in np.linspace(0.6, 1.4, 9):
-            h, w = template_prep.shape
-            nh, nw = int(h * scale), int(w * scale)
-            if nh < 5 or nw < 5:
-                continue
-            tpl = cv2.resize(template_prep, (nw, nh), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
-            try_match(tpl)
+            tpl = tpl_at(scale)
+            if tpl is not None:
+                try_match(tpl, round(float(scale), 4))
     else:
         try_match(template_prep)
 
     if best is None or best[0] < threshold:
         return None
-    score, (x, y), (w, h) = best
+    score, (x, y), (w, h), scale = best
+    x, y = x + ox, y + oy  # back to global screen coordinates
     cx, cy = x + w // 2, y + h // 2
-    return {"bbox": (x, y, w, h), "center": (cx, cy), "score": float(score)}
+    return {"bbox": (x, y, w, h), "center": (cx, cy), "score": float(score), "scale": float(scale)}
+
+
+def match_all(
+    frame: Frame,
+    template_path: str,
+    threshold: float = 0.85,
+    preprocess: str = "none",
+    multi_scale: Union[bool, str] = False,
+    search_region: Optional[Region] = None,
+    max_results: int = 100,
+    overlap: float = 0.3,
+    order: str = "reading",
+) -> List[Dict]:
+    # Every occurrence above threshold, deduplicated with non-maximum
+    # suppression (boxes overlapping a better one by more than `overlap` IoU
+    # are dropped) and capped at max_results. Results have the same fields as
+    # match_template; order is "reading" (rows top to bottom, then left to
+    # right, what "the 3rd icon" means) or "score" (best first). Pyramid mode
+    # locates the best scale first and then collects occurrences at that scale.
+    screen_prep, (ox, oy) = frame.window(preprocess, search_region)
+    st = trace.current()
+    if multi_scale == "pyramid":
+        best = _pyramid_match(screen_prep, template_store.get(template_path, preprocess),
+                              lambda sc: template_store.get(template_path, preprocess, sc))
+        scales = [best[3]] if best is not None and best[0] >= threshold else []
+    elif multi_scale:
+        scales = [round(float(sc), 4) for sc in np.linspace(0.6, 1.4, 9)]
+    else:
+        scales = [1.0]
+
+    limit = max(1, int(max_results)) * 50  # candidates kept per scale before NMS
+    boxes, scores, scale_of = [], [], []
+    for scale in scales:
+        tpl = template_store.get(template_path, preprocess, scale)
+        if tpl is None or tpl.shape[0] > screen_prep.shape[0] or tpl.shape[1] > screen_prep.shape[1]:
+            continue
+        t0 = time.perf_counter() if trace.enabled else 0.0
+        res = cv2.matchTemplate(screen_prep, tpl, cv2.TM_CCOEFF_NORMED)
+        ys, xs, sc = _peaks(res, threshold, limit)
+        if trace.enabled:
+            st.add_scale(scale, time.perf_counter() - t0, float(sc.max()) if sc.size else None)
+        h, w = tpl.shape[:2]
+        boxes.append(np.stack([xs, ys, np.full_like(xs, w), np.full_like(xs, h)], axis=1))
+        scores.append(sc)
+        scale_of.append(np.full(sc.shape, scale, dtype=np.float64))
+    if not boxes:
+        return []
+    boxes = np.concatenate(boxes)
+    scores = np.concatenate(scores)
+    scale_of = np.concatenate(scale_of)
+    keep = _nms(boxes, scores, overlap, max_results)
+
+    out = []
+    for i in keep:
+        x, y, w, h = (int(v) for v in boxes[i])
+        x, y = x + ox, y + oy  # back to global screen coordinates
+        out.append({"bbox": (x, y, w, h), "center": (x + w // 2, y + h // 2),
+                    "score": float(scores[i]), "scale": float(scale_of[i])})
+    if order == "reading":
+        out = _reading_order(out)
+    elif order != "score":
+        raise ValueError(f"Unknown order: {order}")
+    return out
+
+
+def _peaks(res: np.ndarray, threshold: float, limit: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Local maxima of a matchTemplate map that reach threshold, best `limit` of
+    # them. The 3x3 dilation collapses the plateau of near-equal scores around
+    # each hit before NMS sees it.
+    mask = res >= threshold
+    if not mask.any():
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+    mask &= res >= cv2.dilate(res, np.ones((3, 3), np.uint8))
+    ys, xs = np.nonzero(mask)
+    sc = res[ys, xs]
+    if sc.size > limit:
+        top = np.argpartition(-sc, limit)[:limit]
+        ys, xs, sc = ys[top], xs[top], sc[top]
+    return ys.astype(np.int64), xs.astype(np.int64), sc
+
+
+def _nms(boxes: np.ndarray, scores: np.ndarray, overlap: float, max_results: int) -> List[int]:
+    # Greedy NMS; each iteration suppresses against all remaining boxes at once,
+    # so the Python loop runs once per kept result.
+    x0 = boxes[:, 0].astype(np.float64)
+    y0 = boxes[:, 1].astype(np.float64)
+    x1 = x0 + boxes[:, 2]
+    y1 = y0 + boxes[:, 3]
+    area = boxes[:, 2].astype(np.float64) * boxes[:, 3]
+    order = np.argsort(-scores, kind="stable")
+    keep: List[int] = []
+    while order.size and len(keep) < max_results:
+        i = int(order[0])
+        keep.append(i)
+        rest = order[1:]
+        iw = np.clip(np.minimum(x1[i], x1[rest]) - np.maximum(x0[i], x0[rest]), 0, None)
+        ih = np.clip(np.minimum(y1[i], y1[rest]) - np.maximum(y0[i], y0[rest]), 0, None)
+        inter = iw * ih
+        iou = inter / (area[i] + area[rest] - inter)
+        order = rest[iou <= overlap]
+    return keep
+
+
+def _reading_order(matches: List[Dict]) -> List[Dict]:
+    # Rows top to bottom (a box starts a new row when its top is more than half
+    # a box height below the row's first box), left to right within a row.
+    rows: List[List[Dict]] = []
+    for m in sorted(matches, key=lambda m: (m["bbox"][1], m["bbox"][0])):
+        if rows and m["bbox"][1] - rows[-1][0]["bbox"][1] <= rows[-1][0]["bbox"][3] // 2:
+            rows[-1].append(m)
+        else:
+            rows.append([m])
+    return [m for row in rows for m in sorted(row, key=lambda m: m["bbox"][0])]
+
+
+def locate_all_on_screen(
+    template_path: str,
+    threshold: float = 0.85,
+    preprocess: str = "none",
+    multi_scale: Union[bool, str] = False,
+    frame: Optional[Frame] = None,
+    search_region: Optional[Region] = None,
+    max_results: int = 100,
+    overlap: float = 0.3,
+    order: str = "reading",
+) -> List[Dict]:
+    if frame is None:
+        frame = grab_frame(search_region)
+    return match_all(frame, template_path, threshold=threshold, preprocess=preprocess, multi_scale=multi_scale,
+                     search_region=search_region, max_results=max_results, overlap=overlap, order=order)
+
+
+class ChangeDetector:
+    """Tracks which screen tiles changed between consecutive frames.
+
+    Each update() diffs the new grayscale frame against the previous one
+    (cv2.absdiff, then a per-tile max) and stamps changed tiles with the
+    current generation, so callers can ask "what changed since generation g".
+    """
+
+    def __init__(self, tile: int = 32, tolerance: int = 0):
+        self.tile = int(tile)
+        self.tolerance = int(tolerance)
+        self.generation = 0
+        self._prev: Optional[np.ndarray] = None
+        self._origin: Optional[Tuple[int, int]] = None
+        self._changed_at: Optional[np.ndarray] = None  # per-tile generation of last change
+        self._last_frame: Optional[Frame] = None
+        self._lock = threading.Lock()
+
+    def update(self, frame: Frame) -> int:
+        with self._lock:
+            if frame is self._last_frame:
+                return self.generation
+            gray = frame.gray
+            self.generation += 1
+            t = self.tile
+            ty, tx = -(-gray.shape[0] // t), -(-gray.shape[1] // t)
+            if self._prev is None or self._prev.shape != gray.shape or self._origin != frame.origin:
+                self._changed_at = np.full((ty, tx), self.generation, dtype=np.int64)
+            else:
+                diff = cv2.absdiff(self._prev, gray)
+                pad = np.zeros((ty * t, tx * t), dtype=np.uint8)
+                pad[:diff.shape[0], :diff.shape[1]] = diff
+                dirty = pad.reshape(ty, t, tx, t).max(axis=(1, 3)) > self.tolerance
+                self._changed_at[dirty] = self.generation
+            self._prev = gray.copy()  # frame buffers may be reused by the capture session
+            self._origin = frame.origin
+            self._last_frame = frame
+            return self.generation
+
+    def dirty_rects(self, since: int, rect: Optional[Dict] = None) -> List[Tuple[int, int, int, int]]:
+        # Global (x, y, w, h) boxes of connected groups of tiles changed after
+        # generation `since`, limited to rect (an mss-style dict) when given.
+        with self._lock:
+            if self._changed_at is None:
+                return []
+            mask = (self._changed_at > since).astype(np.uint8)
+            ox, oy = self._origin
+            h, w = self._prev.shape
+        t = self.tile
+        if rect is not None:
+            tx0 = max((rect["left"] - ox) // t, 0)
+            ty0 = max((rect["top"] - oy) // t, 0)
+            tx1 = max(-(-(rect["left"] + rect["width"] - ox) // t), 0)
+            ty1 = max(-(-(rect["top"] + rect["height"] - oy) // t), 0)
+            clipped = np.zeros_like(mask)
+            clipped[ty0:ty1, tx0:tx1] = mask[ty0:ty1, tx0:tx1]
+            mask = clipped
+        if not mask.any():
+            return []
+        n, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        rects = []
+        for x, y, cw, ch, _ in stats[1:n]:
+            x0, y0 = x * t, y * t
+            rects.append((ox + x0, oy + y0, min(cw * t, w - x0), min(ch * t, h - y0)))
+        return rects
+
+
+class IncrementalMatcher:
+    """Template matcher for polling loops that skips work on unchanged screens.
+
+    Per (template, preprocess, multi_scale, search_region) it remembers the
+    best match and the ChangeDetector generation it was computed at. On the
+    next frame:
+      - nothing changed in the search area     -> previous result is reused;
+      - single-scale "none" preprocess and the previous best untouched
+                                               -> only windows overlapping the
+        dirty tiles are re-matched and compared with the previous best;
+      - otherwise                              -> full match.
+    Partial re-matching is limited to "none": Otsu thresholding is global and
+    Canny hysteresis follows edges, so a local change there is not local in
+    the preprocessed image. Results are the same as match_template's.
+    """
+
+    _MARGIN = 2  # the 3x3 GaussianBlur spreads a pixel change by one pixel
+
+    def __init__(self, tile: int = 32, tolerance: int = 0):
+        self.detector = ChangeDetector(tile=tile, tolerance=tolerance)
+        self._memo: Dict[Tuple, Tuple] = {}
+        self._lock = threading.Lock()
+        self.counts = {"reused": 0, "partial": 0, "full": 0}
+
+    def _count(self, kind: str):
+        with self._lock:
+            self.counts[kind] += 1
+
+    def match(
+        self,
+        frame: Frame,
+        template_path: str,
+        threshold: float = 0.85,
+        preprocess: str = "none",
+        multi_scale: Union[bool, str] = False,
+        search_region: Optional[Region] = None,
+    ) -> Optional[Dict]:
+        preprocess = (preprocess or "none").lower()
+        gen = self.detector.update(frame)
+        fh, fw = frame.bgr.shape[:2]
+        full = {"left": frame.origin[0], "top": frame.origin[1], "width": fw, "height": fh}
+        area = resolve_region(search_region) if search_region is not None else full
+        key = (template_path, preprocess, multi_scale, tuple(sorted(area.items())))
+        tpl = template_store.get(template_path, preprocess)
+        memo = self._memo.get(key)
+        kind = "full"
+        if memo is not None and memo[1] is tpl:
+            prev_gen, _, best = memo
+            dirty = self.detector.dirty_rects(prev_gen, area)
+            if not dirty:
+                kind = "reused"
+            elif not multi_scale and preprocess == "none" and not self._touches(best, dirty):
+                kind = "partial"
+                best = self._match_dirty(frame, tpl, preprocess, area, dirty, best)
+        self._count(kind)
+        if kind == "full":
+            best = match_template(frame, template_path, threshold=-1.0, preprocess=preprocess,
+                                  multi_scale=multi_scale, search_region=search_region)
+        self._memo[key] = (gen, tpl, best)
+        if trace.enabled:
+            trace.current().set(reuse=kind)
+        if best is None or best["score"] < threshold:
+            return None
+        return dict(best)
+
+    def _touches(self, prev: Optional[Dict], dirty: List[Tuple[int, int, int, int]]) -> bool:
+        if prev is None:
+            return True
+        x, y, w, h = prev["bbox"]
+        m = self._MARGIN
+        return any(x - m < dx + dw and dx < x + w + m and y - m < dy + dh and dy < y + h + m
+                   for dx, dy, dw, dh in dirty)
+
+    def _match_dirty(self, frame, tpl, preprocess, area, dirty, prev) -> Dict:
+        th, tw = tpl.shape[:2]
+        best = prev
+        for dx, dy, dw, dh in dirty:
+            # every template window that overlaps the dirty box
+            grow_x, grow_y = tw + self._MARGIN, th + self._MARGIN
+            x0 = max(dx - grow_x, area["left"])
+            y0 = max(dy - grow_y, area["top"])
+            x1 = min(dx + dw + grow_x, area["left"] + area["width"])
+            y1 = min(dy + dh + grow_y, area["top"] + area["height"])
+            window, (ox, oy) = frame.window(preprocess, {"left": x0, "top": y0, "width": max(x1 - x0, 1), "height": max(y1 - y0, 1)})
+            if window.shape[0] < th or window.shape[1] < tw:
+                continue
+            res = cv2.matchTemplate(window, tpl, cv2.TM_CCOEFF_NORMED)
+            _, max_val, _, max_loc = cv2.minMaxLoc(res)
+            if max_val > best["score"]:
+                x, y = ox + max_loc[0], oy + max_loc[1]
+                best = {"bbox": (x, y, tw, th), "center": (x + tw // 2, y + th // 2), "score": float(max_val), "scale": 1.0}
+        return best
+
+    def reset(self):
+        with self._lock:
+            self._memo.clear()
+            self.counts = {"reused": 0, "partial": 0, "full": 0}
+
+
+def wait_for_template(
+    template_path: str,
+    timeout: float,
+    threshold: float = 0.85,
+    preprocess: str = "none",
+    multi_scale: Union[bool, str] = False,
+    search_region: Optional[Region] = None,
+    poll: float = 0.05,
+    max_poll: float = 1.0,
+    backoff: float = 1.5,
+    retries: Optional[int] = None,
+    matcher: Optional["IncrementalMatcher"] = None,
+    stop: Optional[threading.Event] = None,
+) -> Optional[Dict]:
+    # Poll until the template appears, the timeout expires or the retry budget
+    # (number of re-checks after the first) runs out. The interval starts at
+    # poll and grows by backoff up to max_poll, so short waits stay responsive
+    # and long waits stay cheap. Polls reuse the capture session's buffers and
+    # the template store, and an IncrementalMatcher skips re-matching while the
+    # screen is unchanged; the result carries time_to_appear and polls.
+    # Setting stop ends the wait at its next interval (returns None).
+    matcher = matcher or IncrementalMatcher()
+
+    def check():
+        frame = grab_frame(search_region, reuse_buffer=True)
+        return matcher.match(frame, template_path, threshold=threshold, preprocess=preprocess,
+                             multi_scale=multi_scale, search_region=search_region)
+
+    found, polls, elapsed = _poll(check, timeout, poll, max_poll, backoff, retries, stop)
+    if found:
+        found["time_to_appear"] = elapsed
+        found["polls"] = polls
+    return found
+
+
+def wait_for_matches(
+    template_path: str,
+    timeout: float,
+    min_count: int = 1,
+    threshold: float = 0.85,
+    preprocess: str = "none",
+    multi_scale: Union[bool, str] = False,
+    search_region: Optional[Region] = None,
+    poll: float = 0.05,
+    max_poll: float = 1.0,
+    backoff: float = 1.5,
+    retries: Optional[int] = None,
+    max_results: int = 100,
+    overlap: float = 0.3,
+    stop: Optional[threading.Event] = None,
+) -> List[Dict]:
+    # wait_for_template for match_all: polls until at least min_count
+    # occurrences are visible; returns them in reading order (each carrying
+    # time_to_appear and polls) or [] on timeout.
+    def check():
+        frame = grab_frame(search_region, reuse_buffer=True)
+        found = match_all(frame, template_path, threshold=threshold, preprocess=preprocess, multi_scale=multi_scale,
+                          search_region=search_region, max_results=max_results, overlap=overlap)
+        return found if len(found) >= min_count else None
+
+    found, polls, elapsed = _poll(check, timeout, poll, max_poll, backoff, retries, stop)
+    for m in found or []:
+        m["time_to_appear"] = elapsed
+        m["polls"] = polls
+    return found or []
+
+
+def _poll(check: Callable[[], object], timeout: float, poll: float, max_poll: float, backoff: float,
+          retries: Optional[int], stop: Optional[threading.Event] = None) -> Tuple[object, int, float]:
+    # Calls check until it returns something truthy, the timeout expires or the
+    # retry budget (re-checks after the first) runs out. The interval starts
+    # at poll and grows by backoff up to max_poll. Returns (result or None,
+    # polls, seconds elapsed).
+    t0 = time.monotonic()
+    deadline = t0 + max(0.0, float(timeout))
+    interval = max(0.0, float(poll))
+    polls = 0
+    while True:
+        polls += 1
+        result = check()
+        now = time.monotonic()
+        if result:
+            return result, polls, now - t0
+        if now >= deadline or (retries is not None and polls > retries):
+            return None, polls, now - t0
+        pause = min(interval, max(0.0, deadline - now))
+        if stop is None:
+            time.sleep(pause)
+        elif stop.wait(pause):
+            return None, polls, time.monotonic() - t0
+        interval = min(max(interval * backoff, 0.001), max_poll)
+
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _match_pool() -> ThreadPoolExecutor:
+    # cv2.matchTemplate releases the GIL, so plain threads give real parallelism
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="vision-match")
+        return _pool
+
+
+def locate_many(
+    templates: Sequence[Union[str, Dict]],
+    frame: Optional[Frame] = None,
+    threshold: float = 0.85,
+    preprocess: str = "none",
+    multi_scale: Union[bool, str] = False,
+    parallel: bool = True,
+    matcher: Optional[IncrementalMatcher] = None,
+) -> List[Optional[Dict]]:
+    # Match many templates against one frame; returns one result (or None) per
+    # template, in input order. Each entry is a path or a dict with "template"
+    # and optional "preprocess"/"multi_scale"/"search_region"/"threshold"
+    # overriding the call-level defaults (conditionals items can be passed as is).
+    # With a matcher (polling loops) results of unchanged screen areas are reused.
+    if frame is None:
+        frame = grab_frame()
+    specs = []
+    for t in templates:
+        spec = {"template": t} if isinstance(t, str) else t
+        specs.append((
+            spec["template"],
+            float(spec.get("threshold", threshold)),
+            (spec.get("preprocess") or preprocess or "none").lower(),
+            spec.get("multi_scale", multi_scale),
+            spec.get("search_region"),
+        ))
+    if not specs:
+        return []
+
+    match = matcher.match if matcher is not None else match_template
+    if matcher is not None:
+        matcher.detector.update(frame)
+
+    def run(spec):
+        path, thr, prep, ms, region = spec
+        with trace.step("match", template=path, preprocess=prep, multi_scale=ms) as st:
+            found = match(frame, path, threshold=thr, preprocess=prep, multi_scale=ms, search_region=region)
+            if found:
+                st.set(score=found["score"], location=found["center"], scale=found["scale"])
+        return found
+
+    if not parallel or len(specs) == 1:
+        return [run(spec) for spec in specs]
+    pool = _match_pool()
+    # every screen variant is computed once, before the matches fan out
+    modes = sorted({spec[2] for spec in specs})
+    list(pool.map(trace.bind(frame.preprocessed), modes))
+    return list(pool.map(trace.bind(run), specs))
+
+
+def _resize_template(template: np.ndarray, scale: float) -> Optional[np.ndarray]:
+    h, w = template.shape[:2]
+    nh, nw = int(h * scale), int(w * scale)
+    if nh < 5 or nw < 5:
+        return None
+    if nh == h and nw == w:
+        return template
+    return cv2.resize(template, (nw, nh), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+
+
+def _pyramid_match(
+    screen: np.ndarray,
+    template: np.ndarray,
+    tpl_at: Optional[Callable[[float], Optional[np.ndarray]]] = None,
+    scale_range: Tuple[float, float] = (0.6, 1.4),
+    coarse_steps: int = 9,
+    fine_step: float = 0.02,
+    top_k: int = 3,
+):
+    # Coarse-to-fine multi-scale search:
+    # 1) match every coarse scale on a downsampled screen (cost ~ f^4 of full res);
+    # 2) refine the top_k (scale, location) candidates at full resolution with a
+    #    finer scale step, matching only inside a small window around each one.
+    if tpl_at is None:
+        def tpl_at(scale: float) -> Optional[np.ndarray]:
+            return _resize_template(template, scale)
+    lo, hi = scale_range
+    th, tw = template.shape[:2]
+    if screen.size == 0 or screen.shape[0] < int(th * lo) or screen.shape[1] < int(tw * lo):
+        return None  # empty search window, or too small for the template at any scale
+    f = 1.0
+    for cand in (0.25, 0.5):
+        if min(th, tw) * lo * cand >= 10:
+            f = cand
+            break
+    coarse_scales = np.linspace(lo, hi, coarse_steps)
+    if f >= 1.0:
+        # template too small to shrink; fall back to full-res sweep over the coarse scales
+        small_screen = screen
+    else:
+        small_screen = cv2.resize(screen, None, fx=f, fy=f, interpolation=cv2.INTER_AREA)
+
+    candidates = []  # (score, scale, (x, y) in full-res coords)
+    for scale in coarse_scales:
+        tpl = tpl_at(scale * f)
+        if tpl is None or tpl.shape[0] > small_screen.shape[0] or tpl.shape[1] > small_screen.shape[1]:
+            continue
+        res = cv2.matchTemplate(small_screen, tpl, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+        candidates.append((max_val, float(scale), (int(max_loc[0] / f), int(max_loc[1] / f))))
+    if not candidates:
+        return None
+    candidates.sort(key=lambda c: c[0], reverse=True)
+
+    coarse_gap = (hi - lo) / max(coarse_steps - 1, 1)
+    pad = int(np.ceil(2.0 / f)) + 2
+    best = None
+    for _, c_scale, (cx, cy) in candidates[:top_k]:
+        fine_scales = np.arange(max(lo, c_scale - coarse_gap), min(hi, c_scale + coarse_gap) + 1e-9, fine_step)
+        for scale in fine_scales:
+            tpl = tpl_at(scale)
+            if tpl is None:
+                continue
+            h, w = tpl.shape[:2]
+            # window must hold the template at this scale plus the coarse position error
+            grow_w = int(abs(scale - c_scale) * tw) + pad
+            grow_h = int(abs(scale - c_scale) * th) + pad
+            x0, y0 = max(cx - grow_w, 0), max(cy - grow_h, 0)
+            x1 = min(cx + int(tw * c_scale) + grow_w, screen.shape[1])
+            y1 = min(cy + int(th * c_scale) + grow_h, screen.shape[0])
+            window = screen[y0:y1, x0:x1]
+            if h > window.shape[0] or w > window.shape[1]:
+                continue
+            res = cv2.matchTemplate(window, tpl, cv2.TM_CCOEFF_NORMED)
+            _, max_val, _, max_loc = cv2.minMaxLoc(res)
+            if best is None or max_val > best[0]:
+                best = (max_val, (x0 + max_loc[0], y0 + max_loc[1]), (w, h), round(float(scale), 4))
+    return best
@@ -0,0 +1,319 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from . import trace
+from .plan import detect_kind, is_plan, load_entries, open_plan, resolve_template_path
+from .sequence_modes import _act_step, _act_top, _choose, _multi_scale_mode, _nth_mode, _pick
+from .vision import Frame, IncrementalMatcher, get_capture_session, grab_frame, match_all, resolve_region
+
+# Many independent workspaces (directories with sequences.json /
+# conditionals.json, e.g. unpacked by io_utils.import_project) driven from one
+# process. Every round the main process captures one frame into a
+# multiprocessing.shared_memory block; pool workers map it without copying or
+# pickling and match their share of the workspaces; the replies (a few small
+# dicts) come back to the main process, which performs all input actions
+# itself, one after another, so workspaces never fight over mouse/keyboard.
+#
+# On Windows (spawn start method) the calling script needs the usual
+# `if __name__ == "__main__":` guard.
+
+SEQ_FILES = ("sequences.json", "sequences.plan")
+COND_FILES = ("conditionals.json", "conditionals.plan")
+
+
+class Workspace:
+    """One sequence or conditionals file and its progress in a run."""
+
+    def __init__(self, path: str, kind: str, entries: List[Dict], name: Optional[str] = None):
+        self.path = path
+        self.kind = kind
+        self.entries = entries
+        self.name = name or path
+        self.results: List[Dict] = []
+        self.pos = 0              # sequence: current step; conditionals: passes done
+        self.passes = 1           # conditionals: decision passes to make
+        self.polls = 0
+        self.started: Optional[float] = None
+        self.done = not entries
+
+    def spec(self) -> Dict:
+        # what the workers need (sent once per worker); a plan's templates are
+        # pinned per process, so workers reopen the plan (spawn starts empty)
+        spec = {"kind": self.kind, "entries": self.entries}
+        if is_plan(self.path):
+            spec["plan"] = self.path
+        return spec
+
+
+def load_workspaces(path: str, monitors: Optional[List[Dict]] = None) -> List[Workspace]:
+    # A directory yields a workspace per sequences/conditionals file found in
+    # it; a file (.json or .plan) yields one. Template paths are resolved
+    # against the workspace (imported projects keep them under resources/)
+    # and search regions to screen rectangles, so workers need neither. The
+    # kind comes from the file's content; a file that is empty or holds
+    # something else (e.g. a recording) is an error.
+    if os.path.isdir(path):
+        found = []
+        for names, kind in ((SEQ_FILES, "sequence"), (COND_FILES, "conditionals")):
+            for n in names:
+                p = os.path.join(path, n)
+                if os.path.isfile(p):
+                    actual = detect_kind(p)
+                    if actual != kind:
+                        raise ValueError(f"{p} holds a {actual}, expected {kind}")
+                    found.append((p, kind))
+                    break
+        if not found:
+            raise FileNotFoundError(f"No sequences/conditionals file in {path}")
+        base = path
+    else:
+        kind = detect_kind(path)
+        if kind == "recording":
+            raise ValueError(f"{path} is a recording, not a sequence or conditionals file")
+        found = [(path, kind)]
+        base = os.path.dirname(os.path.abspath(path))
+    if monitors is None:
+        monitors = get_capture_session().monitors
+    spaces = []
+    for p, kind in found:
+        pinned = is_plan(p)
+        entries = [_resolve_entry(e, base, monitors, pinned) for e in load_entries(p, kind)]
+        spaces.append(Workspace(p, kind, entries, name=os.path.relpath(p)))
+    return spaces
+
+
+def _resolve_entry(entry: Dict, base: str, monitors: List[Dict], pinned: bool = False) -> Dict:
+    # pinned: a plan entry, whose "template" is a template_store key, not a path
+    e = dict(entry)
+    if not pinned:
+        e["template"] = resolve_template_path(e["template"], base)
+    e["multi_scale"] = _multi_scale_mode(e.get("multi_scale", False))
+    if e.get("search_region") is not None:
+        e["search_region"] = resolve_region(e["search_region"], monitors)
+    return e
+
+
+class SharedFrame:
+    """A shared_memory block holding the current frame, reallocated on size change."""
+
+    def __init__(self):
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self.shape: Tuple[int, ...] = ()
+
+    def put(self, bgr: np.ndarray) -> str:
+        if self._shm is None or bgr.shape != self.shape:
+            self.close()
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, bgr.nbytes))
+            self.shape = bgr.shape
+        np.ndarray(bgr.shape, dtype=np.uint8, buffer=self._shm.buf)[...] = bgr
+        return self._shm.name
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+# worker process state
+_spaces: List[Dict] = []
+_matchers: Dict[int, IncrementalMatcher] = {}
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _init_worker(specs: List[Dict]):
+    global _spaces
+    _spaces = specs
+    for spec in specs:
+        if "plan" in spec:
+            open_plan(spec["plan"]).entries()  # pins the templates the entries' keys refer to
+    # parallelism comes from the processes; nested cv2/vision threads would only oversubscribe
+    cv2.setNumThreads(1)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # A block replaced after a frame size change is closed once nothing views
+    # it any more: the last Frame a matcher's ChangeDetector keeps still holds
+    # an ndarray on it until the next round replaces it.
+    for old in [n for n in _attached if n != name]:
+        try:
+            _attached[old].close()
+        except BufferError:
+            continue
+        del _attached[old]
+    shm = _attached.get(name)
+    if shm is None:
+        shm = _attached[name] = shared_memory.SharedMemory(name=name)
+    return shm
+
+
+def _match_chunk(indices: List[int], positions: List[int], name: str, shape: Tuple[int, ...],
+                 origin: Tuple[int, int], threshold: float, strategy: str) -> List[Tuple[int, object, float]]:
+    shm = _attach(name)
+    frame = Frame(np.ndarray(shape, dtype=np.uint8, buffer=shm.buf), origin)
+    return _match_indices(_spaces, _matchers, frame, indices, positions, threshold, strategy)
+
+
+def _match_indices(specs, matchers, frame, indices, positions, threshold, strategy):
+    # One reply per workspace: (index, payload, match seconds). Sequences get
+    # the targets of their current step, conditionals (top item, stats).
+    out = []
+    for i, pos in zip(indices, positions):
+        t0 = time.perf_counter()
+        spec = specs[i]
+        matcher = matchers.setdefault(i, IncrementalMatcher())
+        if spec["kind"] == "sequence":
+            payload = _match_step(spec["entries"][pos], frame, threshold, matcher)
+        else:
+            payload = _choose(spec["entries"], threshold, frame, strategy, matcher, parallel=False)
+        out.append((i, payload, time.perf_counter() - t0))
+    return out
+
+
+def _match_step(step: Dict, frame: Frame, threshold: float, matcher: IncrementalMatcher) -> Tuple[List[Dict], int]:
+    nth = _nth_mode(step.get("nth"))
+    kw = dict(threshold=threshold, preprocess=step.get("preprocess", "none"),
+              multi_scale=step.get("multi_scale", False), search_region=step.get("search_region"))
+    if nth is None:
+        found = matcher.match(frame, step["template"], **kw)
+        return ([found] if found else []), (1 if found else 0)
+    matches = match_all(frame, step["template"], max_results=int(step.get("max_results", 100)),
+                        overlap=float(step.get("overlap", 0.3)), **kw)
+    return _pick(matches, nth), len(matches)
+
+
+def run_workspaces(
+    paths: Sequence[str],
+    workers: Optional[int] = None,
+    threshold: float = 0.85,
+    strategy: str = "exhaustive",
+    passes: int = 1,
+    interval: float = 0.0,
+    poll: float = 0.05,
+    backend=None,
+    stop: Optional[threading.Event] = None,
+    on_result: Optional[Callable[[Workspace, Dict], None]] = None,
+) -> Dict:
+    # Runs every workspace under paths until its sequence has gone through all
+    # steps and its conditionals have made `passes` decisions (or stop is set).
+    # Sequence steps behave as in run_sequence, with "wait" spread over rounds
+    # instead of blocking. Actions of one round run in workspace order, after
+    # all matching for that round is done, so results within a round come from
+    # the same frame; workspaces are expected to watch separate screen areas.
+    # workers: process count (default: CPU count); 0 matches in this process.
+    if strategy not in ("exhaustive", "priority_first"):
+        raise ValueError(f"Unknown strategy: {strategy}")
+    monitors = get_capture_session().monitors
+    spaces = [w for p in paths for w in load_workspaces(p, monitors)]
+    for w in spaces:
+        w.passes = max(1, int(passes))
+    workers = (os.cpu_count() or 1) if workers is None else max(0, int(workers))
+    specs = [w.spec() for w in spaces]
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(specs,)) if workers else None
+    local_matchers: Dict[int, IncrementalMatcher] = {}
+    shared = SharedFrame()
+    stop = stop or threading.Event()
+    stats = {"workspaces": len(spaces), "workers": workers, "rounds": 0, "actions": 0,
+             "capture_ms": 0.0, "match_ms": 0.0, "round_ms": 0.0, "action_ms": 0.0, "shared_bytes": 0}
+    t_start = time.perf_counter()
+    try:
+        while not stop.is_set():
+            active = [i for i, w in enumerate(spaces) if not w.done]
+            if not active:
+                break
+            with trace.step("workspaces_round", round=stats["rounds"], active=len(active)) as st:
+                t0 = time.perf_counter()
+                frame = grab_frame()
+                t1 = time.perf_counter()
+                if pool is not None:
+                    name = shared.put(frame.bgr)
+                    stats["shared_bytes"] = frame.bgr.nbytes
+                    chunks = [active[k::workers] for k in range(min(workers, len(active)))]
+                    futures = [pool.submit(_match_chunk, c, [spaces[i].pos for i in c], name, frame.bgr.shape,
+                                           frame.origin, threshold, strategy) for c in chunks]
+                    replies = sorted((r for f in futures for r in f.result()), key=lambda r: r[0])
+                else:
+                    replies = _match_indices(specs, local_matchers, frame, active,
+                                             [spaces[i].pos for i in active], threshold, strategy)
+                t2 = time.perf_counter()
+                acted = 0
+                for i, payload, match_s in replies:
+                    stats["match_ms"] += match_s * 1000.0
+                    acted += _dispatch(spaces[i], payload, backend, st, on_result)
+                t3 = time.perf_counter()
+                stats["rounds"] += 1
+                stats["actions"] += acted
+                stats["capture_ms"] += (t1 - t0) * 1000.0
+                stats["round_ms"] += (t2 - t0) * 1000.0
+                stats["action_ms"] += (t3 - t2) * 1000.0
+                st.set(acted=acted, match_ms=(t2 - t1) * 1000.0)
+            waiting = any(not w.done and w.kind == "sequence" for w in spaces)
+            delay = interval if acted or not waiting else max(interval, poll)
+            if delay > 0:
+                stop.wait(delay)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        shared.close()
+    elapsed = time.perf_counter() - t_start
+    rounds = stats["rounds"]
+    stats.update(
+        elapsed=elapsed,
+        stopped=stop.is_set() and any(not w.done for w in spaces),
+        rounds_per_s=rounds / elapsed if elapsed > 0 else 0.0,
+        mean_round_ms=stats["round_ms"] / rounds if rounds else 0.0,
+        results={w.name: w.results for w in spaces},
+    )
+    return stats
+
+
+def _dispatch(w: Workspace, payload, backend, st, on_result) -> int:
+    # Applies one workspace's reply in the main process; returns actions performed.
+    now = time.monotonic()
+    if w.kind == "conditionals":
+        top, result = payload
+        if top is not None:
+            _act_top(top, backend, st)
+        w.pos += 1
+        w.done = w.pos >= w.passes
+        return _record(w, result, on_result, 1 if top is not None else 0)
+    step = w.entries[w.pos]
+    targets, count = payload
+    if w.started is None:
+        w.started = now
+    w.polls += 1
+    wait = float(step.get("wait", 0) or 0)
+    if not targets and now - w.started < wait:
+        return 0
+    result = {
+        "index": w.pos,
+        "template": step["template"],
+        "found": bool(targets),
+        "time_to_appear": now - w.started if targets else None,
+        "polls": w.polls if targets else None,
+        "waited": now - w.started,
+    }
+    if _nth_mode(step.get("nth")) is not None:
+        result["matches"] = count
+        result["acted"] = len(targets)
+    if targets:
+        _act_step(step, targets, backend, st)
+    w.pos += 1
+    w.polls = 0
+    w.started = None
+    w.done = w.pos >= len(w.entries)
+    return _record(w, result, on_result, len(targets))
+
+
+def _record(w: Workspace, result: Dict, on_result, acted: int) -> int:
+    w.results.append(result)
+    if on_result is not None:
+        on_result(w, result)
+    return acted
@@ -1,6 +1,11 @@
-from app.gui import run_gui
+import sys
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        # Headless commands (see app/cli.py); only what the command needs is imported
+        from app.cli import main
+        sys.exit(main())
     # Launch GUI directly
+    from app.gui import run_gui
     run_gui()
@@ -0,0 +1,17 @@
+from mss.exception import ScreenShotError
+
+from app import cli
+
+
+def test_capture_error_is_reported_cleanly(monkeypatch, capsys):
+    def fail(args, imports):
+        raise ScreenShotError("$DISPLAY not set.")
+
+    monkeypatch.setattr(cli, "cmd_run_seq", fail)
+    assert cli.main(["-q", "run-seq", "sequences.json"]) == 1
+    assert capsys.readouterr().err == "error: $DISPLAY not set.\n"
+
+
+def test_missing_file_exit_code(tmp_path, capsys):
+    assert cli.main(["-q", "play", "--backend", "null", str(tmp_path / "missing.json")]) == 1
+    assert capsys.readouterr().err.startswith("error: ")
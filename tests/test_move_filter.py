@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+
+from app.move_filter import MoveCompressor, compress_recording, rdp_mask
+from app.rec_format import iter_events
+
+
+def _moves(points, dt=0.01):
+    return [{"type": "move", "x": x, "y": y, "t": i * dt} for i, (x, y) in enumerate(points)]
+
+
+def test_rdp_mask_straight_line_keeps_endpoints():
+    pts = np.array([(i, 2 * i) for i in range(50)], dtype=np.float64)
+    assert np.flatnonzero(rdp_mask(pts, 0.5)).tolist() == [0, 49]
+
+
+def test_rdp_mask_keeps_corners_and_short_inputs():
+    pts = np.array([(0, 0), (5, 0), (10, 0), (10, 5), (10, 10)], dtype=np.float64)
+    assert np.flatnonzero(rdp_mask(pts, 0.5)).tolist() == [0, 2, 4]
+    assert rdp_mask(pts[:2], 0.5).all()
+    assert rdp_mask(pts, 0.0).all()
+    assert rdp_mask(np.empty((0, 2)), 1.0).size == 0
+
+
+def test_non_move_events_and_last_move_before_them_are_kept():
+    events = _moves([(i, 0) for i in range(20)])
+    click = {"type": "click", "x": 19, "y": 0, "button": "Button.left", "pressed": True, "t": 0.5}
+    comp = MoveCompressor(min_distance=5.0, epsilon=1.0)
+    after = [dict(e, t=e["t"] + 0.6) for e in _moves([(19, i) for i in range(1, 4)])]
+    out = list(comp.filter(events + [click] + after))
+    i = out.index(click)
+    assert out[i - 1] == events[-1]
+    assert out[0] == events[0]
+    assert comp.moves_in == 23 and comp.moves_out == len(out) - 1
+    assert [e["t"] for e in out] == sorted(e["t"] for e in out)
+
+
+def test_max_error_is_bounded_by_epsilon():
+    rng = np.random.default_rng(1)
+    pts = np.cumsum(rng.normal(0, 3, (500, 2)), axis=0).round().astype(int)
+    comp = MoveCompressor(epsilon=2.0)
+    out = list(comp.filter(_moves(pts.tolist())))
+    assert len(out) < len(pts)
+    assert 0.0 < comp.max_error <= 2.0
+
+
+def test_min_interval_decimation():
+    comp = MoveCompressor(min_interval=0.05)
+    out = list(comp.filter(_moves([(i, i) for i in range(100)])))
+    assert all(b["t"] - a["t"] >= 0.05 - 1e-9 for a, b in zip(out[:-2], out[1:-1]))
+    assert out[-1]["x"] == 99  # the latest position is restored at the end of the run
+
+
+def test_compress_recording_to_rec(tmp_path):
+    src = tmp_path / "a.json"
+    src.write_text(json.dumps({"events": _moves([(i, 0) for i in range(100)])}), encoding="utf-8")
+    report = compress_recording(str(src), str(tmp_path / "b.rec"), epsilon=0.5)
+    assert report["events_before"] == 100 and report["events_after"] == 2
+    assert [e["x"] for e in iter_events(str(tmp_path / "b.rec"))] == [0, 99]
@@ -0,0 +1,90 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from app import plan
+from app.vision import _preprocess, template_store
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    rng = np.random.default_rng(3)
+    os.makedirs(tmp_path / "resources")
+    for name in ("a.png", "b.png"):
+        cv2.imwrite(str(tmp_path / "resources" / name), (rng.random((30, 40, 3)) * 255).astype(np.uint8))
+    seq = tmp_path / "sequences.json"
+    seq.write_text(json.dumps({"steps": [
+        {"template": "C:\\Users\\x\\resources\\a.png", "action": "click"},
+        {"template": "resources/b.png", "action": "click", "preprocess": "gray", "wait": 2},
+        {"template": "/gone/a.png", "action": "double_click"},
+    ]}), encoding="utf-8")
+    cond = tmp_path / "conditionals.json"
+    cond.write_text(json.dumps({"items": [{"template": "resources/a.png", "priority": 1}]}), encoding="utf-8")
+    yield tmp_path
+    for name in ("sequences.plan", "conditionals.plan"):
+        plan.close_plan(str(tmp_path / name))
+
+
+def test_resolve_template_path(workspace):
+    want = str(workspace / "resources" / "a.png")
+    assert plan.resolve_template_path(want, "/nowhere") == want
+    assert plan.resolve_template_path("C:\\Users\\x\\resources\\a.png", str(workspace)) == want
+    assert plan.resolve_template_path("/gone/a.png", str(workspace)) == want
+    with pytest.raises(FileNotFoundError):
+        plan.resolve_template_path("missing.png", str(workspace))
+
+
+def test_compile_and_load(workspace):
+    path = plan.compile_plan(str(workspace / "sequences.json"))
+    assert plan.is_plan(path) and not plan.is_plan(str(workspace / "sequences.json"))
+    entries = plan.load_entries(path, "sequence")
+    assert [e["action"] for e in entries] == ["click", "click", "double_click"]
+    assert entries[0]["template"] == entries[2]["template"] != entries[1]["template"]
+    assert entries[1]["wait"] == 2 and "template_index" not in entries[1]
+    gray = cv2.imread(str(workspace / "resources" / "b.png"), cv2.IMREAD_GRAYSCALE)
+    assert np.array_equal(template_store.get(entries[1]["template"], "gray"), _preprocess(gray, "gray"))
+    with pytest.raises(ValueError):
+        plan.load_entries(path, "conditionals")
+
+
+def test_staleness(workspace):
+    path = plan.compile_plan(str(workspace / "sequences.json"))
+    p = plan.open_plan(path)
+    assert not p.is_stale()
+    tpl = workspace / "resources" / "b.png"
+    st = os.stat(tpl)
+    os.utime(tpl, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert p.is_stale()
+
+
+def test_open_plan_is_cached_and_released_on_recompile(workspace):
+    src = str(workspace / "sequences.json")
+    path = plan.compile_plan(src)
+    first = plan.open_plan(path)
+    key = first.entries()[0]["template"]
+    assert plan.open_plan(path) is first
+    plan.compile_plan(src)
+    with pytest.raises(ValueError, match="closed"):
+        first.entries()
+    with pytest.raises(ValueError, match="closed"):
+        first.template_array(0)
+    second = plan.open_plan(path)
+    assert second is not first
+    assert second.entries()[0]["template"] == key
+    assert template_store.get(key) is not None
+
+
+def test_detect_kind(workspace, tmp_path):
+    assert plan.detect_kind(str(workspace / "sequences.json")) == "sequence"
+    assert plan.detect_kind(str(workspace / "conditionals.json")) == "conditionals"
+    assert plan.detect_kind(plan.compile_plan(str(workspace / "conditionals.json"))) == "conditionals"
+    rec = tmp_path / "ops.json"
+    rec.write_text(json.dumps({"version": 1, "events": []}), encoding="utf-8")
+    assert plan.detect_kind(str(rec)) == "recording"
+    for text in ("", "{}", "[]", '{"name": "x"}'):
+        rec.write_text(text, encoding="utf-8")
+        with pytest.raises(ValueError):
+            plan.detect_kind(str(rec))
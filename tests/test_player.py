@@ -0,0 +1,19 @@
+import json
+
+from app.player import RecordingBackend, play_recording
+
+
+def test_lateness_is_recorded_for_sent_events_only(tmp_path):
+    events = []
+    for i in range(10):
+        events.append({"type": "move", "x": i, "y": i, "t": i * 0.002})
+        if i % 3 == 0:
+            events.append({"type": "click", "x": i, "y": i, "button": "Button.left", "pressed": True, "t": i * 0.002})
+            events.append({"type": "click", "x": i, "y": i, "button": "Button.left", "pressed": False, "t": i * 0.002})
+    path = tmp_path / "ops.json"
+    path.write_text(json.dumps({"events": events}), encoding="utf-8")
+    backend = RecordingBackend()
+    stats = play_recording(str(path), loop=2, interval=0.0, backend=backend)
+    assert len(backend.calls) == 2 * 14
+    assert stats["events"] == len(backend.calls)
+    assert sum(stats["histogram"].values()) == stats["events"]
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from app.rec_format import (RecordingWriter, binary_to_json, is_binary_recording, iter_binary_events,
+                            iter_json_events, iter_passes, json_to_binary)
+
+EVENTS = [
+    {"type": "move", "x": 10, "y": 20, "t": 0.0},
+    {"type": "click", "x": 10, "y": 20, "button": "Button.left", "pressed": True, "t": 0.125},
+    {"type": "click", "x": 10, "y": 20, "button": "Button.left", "pressed": False, "t": 0.25},
+    {"type": "scroll", "x": 5, "y": 6, "dx": 0, "dy": -3, "t": 0.5},
+    {"type": "key", "action": "press", "key": "Key.shift", "t": 0.75},
+    {"type": "key", "action": "release", "key": "Key.shift", "t": 1.0},
+    {"type": "hotkey", "keys": ["ctrl", "é"], "t": 1.25},
+    {"type": "click", "x": -1, "y": 2, "button": "Button.right", "pressed": False, "t": 1.5},
+]
+
+
+def _write_json(path, events, **extra):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**extra, "events": events}, f, ensure_ascii=False, indent=2)
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 26, 1 << 16])
+def test_binary_round_trip(tmp_path, chunk_size):
+    path = str(tmp_path / "a.rec")
+    with RecordingWriter(path, flush_every=3) as w:
+        for ev in EVENTS:
+            w.write(ev)
+    assert is_binary_recording(path)
+    assert list(iter_binary_events(path, chunk_size=chunk_size)) == EVENTS
+
+
+def test_binary_readable_while_writing(tmp_path):
+    path = str(tmp_path / "a.rec")
+    w = RecordingWriter(path, flush_every=1000)
+    for ev in EVENTS[:3]:
+        w.write(ev)
+    w.flush()
+    assert list(iter_binary_events(path)) == EVENTS[:3]
+    w.close()
+
+
+def test_unknown_event_type_is_rejected(tmp_path):
+    with RecordingWriter(str(tmp_path / "a.rec")) as w:
+        with pytest.raises(ValueError):
+            w.write({"type": "teleport", "t": 0.0})
+
+
+def test_json_binary_conversion(tmp_path):
+    src = _write_json(tmp_path / "a.json", EVENTS)
+    rec = json_to_binary(src)
+    back = binary_to_json(rec, str(tmp_path / "b.json"))
+    with open(back, encoding="utf-8") as f:
+        assert json.load(f) == {"events": EVENTS}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64, 1 << 16])
+def test_json_stream_chunk_boundaries(tmp_path, chunk_size):
+    # numbers, strings and nested values split across every chunk boundary
+    events = EVENTS + [{"type": "move", "x": 123456, "y": 7, "t": 0.123456789}]
+    path = _write_json(tmp_path / "a.json", events, version=2, meta={"n": [1, 2.5, {"k": "v"}]})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("\n")
+    assert list(iter_json_events(path, chunk_size=chunk_size)) == events
+
+
+def test_json_stream_other_keys_and_empty(tmp_path):
+    path = tmp_path / "a.json"
+    path.write_text('{"events": [], "after": 1.5}', encoding="utf-8")
+    assert list(iter_json_events(str(path), chunk_size=4)) == []
+    path.write_text('{"name": "x"}', encoding="utf-8")
+    assert list(iter_json_events(str(path))) == []
+    path.write_text('[1, 2]', encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(iter_json_events(str(path)))
+
+
+@pytest.mark.parametrize("events", [
+    EVENTS,
+    # fractional coordinates and extra fields do not survive the .rec spool
+    [{"type": "move", "x": 1.5, "y": 2.25, "t": 0.0}, {"type": "move", "x": 3, "y": 4, "t": 0.1, "note": "x"}],
+    [{"type": "move", "x": 1, "y": 2, "t": 0.0}, {"type": "wait", "t": 0.1}],
+])
+def test_passes_replay_the_same_events(tmp_path, events):
+    path = _write_json(tmp_path / "a.json", events)
+    passes = [list(p) for p in iter_passes(path, 3)]
+    assert passes == [events] * 3
+
+
+def test_passes_of_binary_recording(tmp_path):
+    rec = json_to_binary(_write_json(tmp_path / "a.json", EVENTS))
+    assert [list(p) for p in iter_passes(rec, 2)] == [EVENTS] * 2
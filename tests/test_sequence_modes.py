@@ -0,0 +1,28 @@
+import pytest
+
+from app.sequence_modes import _nth_mode, _pick, _retries
+
+MATCHES = [{"bbox": (i, 0, 5, 5)} for i in range(4)]
+
+
+@pytest.mark.parametrize("value, want", [(None, None), ("", None), (0, 0), ("2", 2), (-1, -1), ("ALL", "all")])
+def test_nth_mode(value, want):
+    assert _nth_mode(value) == want
+
+
+@pytest.mark.parametrize("value", [True, 1.5, "first"])
+def test_nth_mode_rejects(value):
+    with pytest.raises(ValueError):
+        _nth_mode(value)
+
+
+def test_pick():
+    assert _pick(MATCHES, "all") == MATCHES
+    assert _pick(MATCHES, 1) == [MATCHES[1]]
+    assert _pick(MATCHES, -1) == [MATCHES[3]]
+    assert _pick(MATCHES, 4) == [] and _pick(MATCHES, -5) == []
+
+
+def test_retries_from_json_strings():
+    assert _retries("3") == 3 and _retries(2) == 2
+    assert _retries(None) is None and _retries("") is None
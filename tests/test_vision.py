@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.vision import Frame, match_all, match_template
+
+
+@pytest.fixture
+def scene(tmp_path):
+    rng = np.random.default_rng(0)
+    screen = (rng.random((300, 400, 3)) * 255).astype(np.uint8)
+    path = str(tmp_path / "tpl.png")
+    cv2.imwrite(path, screen[50:110, 60:140])
+    return Frame(screen, (0, 0)), path
+
+
+@pytest.mark.parametrize("multi_scale", [False, True, "pyramid"])
+def test_finds_template(scene, multi_scale):
+    frame, path = scene
+    found = match_template(frame, path, multi_scale=multi_scale)
+    assert found is not None and found["bbox"][:2] == (60, 50)
+    assert [m["bbox"][:2] for m in match_all(frame, path, multi_scale=multi_scale)] == [(60, 50)]
+
+
+@pytest.mark.parametrize("multi_scale", [False, True, "pyramid"])
+@pytest.mark.parametrize("region", [[10, 10, 1, 1], [1000, 1000, 50, 50], [0, 0, 30, 30]])
+def test_window_smaller_than_template_or_outside_frame(scene, multi_scale, region):
+    frame, path = scene
+    assert match_template(frame, path, multi_scale=multi_scale, search_region=region) is None
+    assert match_all(frame, path, multi_scale=multi_scale, search_region=region) == []
+
+
+@pytest.fixture
+def icons(tmp_path):
+    rng = np.random.default_rng(5)
+    icon = (rng.random((24, 24, 3)) * 255).astype(np.uint8)
+    screen = np.full((200, 300, 3), 40, np.uint8)
+    spots = [(200, 20), (20, 22), (110, 18), (60, 120), (230, 125)]  # (x, y), two rows
+    for x, y in spots:
+        screen[y:y + 24, x:x + 24] = icon
+    path = str(tmp_path / "icon.png")
+    cv2.imwrite(path, icon)
+    return Frame(screen, (1000, 500)), path
+
+
+def test_match_all_reading_order_and_nms(icons):
+    frame, path = icons
+    found = match_all(frame, path)
+    assert [m["bbox"][:2] for m in found] == [(1020, 522), (1110, 518), (1200, 520), (1060, 620), (1230, 625)]
+    assert all(m["bbox"][2:] == (24, 24) and m["score"] >= 0.85 for m in found)
+    by_score = match_all(frame, path, order="score", max_results=2)
+    assert len(by_score) == 2 and by_score[0]["score"] >= by_score[1]["score"]
+    with pytest.raises(ValueError):
+        match_all(frame, path, order="random")
+
+
+def test_match_all_in_search_region(icons):
+    frame, path = icons
+    found = match_all(frame, path, search_region=[1000, 600, 300, 100])
+    assert [m["center"] for m in found] == [(1072, 632), (1242, 637)]